@@ -0,0 +1,145 @@
+import datetime
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import numpy as np
+
+from app.log import log
+
+DAY = 86400
+WEEK = 7 * DAY
+# 1970-01-05 was the first Monday after the epoch
+FIRST_MONDAY = 4 * DAY
+
+
+@lru_cache(maxsize=None)
+def get_zone(timezone_str, default_timezone_str):
+    """
+    Resolves a time zone name, falling back to the default zone for unknown names.
+    """
+    try:
+        return ZoneInfo(timezone_str or default_timezone_str)
+    except (ZoneInfoNotFoundError, ValueError):
+        log.warning("Unknown time zone %r, using %s", timezone_str, default_timezone_str)
+        return ZoneInfo(default_timezone_str)
+
+
+class BusinessCalendar:
+    """
+    Converts the weekly local business hours of stores into UTC interval tables.
+
+    Each table covers one UTC week (Monday 00:00 to Monday 00:00) and accounts for the store's time
+    zone, including DST transitions, and for shifts running past local midnight. Stores without
+    business hours are open 24x7 and stores without a time zone use the default zone.
+
+    Tables are cached in an LRU keyed by the time zone, the weekly schedule and the week. Successive
+    reports, and stores sharing the same hours and zone, reuse the same tables instead of deriving
+    them again.
+
+    Attributes:
+        CACHE_SIZE (int): Maximum number of cached weekly interval tables.
+    """
+
+    CACHE_SIZE = 16384
+
+    def __init__(self, default_timezone_str):
+        """
+        Args:
+            default_timezone_str (str): The zone of stores without a (valid) time zone.
+        """
+        self.default_timezone_str = default_timezone_str
+
+    @staticmethod
+    def week_start(epoch_seconds):
+        """
+        Returns the start of the UTC week (Monday 00:00) containing a timestamp, in epoch seconds.
+        """
+        return (epoch_seconds - FIRST_MONDAY) // WEEK * WEEK + FIRST_MONDAY
+
+    @staticmethod
+    @lru_cache(maxsize=CACHE_SIZE)
+    def _week_intervals(timezone_str, default_timezone_str, schedule, week_start):
+        """
+        Computes the UTC business intervals of a weekly schedule within one UTC week.
+
+        Args:
+            timezone_str (str): The store's time zone, or None.
+            default_timezone_str (str): The zone used when timezone_str is missing or unknown.
+            schedule (tuple): Sorted (day, start seconds, end seconds) local shifts; empty for 24x7.
+            week_start (int): Epoch seconds of the UTC Monday starting the week.
+
+        Returns:
+            tuple: Read-only arrays of interval starts and ends, in epoch seconds.
+        """
+        week_end = week_start + WEEK
+        if not schedule:
+            starts, ends = np.array([week_start], dtype=np.int64), np.array([week_end], dtype=np.int64)
+        else:
+            zone = get_zone(timezone_str, default_timezone_str)
+            starts, ends = [], []
+            # Local dates from the day before to the day after the week cover every UTC offset
+            first_date = datetime.date(1970, 1, 1) + datetime.timedelta(seconds=week_start - DAY)
+            for offset in range(9):
+                date = first_date + datetime.timedelta(days=offset)
+                local_midnight = datetime.datetime(date.year, date.month, date.day, tzinfo=zone)
+                for day, start_seconds, end_seconds in schedule:
+                    if day != date.weekday():
+                        continue
+                    if end_seconds <= start_seconds:
+                        # The shift runs past local midnight
+                        end_seconds += DAY
+                    start = local_midnight + datetime.timedelta(seconds=start_seconds)
+                    end = local_midnight + datetime.timedelta(seconds=end_seconds)
+                    starts.append(int(start.timestamp()))
+                    ends.append(int(end.timestamp()))
+            starts = np.clip(np.array(starts, dtype=np.int64), week_start, week_end)
+            ends = np.clip(np.array(ends, dtype=np.int64), week_start, week_end)
+            keep = ends > starts
+            starts, ends = starts[keep], ends[keep]
+
+        starts.setflags(write=False)
+        ends.setflags(write=False)
+        return starts, ends
+
+    def week_intervals(self, timezone_str, schedule, week_start):
+        """
+        Returns the cached UTC business intervals of a weekly schedule within one UTC week.
+
+        Args:
+            timezone_str (str): The store's time zone, or None for the default zone.
+            schedule (tuple): Sorted (day, start seconds, end seconds) local shifts; empty for 24x7.
+            week_start (int): Epoch seconds of the UTC Monday starting the week.
+
+        Returns:
+            tuple: Read-only arrays of interval starts and ends, in epoch seconds.
+        """
+        return BusinessCalendar._week_intervals(timezone_str, self.default_timezone_str, schedule, week_start)
+
+    def intervals(self, timezone_str, schedule, start, end):
+        """
+        Returns the UTC business intervals of a weekly schedule between two timestamps.
+
+        Args:
+            timezone_str (str): The store's time zone, or None for the default zone.
+            schedule (tuple): Sorted (day, start seconds, end seconds) local shifts; empty for 24x7.
+            start (int): Epoch seconds of the range start.
+            end (int): Epoch seconds of the range end.
+
+        Returns:
+            tuple: Arrays of interval starts and ends, in epoch seconds, clipped to the range.
+        """
+        tables = [self.week_intervals(timezone_str, schedule, week_start)
+                  for week_start in range(BusinessCalendar.week_start(start), end, WEEK)]
+        if not tables:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        starts = np.clip(np.concatenate([table[0] for table in tables]), start, end)
+        ends = np.clip(np.concatenate([table[1] for table in tables]), start, end)
+        keep = ends > starts
+        return starts[keep], ends[keep]
+
+    @staticmethod
+    def cache_info():
+        """
+        Returns the hit/miss statistics of the interval table cache.
+        """
+        return BusinessCalendar._week_intervals.cache_info()
@@ -0,0 +1,94 @@
+from flask_restful import Resource
+from sqlalchemy import inspect, text
+
+from app import app, db
+from app.log import log
+from app.models import ReportTask
+
+# Seconds a readiness check waits for the broker
+BROKER_TIMEOUT = 1
+
+
+def check_database():
+    """
+    Checks that the database answers and that its schema has been created.
+
+    Raises:
+        Exception: If the database cannot be queried or the report tables are missing.
+    """
+    db.session.execute(text("SELECT 1"))
+    if not inspect(db.engine).has_table(ReportTask.__table__.name):
+        raise RuntimeError("The schema has not been created")
+
+
+def check_broker():
+    """
+    Checks that the Redis broker of the Celery executor answers.
+
+    Raises:
+        Exception: If the broker cannot be reached.
+    """
+    import redis
+
+    client = redis.Redis.from_url(app.config['CELERY_BROKER_URL'], socket_connect_timeout=BROKER_TIMEOUT,
+                                  socket_timeout=BROKER_TIMEOUT)
+    try:
+        client.ping()
+    finally:
+        client.close()
+
+
+class HealthResource(Resource):
+    """
+    RESTful resource class answering whether the API process is alive, for liveness probes.
+
+    Attributes:
+        None
+    """
+
+    def get(self):
+        """
+        Handles the GET request for the liveness of the process. No dependency is checked, so a
+        database outage does not get the workers restarted.
+
+        Returns:
+            dict: {"status": "ok"}.
+        """
+        return {"status": "ok"}
+
+
+class ReadinessResource(Resource):
+    """
+    RESTful resource class answering whether the API can serve requests, for readiness probes and
+    load balancers.
+
+    Attributes:
+        None
+    """
+
+    def get(self):
+        """
+        Handles the GET request for the readiness of the API: the database must answer with its schema
+        in place and, with the Celery executor on a Redis broker, the broker must answer too.
+
+        Returns:
+            dict: {"status": "ready", "checks": {<check>: "ok"}}.
+                  If a check fails, returns {"status": "not ready", "checks": {<check>: <error>}}
+                  with a 503 status code.
+        """
+        checks = {"database": check_database}
+        if app.config['REPORT_EXECUTOR'] == 'celery' and app.config['CELERY_BROKER_URL'].startswith("redis"):
+            checks["broker"] = check_broker
+
+        results = {}
+        for name, check in checks.items():
+            try:
+                check()
+                results[name] = "ok"
+            except Exception as e:
+                log.warning("Readiness check %s failed: %s", name, str(e))
+                results[name] = str(e)
+
+        if any(result != "ok" for result in results.values()):
+            return {"status": "not ready", "checks": results}, 503
+        return {"status": "ready", "checks": results}
@@ -0,0 +1,268 @@
+import datetime
+
+import numpy as np
+from sqlalchemy import and_, func, select
+
+from app import app
+from app import db
+from app import ReportMetrics
+from app.UptimeEngine import EPOCH, UptimeEngine, to_epoch
+from app.log import log
+from app.models import StoreHourlyUptime, StoreStatus, TimeZone
+
+HOUR = datetime.timedelta(hours=1)
+
+
+def floor_hour(timestamp):
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def ceil_hour(timestamp):
+    floored = floor_hour(timestamp)
+    return floored if floored == timestamp else floored + HOUR
+
+
+class HourlyRollup:
+    """
+    Maintains the StoreHourlyUptime rollup and computes reports from it.
+
+    The rollup holds, per store and UTC hour, the business seconds and the active business seconds
+    derived by the UptimeEngine. Ingestion refreshes the hours touched by new polls, so a report only
+    needs the raw polls of its last hour and sums at most 168 rollup rows per store for the day and
+    week windows.
+
+    Attributes:
+        RETENTION (datetime.timedelta): How far back a full rebuild reaches from the latest poll.
+    """
+
+    RETENTION = max(UptimeEngine.REPORT_WINDOWS) + HOUR
+
+    @staticmethod
+    def is_current(current_timestamp):
+        """
+        Tells whether no poll after a report's timestamp has been ingested. The rolled-up hours account
+        for every ingested poll, while a report only sees the polls up to its timestamp.
+
+        Args:
+            current_timestamp (datetime.datetime): The current timestamp of the report.
+
+        Returns:
+            bool: True when the latest ingested poll is not after the current timestamp.
+        """
+        latest = db.session.query(func.max(StoreStatus.timestamp)).scalar()
+        return latest is None or latest <= current_timestamp
+
+    @staticmethod
+    def is_available(current_timestamp):
+        """
+        Tells whether the rollup can serve a report: it must reach back far enough and hold no poll
+        after the report's timestamp.
+
+        Args:
+            current_timestamp (datetime.datetime): The current timestamp of the report.
+
+        Returns:
+            bool: True when the rollup holds the hour the week window starts in and is current.
+        """
+        first_hour = db.session.query(func.min(StoreHourlyUptime.hour)).scalar()
+        return first_hour is not None and \
+            first_hour <= floor_hour(current_timestamp - max(UptimeEngine.REPORT_WINDOWS)) and \
+            HourlyRollup.is_current(current_timestamp)
+
+    @staticmethod
+    def refresh(start, end, store_ids=None):
+        """
+        Recomputes the rollup hours overlapping a time range.
+
+        Args:
+            start (datetime.datetime): The start of the range (naive UTC).
+            end (datetime.datetime): The end of the range, usually the latest ingested poll.
+            store_ids (list of int): The stores to refresh. Defaults to every store.
+
+        Returns:
+            int: The number of rollup rows written.
+        """
+        from app.ReportUtils import ReportUtils
+
+        first_hour, last_hour = floor_hour(start), ceil_hour(end)
+        if store_ids is None:
+            store_ids = db.session.execute(select(TimeZone.store_id).distinct()).scalars().all()
+
+        hour_starts = np.arange(to_epoch(first_hour), to_epoch(last_hour), 3600, dtype=np.int64)[None, :]
+        hours = [first_hour + i * HOUR for i in range(hour_starts.shape[1])]
+        log.info("Refreshing hourly uptime rollup of %d stores from %s to %s", len(store_ids), first_hour, last_hour)
+
+        written = 0
+        table = StoreHourlyUptime.__table__
+        for chunk in ReportUtils.chunk_store_ids(store_ids, app.config['REPORT_CHUNK_SIZE']):
+            engine = UptimeEngine(last_hour, chunk, lookback=last_hour - first_hour).load()
+            business, uptime = engine.compute_windows(hour_starts, hour_starts + 3600)
+            store_index, hour_index = np.nonzero(business)
+            rows = [
+                {'store_id': int(engine.store_ids[s]), 'hour': hours[h],
+                 'business_seconds': int(business[s, h]), 'up_seconds': int(uptime[s, h])}
+                for s, h in zip(store_index.tolist(), hour_index.tolist())
+            ]
+
+            db.session.execute(table.delete().where(
+                table.c.store_id.in_(chunk), table.c.hour >= first_hour, table.c.hour < last_hour))
+            if rows:
+                db.session.execute(table.insert(), rows)
+            db.session.commit()
+            written += len(rows)
+
+        log.info("Wrote %d hourly uptime rollup rows", written)
+        return written
+
+    @staticmethod
+    def refresh_appended(last_id, previous_timestamp, latest_timestamp):
+        """
+        Refreshes the rollup after polls were appended to StoreStatus.
+
+        The status of every store's last poll now extends up to the new latest poll, so every store's
+        hours from the previous latest poll on are recomputed. A new poll changes the status from
+        halfway to the store's previous poll, so the hours of a store with new polls are recomputed
+        from there, and over the whole retention period for a store polled for the first time.
+
+        Args:
+            last_id (int): The ID of the last StoreStatus row before the append.
+            previous_timestamp (datetime.datetime): The latest poll before the append.
+            latest_timestamp (datetime.datetime): The latest poll after the append.
+
+        Returns:
+            int: The number of rollup rows written.
+        """
+        firsts = select(StoreStatus.store_id, func.min(StoreStatus.timestamp).label("first")).where(
+            StoreStatus.id > last_id).group_by(StoreStatus.store_id).subquery()
+        rows = db.session.execute(
+            select(firsts.c.store_id, firsts.c.first, func.max(StoreStatus.timestamp))
+            .outerjoin(StoreStatus, and_(StoreStatus.store_id == firsts.c.store_id, StoreStatus.id <= last_id,
+                                         StoreStatus.timestamp < firsts.c.first))
+            .group_by(firsts.c.store_id, firsts.c.first)).all()
+
+        written = HourlyRollup.refresh(previous_timestamp, latest_timestamp)
+        polled = [(store_id, before + (first - before) / 2) for store_id, first, before in rows if before is not None]
+        earliest = max(min((since for _, since in polled), default=previous_timestamp),
+                       latest_timestamp - HourlyRollup.RETENTION)
+        if earliest < previous_timestamp:
+            written += HourlyRollup.refresh(earliest, latest_timestamp, [store_id for store_id, _ in polled])
+        new_stores = [store_id for store_id, _, before in rows if before is None]
+        if new_stores:
+            written += HourlyRollup.rebuild(latest_timestamp, new_stores)
+        return written
+
+    @staticmethod
+    def rebuild(latest_timestamp, store_ids=None):
+        """
+        Rebuilds the rollup over the retention period ending at the latest poll.
+
+        Args:
+            latest_timestamp (datetime.datetime): The latest ingested poll timestamp.
+            store_ids (list of int): The stores to rebuild. Defaults to every store.
+
+        Returns:
+            int: The number of rollup rows written.
+        """
+        return HourlyRollup.refresh(latest_timestamp - HourlyRollup.RETENTION, latest_timestamp, store_ids)
+
+    @staticmethod
+    def coverage_end():
+        """
+        Returns the end of the last hour held by the rollup, or None when it is empty.
+        """
+        last_hour = db.session.query(func.max(StoreHourlyUptime.hour)).scalar()
+        return last_hour + HOUR if last_hour is not None else None
+
+    @staticmethod
+    def report_rows(report_id, current_timestamp, store_ids):
+        """
+        Computes report entries from the rollup plus the most recent raw polls.
+
+        Whole hours of the day and week windows are summed from the rollup. The last-hour window, the
+        time after the last rolled-up hour and the partial hour at the start of a window come from the
+        raw polls around them. A report ending before the latest ingested poll is computed from raw polls
+        only, since the rolled-up hours already account for the later polls.
+
+        Args:
+            report_id (str): The ID of the report.
+            current_timestamp (datetime.datetime): The current timestamp.
+            store_ids (list of int): The stores to report on.
+
+        Returns:
+            list of dict: One ReportEntry column mapping per store.
+        """
+        if not HourlyRollup.is_current(current_timestamp):
+            return UptimeEngine(current_timestamp, store_ids).load().report_rows(report_id)
+
+        horizon = to_epoch(current_timestamp)
+        window_starts = [horizon - int(window.total_seconds()) for window in UptimeEngine.REPORT_WINDOWS]
+        coverage_end = HourlyRollup.coverage_end() or current_timestamp
+        covered_until = min(to_epoch(coverage_end), to_epoch(floor_hour(current_timestamp)))
+
+        # The last-hour window is computed from raw polls only, the others from the rollup up to
+        # covered_until and from raw polls after it
+        raw_starts = [window_starts[0]] + [max(start, covered_until) for start in window_starts[1:]]
+        raw_lookback = datetime.timedelta(seconds=horizon - min(raw_starts))
+        engine = UptimeEngine(current_timestamp, store_ids, lookback=raw_lookback).load()
+        raw_business, raw_uptime = engine.compute_windows(np.array([raw_starts]), np.full((1, 3), horizon))
+
+        table = StoreHourlyUptime.__table__
+        query = select(table.c.store_id, table.c.hour, table.c.business_seconds, table.c.up_seconds).where(
+            table.c.hour >= floor_hour(current_timestamp - max(UptimeEngine.REPORT_WINDOWS)),
+            table.c.hour < EPOCH + datetime.timedelta(seconds=covered_until))
+        if len(engine.store_ids) <= UptimeEngine.MAX_IN_CLAUSE:
+            query = query.where(table.c.store_id.in_(engine.store_ids.tolist()))
+        with ReportMetrics.stage("load"):
+            rows = db.session.execute(query).all()
+
+        n_stores = len(engine.store_ids)
+        window_business, window_uptime = raw_business.astype(np.float64), raw_uptime.astype(np.float64)
+        for w, start in enumerate(window_starts[1:], start=1):
+            first_full_hour = -(-start // 3600) * 3600
+            if start >= covered_until or first_full_hour == start:
+                continue
+            # The first polls after the partial hour, up to the current timestamp, end its last status
+            leading = UptimeEngine(EPOCH + datetime.timedelta(seconds=first_full_hour), engine.store_ids,
+                                   lookback=datetime.timedelta(seconds=first_full_hour - start),
+                                   lookahead=datetime.timedelta(seconds=horizon - first_full_hour))
+            leading.load(engine.schedules)
+            business, uptime = leading.compute_windows(np.array([[start]]), np.array([[first_full_hour]]))
+            window_business[:, w] += business[:, 0]
+            window_uptime[:, w] += uptime[:, 0]
+
+        if rows:
+            raw_store_ids, hours, business, up = zip(*rows)
+            store_index, mask = engine.index_stores(np.asarray(raw_store_ids, dtype=np.int64))
+            hours = np.asarray(hours, dtype='datetime64[s]').astype(np.int64)[mask]
+            business = np.asarray(business, dtype=np.float64)[mask]
+            up = np.asarray(up, dtype=np.float64)[mask]
+            store_index = store_index[mask]
+        else:
+            store_index = hours = np.empty(0, dtype=np.int64)
+            business = up = np.empty(0, dtype=np.float64)
+
+        for w, start in enumerate(window_starts[1:], start=1):
+            # Only the whole hours of the window
+            weight = np.where(hours >= -(-start // 3600) * 3600, 1.0, 0.0)
+            window_business[:, w] += np.bincount(store_index, weights=business * weight, minlength=n_stores)
+            window_uptime[:, w] += np.bincount(store_index, weights=up * weight, minlength=n_stores)
+
+        uptime = window_uptime / 3600
+        downtime = (window_business - window_uptime) / 3600
+        return [UptimeEngine.make_row(report_id, store_id, uptime[i], downtime[i])
+                for i, store_id in enumerate(engine.store_ids)]
+
+
+def main():
+    with app.app_context():
+        latest = db.session.query(func.max(StoreStatus.timestamp)).scalar()
+        if latest is None:
+            log.info("No status polls ingested, nothing to roll up")
+            return
+        db.session.execute(StoreHourlyUptime.__table__.delete())
+        db.session.commit()
+        HourlyRollup.rebuild(latest)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+from app import app
+from app import db
+from app.log import log
+from app.models import ReportEntry
+
+
+class ReportEntrySink:
+    """
+    Buffers report entries and writes them with bulk inserts, committing once.
+
+    Entries are flushed as one executemany INSERT per REPORT_INSERT_BATCH_SIZE entries, all within a
+    single transaction committed when the sink is closed. Used as a context manager, the sink rolls
+    the transaction back if the block raises, so a chunk's entries are stored entirely or not at all.
+
+    Attributes:
+        batch_size (int): The number of entries per INSERT statement.
+        written (int): The number of entries flushed so far.
+    """
+
+    def __init__(self, batch_size=None):
+        """
+        Args:
+            batch_size (int): The number of entries per INSERT statement. Defaults to the
+                REPORT_INSERT_BATCH_SIZE config value.
+        """
+        self.batch_size = batch_size or app.config['REPORT_INSERT_BATCH_SIZE']
+        self.written = 0
+        self._buffer = []
+
+    def add(self, row):
+        """
+        Buffers a report entry, flushing the buffer once it holds a full batch.
+
+        Args:
+            row (dict): The ReportEntry column mapping.
+        """
+        self._buffer.append(row)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def extend(self, rows):
+        """
+        Buffers report entries, flushing every full batch.
+
+        Args:
+            rows (list of dict): The ReportEntry column mappings.
+        """
+        for row in rows:
+            self.add(row)
+
+    def flush(self):
+        """
+        Inserts the buffered entries, without committing.
+        """
+        if not self._buffer:
+            return
+        db.session.execute(ReportEntry.__table__.insert(), self._buffer)
+        self.written += len(self._buffer)
+        log.debug("Flushed %d report entries", len(self._buffer))
+        self._buffer = []
+
+    def close(self):
+        """
+        Flushes the remaining entries and commits the transaction.
+
+        Returns:
+            int: The number of entries written.
+        """
+        self.flush()
+        db.session.commit()
+        return self.written
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self._buffer = []
+            db.session.rollback()
+            return False
+        self.close()
+        return False
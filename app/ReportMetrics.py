@@ -0,0 +1,166 @@
+import contextvars
+import cProfile
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import app
+from app.log import log
+
+# The collector of the report chunk running in the current thread or task, if any
+_current = contextvars.ContextVar('report_metrics', default=None)
+
+STAGES = ("load", "compute", "persist")
+
+
+class ReportMetrics:
+    """
+    Collects the timings, query count and row counts of a report chunk.
+
+    Stage timers are exclusive: time spent in a nested stage (e.g. 'load' within 'compute') is only
+    counted for the nested stage, so the stage durations add up to the chunk's wall time.
+
+    Attributes:
+        seconds (dict): Exclusive duration of each stage, in seconds.
+        rows (dict): Number of rows processed, by kind (e.g. 'polls', 'entries').
+        queries (int): Number of SQL statements executed.
+    """
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.rows = defaultdict(int)
+        self.queries = 0
+        self._stack = []
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Times a stage of the chunk.
+
+        Args:
+            name (str): The name of the stage.
+        """
+        started = time.perf_counter()
+        self._stack.append(0.0)
+        try:
+            yield
+        finally:
+            nested = self._stack.pop()
+            elapsed = time.perf_counter() - started
+            self.seconds[name] += elapsed - nested
+            if self._stack:
+                self._stack[-1] += elapsed
+
+    @staticmethod
+    @contextmanager
+    def collect():
+        """
+        Makes a new collector current for the duration of the block.
+
+        Yields:
+            ReportMetrics: The collector.
+        """
+        metrics = ReportMetrics()
+        token = _current.set(metrics)
+        try:
+            yield metrics
+        finally:
+            _current.reset(token)
+
+
+def stage(name):
+    """
+    Times a stage against the current collector, if there is one.
+
+    Args:
+        name (str): The name of the stage.
+
+    Returns:
+        A context manager.
+    """
+    metrics = _current.get()
+    return metrics.stage(name) if metrics is not None else nullcontext()
+
+
+def count_rows(kind, count):
+    """
+    Adds processed rows to the current collector, if there is one.
+
+    Args:
+        kind (str): The kind of rows (e.g. 'polls').
+        count (int): The number of rows.
+    """
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.rows[kind] += count
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.queries += 1
+
+
+@contextmanager
+def profile(report_id, name):
+    """
+    Profiles the block with cProfile and writes the profile under REPORTS_DIR/profiles.
+
+    Args:
+        report_id (str): The ID of the report.
+        name (str): Distinguishes the profiles of the chunks of a report.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profile_dir = os.path.join(app.config['REPORTS_DIR'], 'profiles')
+        os.makedirs(profile_dir, exist_ok=True)
+        path = os.path.join(profile_dir, f"report_{report_id}_{name}.prof")
+        profiler.dump_stats(path)
+        log.info("Wrote profile %s", path)
+
+
+def summarize(chunks):
+    """
+    Aggregates the metrics of the chunks of a report.
+
+    Args:
+        chunks (list of ReportChunkMetrics): The chunk metrics.
+
+    Returns:
+        dict: Stage totals, percentiles over the chunks of their time per store, query and row counts.
+    """
+    stores = sum(chunk.stores for chunk in chunks)
+    # Stores of a chunk are computed together, so there is no time per store, only each chunk's time
+    # divided by its number of stores
+    per_chunk_ms_per_store = [chunk.seconds * 1000 / chunk.stores for chunk in chunks if chunk.stores]
+    return {
+        "chunks": len(chunks),
+        "stores": stores,
+        "stages": {
+            "load": round(sum(chunk.load_seconds for chunk in chunks), 4),
+            "compute": round(sum(chunk.compute_seconds for chunk in chunks), 4),
+            "persist": round(sum(chunk.persist_seconds for chunk in chunks), 4),
+        },
+        "chunk_seconds": round(sum(chunk.seconds for chunk in chunks), 4),
+        "per_chunk_ms_per_store": {
+            "p50": round(float(np.percentile(per_chunk_ms_per_store, 50)), 4),
+            "p95": round(float(np.percentile(per_chunk_ms_per_store, 95)), 4),
+            "p99": round(float(np.percentile(per_chunk_ms_per_store, 99)), 4),
+            "max": round(max(per_chunk_ms_per_store), 4),
+        } if per_chunk_ms_per_store else None,
+        "queries": sum(chunk.queries for chunk in chunks),
+        "rows": {
+            "polls": sum(chunk.polls for chunk in chunks),
+            "entries": sum(chunk.entries for chunk in chunks),
+        },
+    }
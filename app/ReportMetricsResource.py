@@ -0,0 +1,49 @@
+import json
+
+from flask_restful import Resource
+
+from app import ReportUtils
+from app.log import log
+from app.models import ReportTask
+
+
+class ReportMetricsResource(Resource):
+    """
+    RESTful resource class returning the instrumentation of a report.
+
+    Attributes:
+        None
+    """
+
+    def get(self, report_id):
+        """
+        Handles the GET request for the metrics of a report.
+
+        Args:
+            report_id (str): The ID of the report.
+
+        Returns:
+            dict: The report status and its metrics: time per stage (load, compute, persist, export),
+                  per_chunk_ms_per_store (percentiles over the chunks of each chunk's time divided by its
+                  number of stores, not of the time of individual stores, which are computed together),
+                  query and row counts. While the report is running, the metrics cover the chunks
+                  completed so far.
+                  If the report does not exist, returns {"error": "Report not found"} with a 404 status code.
+                  If an error occurs, returns {"error": "An error occurred"} with a 500 status code.
+        """
+        try:
+            log.info("Received metrics request for report_id: %s", report_id)
+
+            report_task = ReportTask.query.filter_by(report_id=report_id).first()
+            if report_task is None:
+                return {"error": "Report not found"}, 404
+
+            if report_task.metrics is not None:
+                metrics = json.loads(report_task.metrics)
+            else:
+                metrics = ReportUtils.ReportUtils.report_metrics(report_id)
+            return {"report_id": report_id, "status": report_task.status,
+                    "profiled": bool(report_task.profile), "metrics": metrics}
+        except Exception as e:
+            log.error("An error occurred while processing metrics request: %s", str(e))
+            return {"error": "An error occurred"}, 500
@@ -0,0 +1,108 @@
+import json
+import time
+
+from flask import Response, request, stream_with_context
+from flask_restful import Resource
+
+from app import ReportUtils
+from app import db
+from app.events import FINAL_STATUSES, get_event_bus
+from app.log import log
+
+# Longest a long-poll request may wait for a change, in seconds
+MAX_WAIT = 60
+# Seconds between keep-alive comments (and status re-checks) on an idle event stream
+KEEPALIVE = 15
+
+
+def current_progress(report_id):
+    """
+    Reads the progress of a report, then releases the session's connection while the caller waits.
+    """
+    progress = ReportUtils.ReportUtils.get_report_progress(report_id)
+    db.session.close()
+    return progress
+
+
+def progress_events(report_id, progress):
+    """
+    Streams the progress of a report as Server-Sent Events until it completes or fails.
+
+    The current progress is sent first. While no event arrives, a keep-alive comment is sent and
+    the status re-checked, so a missed event only delays the stream.
+
+    Args:
+        report_id (str): The ID of the report.
+        progress (dict): The progress of the report when the stream was opened.
+
+    Yields:
+        str: The event stream.
+    """
+    with get_event_bus().subscribe(report_id) as next_event:
+        # Read again once subscribed, so no event published in between is lost
+        progress = current_progress(report_id) or progress
+        yield f"event: progress\ndata: {json.dumps(progress)}\n\n"
+        while progress["status"] not in FINAL_STATUSES:
+            event = next_event(KEEPALIVE)
+            if event is None:
+                yield ": keep-alive\n\n"
+                event = current_progress(report_id)
+            if event is None or event == progress:
+                continue
+            progress = event
+            yield f"event: progress\ndata: {json.dumps(progress)}\n\n"
+
+
+class ReportProgressResource(Resource):
+    """
+    RESTful resource class pushing report progress to clients, instead of having them poll
+    /get_report.
+
+    Attributes:
+        None
+    """
+
+    def get(self, report_id):
+        """
+        Handles the GET request for the progress of a report.
+
+        Clients accepting `text/event-stream` get a Server-Sent Events stream of progress events that
+        ends when the report completes or fails. Other clients long-poll: the response is held until
+        the progress differs from the `since` query parameter (the stores processed the client already
+        knows of), the report completes or fails, or `wait` seconds (default 30, at most 60) pass.
+
+        Args:
+            report_id (str): The ID of the report.
+
+        Returns:
+            dict: The progress of the report, {"report_id", "status", "stores_processed", "stores_total"}
+                  plus "error" for a failed report; or an event stream of such progress events.
+                  If the report does not exist, returns {"error": "Report not found"} with a 404 status code.
+                  If an error occurs, returns {"error": "An error occurred"} with a 500 status code.
+        """
+        try:
+            log.info("Received progress request for report_id: %s", report_id)
+
+            progress = ReportUtils.ReportUtils.get_report_progress(report_id)
+            if progress is None:
+                return {"error": "Report not found"}, 404
+
+            if "text/event-stream" in request.accept_mimetypes.values():
+                return Response(stream_with_context(progress_events(report_id, progress)),
+                                mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+            since = request.args.get("since", type=int)
+            wait = min(request.args.get("wait", 30, type=float), MAX_WAIT)
+            deadline = time.monotonic() + wait
+            with get_event_bus().subscribe(report_id) as next_event:
+                progress = current_progress(report_id)
+                while progress["status"] not in FINAL_STATUSES and progress["stores_processed"] == since:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    event = next_event(min(remaining, KEEPALIVE))
+                    progress = event or current_progress(report_id)
+            return progress
+        except Exception as e:
+            log.error("An error occurred while processing progress request: %s", str(e))
+            return {"error": "An error occurred"}, 500
@@ -1,10 +1,54 @@
 import os
 
+from flask import request, send_file
 from flask_restful import Resource
 
 from app import ReportUtils
 from app.log import log
 
+# Alias of the most recent completed report, usually the rolling report
+LATEST = "latest"
+
+
+def send_report(report_id, report_format):
+    """
+    Builds the response streaming the file of a completed report.
+
+    Files are streamed from disk in chunks. Responses carry an ETag and honour If-None-Match and
+    Range requests, and CSV downloads accepting gzip get the pre-compressed copy.
+
+    Args:
+        report_id (str): The ID of the report.
+        report_format (str): A key of REPORT_FORMATS.
+
+    Returns:
+        Response: The file response.
+    """
+    path = ReportUtils.ReportUtils.materialize_report(report_id, report_format)
+    _, mimetype = ReportUtils.REPORT_FORMATS[report_format]
+    download_name = os.path.basename(path)
+
+    if report_format == "csv" and request.range is None and "gzip" in request.accept_encodings:
+        response = send_file(path + ".gz", mimetype=mimetype, as_attachment=True,
+                             download_name=download_name, conditional=True)
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = send_file(path, mimetype=mimetype, as_attachment=True,
+                             download_name=download_name, conditional=True)
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def latest_report():
+    """
+    Returns the ID and timestamp of the most recent completed report, or None when no report has
+    completed yet.
+    """
+    report_task = ReportUtils.ReportUtils.latest_report()
+    if report_task is None:
+        return None
+    return report_task.report_id, report_task.timestamp
+
 
 class ReportResource(Resource):
     """
@@ -18,36 +62,105 @@ class ReportResource(Resource):
         """
         Handles the GET request for report data.
 
+        The report ID `latest` stands for the most recent completed report, whose ID and timestamp are
+        added to the response. With a `format` query parameter (csv, parquet or arrow), a completed report is returned as a
+        file in that format instead of the status dictionary.
+
         Args:
             report_id (str): The ID of the report to retrieve.
 
         Returns:
             dict: A dictionary containing the status of the report request.
                   If the report is running, returns {"status": "Running"}.
-                  If the report is complete, returns {"Status": "Complete", "File Path": "csv_file_path/report_<report_id>.csv"}.
+                  If a chunk of the report failed, returns {"status": "Failed", "error": <the error>}.
+                  If the report is complete, returns {"Status": "Complete", "File Path": "<REPORTS_DIR>/report_<report_id>.csv",
+                  "Download": "/get_report/<report_id>/csv"}.
+                  If the report does not exist, returns {"error": "Report not found"} with a 404 status code.
+                  If the format is unknown or unavailable, returns {"error": ...} with a 400 status code.
                   If an error occurs, returns {"error": "An error occurred"} with a 500 status code.
         """
         try:
             log.info("Received GET request for report_id: %s", report_id)
 
-            # Get the status and CSV data for the report
+            report_format = request.args.get("format")
+            if report_format is not None and report_format not in ReportUtils.REPORT_FORMATS:
+                return {"error": f"Unknown format: {report_format}"}, 400
 
-            status, csv_data = ReportUtils.ReportUtils.get_report_status_and_data(report_id)
+            latest = None
+            if report_id == LATEST:
+                latest = latest_report()
+                if latest is None:
+                    return {"error": "No report has completed yet"}, 404
+                report_id = latest[0]
 
-            if status == "Running":
-                log.debug("Report with ID %s is still running", report_id)
-                return {"status": status}, 200
+            status = ReportUtils.ReportUtils.get_report_status(report_id)
+
+            if status == "Not Found":
+                return {"error": "Report not found"}, 404
             elif status == "Complete":
-                csv_filename = f"report_{report_id}.csv"
-                csv_file_path = f"reports"
+                if report_format is not None:
+                    return send_report(report_id, report_format)
 
-                if csv_data is not None:
-                    # Write CSV data to a file
-                    with open(os.path.join(csv_file_path, csv_filename), "w") as f:
-                        f.write(csv_data)
+                # The CSV file is written once, when the report completes
+                csv_path = ReportUtils.ReportUtils.materialize_report(report_id)
 
                 log.debug("Report with ID %s is complete", report_id)
-                return {'Status': "Complete", "File Path": f"{csv_file_path}/{csv_filename}"}
+                response = {'Status': "Complete", "File Path": csv_path,
+                            "Download": f"/get_report/{report_id}/csv"}
+                if latest is not None:
+                    response["Report ID"] = report_id
+                    response["Timestamp"] = latest[1].isoformat()
+                return response
+            elif status == "Failed":
+                return {"status": status, "error": ReportUtils.ReportUtils.get_report_error(report_id)}, 200
+            else:
+                log.debug("Report with ID %s is still running", report_id)
+                return {"status": status}, 200
+        except ValueError as e:
+            return {"error": str(e)}, 400
         except Exception as e:
             log.error("An error occurred while processing report request: %s", str(e))
             return {"error": "An error occurred"}, 500
+
+
+class ReportDownloadResource(Resource):
+    """
+    RESTful resource class streaming the CSV file of a completed report.
+
+    Attributes:
+        None
+    """
+
+    def get(self, report_id):
+        """
+        Handles the GET request for a report's CSV file. The report ID `latest` stands for the most recent
+        completed report.
+
+        Args:
+            report_id (str): The ID of the report to download.
+
+        Returns:
+            Response: The CSV file, a JSON status while the report is running, or the error of a failed
+                report with a 500 status code.
+        """
+        try:
+            log.info("Received download request for report_id: %s", report_id)
+
+            if report_id == LATEST:
+                latest = latest_report()
+                if latest is None:
+                    return {"error": "No report has completed yet"}, 404
+                report_id = latest[0]
+
+            status = ReportUtils.ReportUtils.get_report_status(report_id)
+            if status == "Not Found":
+                return {"error": "Report not found"}, 404
+            if status == "Failed":
+                return {"status": status, "error": ReportUtils.ReportUtils.get_report_error(report_id)}, 500
+            if status != "Complete":
+                return {"status": status}, 202
+
+            return send_report(report_id, "csv")
+        except Exception as e:
+            log.error("An error occurred while processing download request: %s", str(e))
+            return {"error": "An error occurred"}, 500
@@ -1,8 +1,46 @@
+import csv
 import datetime
-
+import gzip
+import hashlib
+import io
+import json
+import os
+import time
+from contextlib import nullcontext
+
+import numpy as np
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # The columnar report formats are optional
+    pa = pq = None
+
+from app import app
 from app import db
+from app import ReportMetrics
+from app.HourlyRollup import HourlyRollup
+from app.ReportEntrySink import ReportEntrySink
+from app.UptimeEngine import UptimeEngine, to_epoch
+from app.events import get_event_bus
 from app.log import log
-from app.models import MenuHours, StoreStatusEnum, ReportTask, ReportEntry
+from app.models import IngestWatermark, StoreStatus, StoreStatusEnum, TimeZone, ReportChunk, ReportChunkMetrics, \
+    ReportTask, ReportEntry
+
+REPORT_COLUMNS = ("store_id", "uptime_last_hour", "uptime_last_day", "update_last_week",
+                  "downtime_last_hour", "downtime_last_day", "downtime_last_week")
+
+# Report format -> (file extension, MIME type)
+REPORT_FORMATS = {
+    "csv": ("csv", "text/csv"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+    "arrow": ("arrow", "application/vnd.apache.arrow.file"),
+}
+
+if pa is not None:
+    REPORT_SCHEMA = pa.schema([("store_id", pa.int64())] + [(column, pa.float64()) for column in REPORT_COLUMNS[1:]])
 
 
 class ReportUtils:
@@ -14,59 +52,53 @@ class ReportUtils:
      """
 
     @staticmethod
-    def generate_and_store_report_data(report_id, store, current_timestamp):
+    def generate_and_store_report_data(report_id, store, current_timestamp, engine=None, sink=None):
         """
         Generates and stores report data for a store.
 
         Args:
             report_id (str): The ID of the report.
-            store (MenuHours): The store's business hours.
+            store (TimeZone): The store to report on.
             current_timestamp (datetime.datetime): The current timestamp.
+            engine (UptimeEngine): A loaded engine covering the store. When omitted, a single-store
+                engine is built for this call.
+            sink (ReportEntrySink): Buffers the entry for a bulk insert. When omitted, the entry is
+                inserted and committed on its own.
 
         Returns:
             None
+
+        Raises:
+            Exception: Any error computing or storing the entry, after it has been logged.
         """
         try:
             log.info("Generating and storing report data for store: %s", store.store_id)
 
-            # Retrieve store's business hours
-            business_hours = MenuHours.query.filter_by(store_id=store.store_id).all()
-
-            # Calculate report data for uptime and downtime
-            uptime_last_hour, downtime_last_hour = ReportUtils.calculate_uptime_downtime(
-                store.store_id, current_timestamp - datetime.timedelta(hours=1), current_timestamp
-            )
-            uptime_last_day, downtime_last_day = ReportUtils.calculate_uptime_downtime(
-                store.store_id, current_timestamp - datetime.timedelta(days=1), current_timestamp
-            )
-            update_last_week, downtime_last_week = ReportUtils.calculate_uptime_downtime(
-                store.store_id, current_timestamp - datetime.timedelta(weeks=1), current_timestamp
-            )
-
-            # Create a new ReportEntry and store it in the database
-            report_entry = ReportEntry(
-                report_id=report_id,
-                store_id=store.store_id,
-                uptime_last_hour=uptime_last_hour,
-                uptime_last_day=uptime_last_day,
-                update_last_week=update_last_week,
-                downtime_last_hour=downtime_last_hour,
-                downtime_last_day=downtime_last_day,
-                downtime_last_week=downtime_last_week
-            )
-            log.debug("Storing report entry: %s", report_entry)
-            db.session.add(report_entry)
-            db.session.commit()
+            if engine is None:
+                engine = UptimeEngine(current_timestamp, [store.store_id]).load()
+
+            # Calculate report data for uptime and downtime over the hour, day and week windows
+            row = engine.store_row(report_id, store.store_id)
+
+            if sink is not None:
+                sink.add(row)
+            else:
+                with ReportEntrySink() as single:
+                    single.add(row)
 
             log.info("Report data generation and storage completed for store: %s", store.store_id)
         except Exception as e:
             log.error("An error occurred while generating and storing report data: %s", str(e))
+            raise
 
     @staticmethod
     def calculate_uptime_downtime(store_id, start_time, end_time):
         """
         Calculates the uptime and downtime for a store within a specified time range.
 
+        Only time within the store's business hours is counted; the status between polls is
+        interpolated from the nearest poll (see UptimeEngine).
+
         Args:
             store_id (int): The ID of the store.
             start_time (datetime.datetime): The start time of the calculation.
@@ -75,55 +107,322 @@ class ReportUtils:
         Returns:
             float: Total uptime in hours.
             float: Total downtime in hours.
+
+        Raises:
+            Exception: Any error loading or computing the store's uptime, after it has been logged.
         """
         try:
             log.debug("Calculating uptime and downtime for store: %s", store_id)
 
-            # Retrieve the store's business hours
-            business_hours = MenuHours.query.filter_by(store_id=store_id).all()
+            window = end_time - start_time
+            engine = UptimeEngine(end_time, [store_id], lookback=window).load()
+            uptime, downtime = engine.compute(windows=(window,))
+            total_uptime, total_downtime = float(uptime[0, 0]), float(downtime[0, 0])
+
+            log.debug("Uptime: %.2f hours, Downtime: %.2f hours", total_uptime, total_downtime)
+
+            return total_uptime, total_downtime
+        except Exception as e:
+            log.error("An error occurred while calculating uptime and downtime: %s", str(e))
+            raise
 
-            # Initialize variables to track uptime and downtime
-            total_business_hours = 0
-            total_uptime = 0
+    @staticmethod
+    def stores_uptime(store_ids, start_time, end_time):
+        """
+        Calculates the uptime and downtime of stores over an arbitrary time range, synchronously.
 
-            # Calculate uptime and downtime based on business hours and status
-            for business_hour in business_hours:
-                overlap_start = max(business_hour.start_time_local, start_time.time())
-                overlap_end = min(business_hour.end_time_local, end_time.time())
+        The polls come from the status timeline snapshot or the (store_id, timestamp) index, so a
+        handful of stores is answered in milliseconds without running a report.
 
-                if overlap_start < overlap_end:
-                    # Calculate the duration of overlap in seconds
-                    overlap_duration_seconds = (
-                                                       overlap_end.hour * 3600 + overlap_end.minute * 60 + overlap_end.second) - (
-                                                       overlap_start.hour * 3600 + overlap_start.minute * 60 + overlap_start.second)
+        Args:
+            store_ids (list of int): The IDs of the stores.
+            start_time (datetime.datetime): The start of the range (naive UTC).
+            end_time (datetime.datetime): The end of the range (naive UTC).
 
-                    total_business_hours += overlap_duration_seconds / 3600
-                    status = ReportUtils.get_store_status(store_id, overlap_start, overlap_end)
-                    if status == StoreStatusEnum.ACTIVE:
-                        total_uptime += overlap_duration_seconds / 3600
+        Returns:
+            list of dict: Per store, in the order of store_ids (duplicates removed), the range and the
+            business, up and down time in hours.
+        """
+        engine = UptimeEngine(end_time, store_ids, lookback=end_time - start_time).load()
+        business, uptime = engine.compute_windows(np.array([[to_epoch(start_time)]]),
+                                                  np.array([[to_epoch(end_time)]]))
+        index, _ = engine.index_stores(np.asarray(store_ids, dtype=np.int64))
+        results = {}
+        for store_id, i in zip(store_ids, index.tolist()):
+            results.setdefault(store_id, {
+                "store_id": store_id,
+                "start": start_time.isoformat(),
+                "end": end_time.isoformat(),
+                "business_hours": round(float(business[i, 0]) / 3600, 4),
+                "uptime_hours": round(float(uptime[i, 0]) / 3600, 4),
+                "downtime_hours": round(float(business[i, 0] - uptime[i, 0]) / 3600, 4),
+            })
+        return list(results.values())
 
-            total_downtime = total_business_hours - total_uptime
+    @staticmethod
+    def known_stores(store_ids):
+        """
+        Get the stores, among some IDs, that have a time zone or status polls.
 
-            log.debug("Uptime: %.2f hours, Downtime: %.2f hours", total_uptime, total_downtime)
+        Args:
+            store_ids (list of int): The IDs of the stores.
 
-            return total_uptime, total_downtime
-        except Exception as e:
-            log.error("An error occurred while calculating uptime and downtime: %s", str(e))
+        Returns:
+            set of int: The known store IDs.
+        """
+        known = set()
+        for i in range(0, len(store_ids), UptimeEngine.MAX_IN_CLAUSE):
+            chunk = list(store_ids[i:i + UptimeEngine.MAX_IN_CLAUSE])
+            known.update(db.session.execute(select(TimeZone.store_id).where(TimeZone.store_id.in_(chunk))).scalars())
+            known.update(db.session.execute(
+                select(StoreStatus.store_id).where(StoreStatus.store_id.in_(chunk)).distinct()).scalars())
+        return known
 
     @staticmethod
     def get_store_status(store_id, start_time, end_time):
         """
         Get the status of a store within a specified time range.
 
+        The store is considered active when it was up for at least half of the business time
+        within the interval.
+
         Args:
             store_id (int): The ID of the store.
-            start_time (datetime.time): The start time of the interval.
-            end_time (datetime.time): The end time of the interval.
+            start_time (datetime.datetime): The start time of the interval.
+            end_time (datetime.datetime): The end time of the interval.
 
         Returns:
             StoreStatusEnum: The status of the store within the given interval.
         """
-        return StoreStatusEnum.ACTIVE
+        uptime, downtime = ReportUtils.calculate_uptime_downtime(store_id, start_time, end_time)
+        if uptime >= downtime:
+            return StoreStatusEnum.ACTIVE
+        return StoreStatusEnum.INACTIVE
+
+    @staticmethod
+    def get_report_status(report_id):
+        """
+        Get the status of a report.
+
+        Args:
+            report_id (str): The ID of the report.
+
+        Returns:
+            str: The status of the report, or "Not Found".
+        """
+        report_task = ReportTask.query.filter_by(report_id=report_id).first()
+        if report_task is None:
+            return "Not Found"
+        return report_task.status
+
+    @staticmethod
+    def get_report_progress(report_id):
+        """
+        Get the status and progress of a report.
+
+        Args:
+            report_id (str): The ID of the report.
+
+        Returns:
+            dict: The report ID, status, stores and chunks processed and their totals, plus the error of a
+            failed report, or None when the report does not exist.
+        """
+        # Read the columns rather than the ORM object, which the session would not refresh between calls
+        row = db.session.execute(select(ReportTask.status, ReportTask.stores_done, ReportTask.stores_total,
+                                        ReportTask.chunks_done, ReportTask.chunks_total, ReportTask.error)
+                                 .where(ReportTask.report_id == report_id)).first()
+        if row is None:
+            return None
+        progress = {"report_id": report_id, "status": row.status,
+                    "stores_processed": row.stores_done, "stores_total": row.stores_total,
+                    "chunks_processed": row.chunks_done, "chunks_total": row.chunks_total}
+        if row.error is not None:
+            progress["error"] = row.error
+        return progress
+
+    @staticmethod
+    def publish_progress(report_id):
+        """
+        Publishes the current status and progress of a report to its event subscribers.
+
+        Args:
+            report_id (str): The ID of the report.
+
+        Returns:
+            None
+        """
+        progress = ReportUtils.get_report_progress(report_id)
+        if progress is not None:
+            get_event_bus().publish(report_id, progress)
+
+    @staticmethod
+    def get_report_error(report_id):
+        """
+        Get the error of a failed report.
+
+        Args:
+            report_id (str): The ID of the report.
+
+        Returns:
+            str: The error recorded against the report, or None.
+        """
+        return db.session.execute(select(ReportTask.error).where(ReportTask.report_id == report_id)).scalar()
+
+    @staticmethod
+    def fail_report(report_id, error):
+        """
+        Marks a report as failed, keeping the first error. The report's fingerprint is released so that
+        the next trigger generates a new report instead of reusing this one.
+
+        Args:
+            report_id (str): The ID of the report.
+            error (str): Why the report failed.
+
+        Returns:
+            None
+        """
+        log.error("Report %s failed: %s", report_id, error)
+        report_task = ReportTask.query.filter_by(report_id=report_id).first()
+        if report_task is None:
+            return
+        report_task.status = "Failed"
+        report_task.fingerprint = None
+        if report_task.error is None:
+            report_task.error = error
+        db.session.commit()
+        ReportUtils.publish_progress(report_id)
+
+    @staticmethod
+    def data_version():
+        """
+        Get a digest of the ingested data, which changes whenever new polls, business hours or time
+        zones are ingested.
+
+        Returns:
+            str: The hex digest of the ingestion watermarks.
+        """
+        digest = hashlib.sha1()
+        for watermark in IngestWatermark.query.order_by(IngestWatermark.source).all():
+            digest.update(f"{watermark.source}:{watermark.file_offset}:{watermark.checksum}:"
+                          f"{watermark.last_timestamp};".encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def report_fingerprint(current_timestamp):
+        """
+        Get the fingerprint under which a report triggered at a given time can be reused: the data
+        version plus the trigger time truncated to REPORT_FRESHNESS_SECONDS.
+
+        Args:
+            current_timestamp (datetime.datetime): The trigger time.
+
+        Returns:
+            str: The fingerprint, or None when report reuse is disabled.
+        """
+        freshness = app.config['REPORT_FRESHNESS_SECONDS']
+        if not freshness:
+            return None
+        time_bucket = to_epoch(current_timestamp) // freshness * freshness
+        return f"{time_bucket}-{ReportUtils.data_version()[:16]}"
+
+    @staticmethod
+    def find_reusable_report(fingerprint):
+        """
+        Get the running or completed report with a given fingerprint.
+
+        Args:
+            fingerprint (str): The report fingerprint.
+
+        Returns:
+            ReportTask: The report task, or None.
+        """
+        return ReportTask.query.filter(ReportTask.fingerprint == fingerprint,
+                                       ReportTask.status.in_(("Running", "Complete"))).first()
+
+    @staticmethod
+    def latest_report(rolling=False):
+        """
+        Get the most recent completed report.
+
+        Args:
+            rolling (bool): Only consider rolling reports.
+
+        Returns:
+            ReportTask: The report task, or None.
+        """
+        query = ReportTask.query.filter(ReportTask.status == "Complete")
+        if rolling:
+            query = query.filter(ReportTask.rolling.is_(True))
+        return query.order_by(ReportTask.timestamp.desc(), ReportTask.id.desc()).first()
+
+    @staticmethod
+    def evict_reports(max_age):
+        """
+        Deletes the completed and failed reports older than a maximum age, with their entries, checkpoints,
+        metrics and files. When REPORT_ARCHIVE_DIR is set, the gzip-encoded CSV file of each report is
+        moved there instead of being deleted.
+
+        Args:
+            max_age (datetime.timedelta): The maximum age of a completed report.
+
+        Returns:
+            int: The number of evicted reports.
+        """
+        cutoff = datetime.datetime.utcnow() - max_age
+        report_ids = [report_id for report_id, in db.session.query(ReportTask.report_id).filter(
+            ReportTask.status.in_(("Complete", "Failed")), ReportTask.timestamp < cutoff)]
+        ReportUtils.delete_reports(report_ids)
+        if report_ids:
+            log.info("Evicted %d reports completed before %s", len(report_ids), cutoff)
+        return len(report_ids)
+
+    @staticmethod
+    def delete_reports(report_ids):
+        """
+        Deletes reports with their entries, checkpoints, metrics and files. When REPORT_ARCHIVE_DIR is
+        set, the gzip-encoded CSV file of each report is moved there instead of being deleted.
+
+        Args:
+            report_ids (list of str): The IDs of the reports.
+
+        Returns:
+            None
+        """
+        for i in range(0, len(report_ids), 500):
+            chunk = report_ids[i:i + 500]
+            ReportEntry.query.filter(ReportEntry.report_id.in_(chunk)).delete(synchronize_session=False)
+            ReportChunkMetrics.query.filter(ReportChunkMetrics.report_id.in_(chunk)).delete(synchronize_session=False)
+            ReportChunk.query.filter(ReportChunk.report_id.in_(chunk)).delete(synchronize_session=False)
+            ReportTask.query.filter(ReportTask.report_id.in_(chunk)).delete(synchronize_session=False)
+        db.session.commit()
+
+        archive_dir = app.config['REPORT_ARCHIVE_DIR']
+        for report_id in report_ids:
+            ReportUtils.remove_report_files(report_id, archive_dir)
+
+    @staticmethod
+    def remove_report_files(report_id, archive_dir=None):
+        """
+        Deletes the files of a report, except for the gzip-encoded CSV file, which is moved to
+        archive_dir when given.
+
+        Args:
+            report_id (str): The ID of the report.
+            archive_dir (str): Where to keep the report's CSV file, or None.
+
+        Returns:
+            None
+        """
+        for report_format in REPORT_FORMATS:
+            path = ReportUtils.report_file_path(report_id, report_format)
+            for file_path in (path, path + ".gz"):
+                if not os.path.exists(file_path):
+                    continue
+                if archive_dir and report_format == "csv" and file_path.endswith(".gz"):
+                    os.makedirs(archive_dir, exist_ok=True)
+                    os.replace(file_path, os.path.join(archive_dir, os.path.basename(file_path)))
+                else:
+                    os.remove(file_path)
 
     @staticmethod
     def get_report_status_and_data(report_id):
@@ -136,18 +435,36 @@ class ReportUtils:
         Returns:
             tuple: A tuple containing the report status and CSV data (if available).
         """
-        # Check the status of the report in the database
-        report_task = ReportTask.query.filter_by(report_id=report_id).first()
+        status = ReportUtils.get_report_status(report_id)
+        if status == "Complete":
+            return status, ReportUtils.generate_report_csv_data(report_id)
+        return status, None
 
-        if report_task is None:
-            # Report task not found
-            return "Not Found", None
+    @staticmethod
+    def iter_report_csv(report_id, batch_size=1000):
+        """
+        Streams the CSV data of a report from the database, one batch of entries at a time.
 
-        if report_task.status == "Complete":
-            csv_data = ReportUtils.generate_report_csv_data(report_id)
-            return report_task.status, csv_data
-        else:
-            return report_task.status, None
+        Args:
+            report_id (str): The ID of the report.
+            batch_size (int): Number of report entries per yielded chunk.
+
+        Yields:
+            str: The CSV header, then chunks of CSV lines.
+        """
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(REPORT_COLUMNS)
+        yield buffer.getvalue()
+
+        columns = [ReportEntry.__table__.c[column] for column in REPORT_COLUMNS]
+        query = select(*columns).where(ReportEntry.report_id == report_id).order_by(ReportEntry.store_id)
+        result = db.session.execute(query.execution_options(stream_results=True))
+        for partition in result.partitions(batch_size):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(partition)
+            yield buffer.getvalue()
 
     @staticmethod
     def generate_report_csv_data(report_id):
@@ -160,12 +477,103 @@ class ReportUtils:
                 Returns:
                     str: CSV data for the report.
         """
-        report_entries = ReportEntry.query.filter_by(report_id=report_id).all()
-        csv_data = "store_id,uptime_last_hour,uptime_last_day,update_last_week,downtime_last_hour,downtime_last_day,downtime_last_week\n"
-        for entry in report_entries:
-            csv_data += f"{entry.store_id},{entry.uptime_last_hour},{entry.uptime_last_day},{entry.update_last_week},{entry.downtime_last_hour},{entry.downtime_last_day},{entry.downtime_last_week}\n"
+        return "".join(ReportUtils.iter_report_csv(report_id))
+
+    @staticmethod
+    def report_file_path(report_id, report_format="csv"):
+        """
+        Get the path of a report's file in a given format.
+
+        Args:
+            report_id (str): The ID of the report.
+            report_format (str): A key of REPORT_FORMATS.
+
+        Returns:
+            str: The path of the file; the gzip-encoded copy of the CSV file has an additional '.gz' suffix.
+        """
+        extension, _ = REPORT_FORMATS[report_format]
+        return os.path.join(app.config['REPORTS_DIR'], f"report_{report_id}.{extension}")
+
+    @staticmethod
+    def materialize_report(report_id, report_format="csv"):
+        """
+        Writes the file of a report in a given format, unless it already exists.
 
-        return csv_data
+        Files are written under temporary names and renamed into place, so readers never see a
+        partial report.
+
+        Args:
+            report_id (str): The ID of the report.
+            report_format (str): A key of REPORT_FORMATS.
+
+        Returns:
+            str: The path of the file.
+
+        Raises:
+            ValueError: If the format is columnar and pyarrow is not installed.
+        """
+        path = ReportUtils.report_file_path(report_id, report_format)
+        if report_format == "csv":
+            if not (os.path.exists(path) and os.path.exists(path + ".gz")):
+                ReportUtils.write_report_csv(report_id, path)
+        elif not os.path.exists(path):
+            ReportUtils.write_report_columnar(report_id, report_format, path)
+        return path
+
+    @staticmethod
+    def write_report_csv(report_id, csv_path):
+        """
+        Writes the CSV file of a report and a gzip-encoded copy.
+        """
+        log.info("Writing CSV files of report %s", report_id)
+        os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+        with open(csv_path + ".tmp", "w", newline="") as csv_file, \
+                gzip.open(csv_path + ".gz.tmp", "wt", newline="") as gzip_file:
+            for chunk in ReportUtils.iter_report_csv(report_id):
+                csv_file.write(chunk)
+                gzip_file.write(chunk)
+        os.replace(csv_path + ".gz.tmp", csv_path + ".gz")
+        os.replace(csv_path + ".tmp", csv_path)
+
+    @staticmethod
+    def write_report_columnar(report_id, report_format, path):
+        """
+        Writes the Parquet or Arrow IPC file of a report.
+        """
+        if pa is None:
+            raise ValueError(f"The {report_format} format requires pyarrow")
+
+        log.info("Writing %s file of report %s", report_format, report_id)
+        columns = [ReportEntry.__table__.c[column] for column in REPORT_COLUMNS]
+        query = select(*columns).where(ReportEntry.report_id == report_id).order_by(ReportEntry.store_id)
+        rows = db.session.execute(query).all()
+        table = pa.table(
+            [pa.array([row[i] for row in rows], type=REPORT_SCHEMA.field(i).type) for i in range(len(REPORT_COLUMNS))],
+            schema=REPORT_SCHEMA,
+        )
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if report_format == "parquet":
+            pq.write_table(table, path + ".tmp")
+        else:
+            with pa.OSFile(path + ".tmp", "wb") as sink, pa.ipc.new_file(sink, REPORT_SCHEMA) as writer:
+                writer.write_table(table)
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def read_report_table(report_id):
+        """
+        Reads a completed report as an Arrow table, memory-mapping its Arrow IPC file without copying.
+
+        Args:
+            report_id (str): The ID of the report.
+
+        Returns:
+            pyarrow.Table: The report entries.
+        """
+        path = ReportUtils.materialize_report(report_id, "arrow")
+        with pa.memory_map(path, "r") as source:
+            return pa.ipc.open_file(source).read_all()
 
     @staticmethod
     def generate_reports(report_id, current_timestamp, stores):
@@ -175,21 +583,211 @@ class ReportUtils:
         Args:
            report_id (str): The ID of the report.
            current_timestamp (datetime.datetime): The current timestamp.
-           stores (list of dict): List of store information dictionaries.
+           stores (list of TimeZone): The stores to report on.
 
         Returns:
-           str: The ID of the generated report.
+           str: The ID of the generated report, or None when a chunk failed and the report was marked
+           as failed.
         """
         try:
             log.info("Generating reports for %d stores", len(stores))
 
-            # Generate and store report data for each store
-            for store_info in stores:
-                log.info("Generating report for store: %s", store_info)
-                ReportUtils.generate_and_store_report_data(report_id, store_info, current_timestamp)
+            # Generate and store report data chunk by chunk
+            store_ids = [store.store_id for store in stores]
+            for chunk in ReportUtils.plan_chunks(report_id, store_ids):
+                ReportUtils.generate_report_chunk(report_id, current_timestamp, chunk)
 
             log.info("Reports generation completed for %d stores", len(stores))
 
             return report_id
         except Exception as e:
             log.error("An error occurred while generating reports: %s", str(e))
+            ReportUtils.fail_report(report_id, str(e))
+
+    @staticmethod
+    def chunk_store_ids(store_ids, chunk_size):
+        """
+        Splits store IDs into sorted chunks of at most chunk_size stores.
+
+        Args:
+            store_ids (list of int): The IDs of the stores.
+            chunk_size (int): The maximum number of stores per chunk.
+
+        Returns:
+            list of list of int: The chunks.
+        """
+        store_ids = sorted(set(store_ids))
+        return [store_ids[i:i + chunk_size] for i in range(0, len(store_ids), chunk_size)]
+
+    @staticmethod
+    def plan_chunks(report_id, store_ids):
+        """
+        Splits the stores of a report into chunks and records the chunk count on the report.
+
+        The chunk size is fixed the first time a report is dispatched, so a resumed report gets the
+        same chunks and its checkpoints still match, even if REPORT_CHUNK_SIZE has changed since.
+
+        Args:
+            report_id (str): The ID of the report.
+            store_ids (list of int): The IDs of the stores.
+
+        Returns:
+            list of list of int: The chunks.
+        """
+        report_task = ReportTask.query.filter_by(report_id=report_id).first()
+        chunk_size = app.config['REPORT_CHUNK_SIZE']
+        if report_task is not None and report_task.chunk_size:
+            chunk_size = report_task.chunk_size
+        chunks = ReportUtils.chunk_store_ids(store_ids, chunk_size)
+        if report_task is not None:
+            report_task.chunk_size = chunk_size
+            report_task.chunks_total = len(chunks)
+            report_task.stores_total = sum(len(chunk) for chunk in chunks)
+            db.session.commit()
+        return chunks
+
+    @staticmethod
+    def compute_report_rows(report_id, current_timestamp, store_ids):
+        """
+        Computes the report entries of some stores, from the hourly rollup once it is available.
+
+        Args:
+            report_id (str): The ID of the report.
+            current_timestamp (datetime.datetime): The current timestamp.
+            store_ids (list of int): The IDs of the stores.
+
+        Returns:
+            list of dict: One ReportEntry column mapping per store.
+        """
+        if app.config['REPORT_USE_ROLLUP'] and HourlyRollup.is_available(current_timestamp):
+            return HourlyRollup.report_rows(report_id, current_timestamp, store_ids)
+        return UptimeEngine(current_timestamp, store_ids).load().report_rows(report_id)
+
+    @staticmethod
+    def generate_report_chunk(report_id, current_timestamp, store_ids, record_failure=True, compute=None):
+        """
+        Computes the report entries of a chunk of stores and bulk inserts them in one transaction.
+
+        Entries go through a ReportEntrySink, in REPORT_INSERT_BATCH_SIZE batches. The same transaction
+        stores the chunk's ReportChunk checkpoint and advances the report's progress counters, which
+        are then published. A chunk whose checkpoint exists is skipped, so a retried or resumed report
+        never recomputes or duplicates entries; if two runs of a chunk race, the checkpoint's unique
+        index makes the second one roll back. If the chunk fails, its transaction is rolled back and,
+        unless the caller retries it, the report is marked as failed before the error propagates.
+
+        The load, compute and persist stages of the chunk are timed and stored, with the query and
+        row counts, as a ReportChunkMetrics row once the entries are committed. Chunks of reports triggered
+        with profiling enabled run under cProfile.
+
+        Args:
+            report_id (str): The ID of the report.
+            current_timestamp (datetime.datetime): The current timestamp.
+            store_ids (list of int): The IDs of the stores in the chunk.
+            record_failure (bool): Whether a failure marks the report as failed. Callers that retry the
+                chunk pass False until the last attempt.
+            compute (callable): Computes the entries of the chunk from the report ID, the current timestamp
+                and the store IDs. Defaults to ReportUtils.compute_report_rows.
+
+        Returns:
+            int: The number of stored report entries.
+        """
+        first_store_id = min(store_ids)
+        checkpoint = ReportChunk.query.filter_by(report_id=report_id, first_store_id=first_store_id).first()
+        if checkpoint is not None:
+            log.info("Skipping chunk of report %s starting at store %s, stored at %s", report_id, first_store_id,
+                     checkpoint.completed_at)
+            return checkpoint.stores
+
+        log.info("Generating report %s for a chunk of %d stores", report_id, len(store_ids))
+
+        profiled = db.session.execute(
+            select(ReportTask.profile).where(ReportTask.report_id == report_id)).scalar()
+        profiler = ReportMetrics.profile(report_id, first_store_id) if profiled else nullcontext()
+
+        started = time.perf_counter()
+        try:
+            with profiler, ReportMetrics.ReportMetrics.collect() as metrics, ReportEntrySink() as sink:
+                with metrics.stage("compute"):
+                    rows = (compute or ReportUtils.compute_report_rows)(report_id, current_timestamp, store_ids)
+                with metrics.stage("persist"):
+                    sink.extend(rows)
+                    db.session.add(ReportChunk(report_id=report_id, first_store_id=first_store_id,
+                                               stores=len(store_ids)))
+                    db.session.execute(update(ReportTask).where(ReportTask.report_id == report_id).values(
+                        stores_done=ReportTask.stores_done + len(store_ids),
+                        chunks_done=ReportTask.chunks_done + 1,
+                        updated_at=datetime.datetime.utcnow()))
+                    sink.close()
+        except IntegrityError:
+            # Another run of the same chunk stored it first
+            log.info("Chunk of report %s starting at store %s was stored concurrently", report_id, first_store_id)
+            return len(store_ids)
+        except Exception as e:
+            if record_failure:
+                ReportUtils.fail_report(report_id, f"Chunk of {len(store_ids)} stores starting at "
+                                                   f"{first_store_id} failed: {e}")
+            raise
+
+        db.session.add(ReportChunkMetrics(
+            report_id=report_id, stores=len(store_ids), seconds=time.perf_counter() - started,
+            load_seconds=metrics.seconds["load"], compute_seconds=metrics.seconds["compute"],
+            persist_seconds=metrics.seconds["persist"], queries=metrics.queries,
+            polls=metrics.rows["polls"], entries=len(rows)))
+        db.session.commit()
+
+        log.info("Stored %d report entries for report %s in %.3fs", len(rows), report_id,
+                 time.perf_counter() - started)
+        ReportUtils.publish_progress(report_id)
+        return len(rows)
+
+    @staticmethod
+    def report_metrics(report_id):
+        """
+        Aggregates the instrumentation of the chunks of a report stored so far.
+
+        Args:
+            report_id (str): The ID of the report.
+
+        Returns:
+            dict: The summary built by ReportMetrics.summarize.
+        """
+        chunks = ReportChunkMetrics.query.filter_by(report_id=report_id).all()
+        return ReportMetrics.summarize(chunks)
+
+    @staticmethod
+    def complete_report(report_id):
+        """
+        Writes the files of a report (CSV, plus Parquet and Arrow IPC when pyarrow is installed) and
+        marks it as complete. Reports with a failed chunk are left failed.
+
+        Args:
+            report_id (str): The ID of the report.
+
+        Returns:
+            None
+        """
+        if ReportUtils.get_report_status(report_id) == "Failed":
+            log.warning("Not completing failed report %s", report_id)
+            return
+
+        started = time.perf_counter()
+        for report_format in REPORT_FORMATS:
+            if report_format == "csv" or pa is not None:
+                ReportUtils.materialize_report(report_id, report_format)
+        export_seconds = time.perf_counter() - started
+
+        log.debug("Updating report task status to Complete: %s", report_id)
+        report_task = ReportTask.query.filter_by(report_id=report_id).first()
+        if report_task:
+            report_task.status = "Complete"
+            report_task.completed_at = datetime.datetime.utcnow()
+            metrics = ReportUtils.report_metrics(report_id)
+            metrics["stages"]["export"] = round(export_seconds, 4)
+            if report_task.timestamp is not None:
+                metrics["wall_seconds"] = round((report_task.completed_at - report_task.timestamp).total_seconds(), 4)
+            report_task.metrics = json.dumps(metrics)
+            db.session.commit()
+            ReportUtils.publish_progress(report_id)
+
+        if app.config['REPORT_MAX_AGE_HOURS']:
+            ReportUtils.evict_reports(datetime.timedelta(hours=app.config['REPORT_MAX_AGE_HOURS']))
@@ -0,0 +1,306 @@
+import argparse
+import datetime
+import random
+from functools import partial
+
+import numpy as np
+from sqlalchemy import func, select
+
+from app import app
+from app import db
+from app.ReportUtils import ReportUtils
+from app.UptimeEngine import EPOCH, UptimeEngine, to_epoch
+from app.log import log
+from app.models import ReportEntry, ReportTask, StoreChange, StoreStatus, TimeZone
+
+HOUR, DAY, WEEK = (int(window.total_seconds()) for window in UptimeEngine.REPORT_WINDOWS)
+MARGIN = int(UptimeEngine.POLL_MARGIN.total_seconds())
+
+
+def polled_within(engine, low, high):
+    """
+    Tells which stores of a loaded engine have a poll between two epoch timestamps, inclusive. The
+    polls loaded from outside the engine's range are not counted.
+
+    Returns:
+        numpy.ndarray: One flag per store of the engine.
+    """
+    store_index, timestamps, _ = engine.polls
+    in_range = (timestamps >= engine.origin) & (timestamps <= engine.horizon)
+    store_index, timestamps = store_index[in_range], timestamps[in_range]
+    keys = store_index * engine.span + (timestamps - engine.origin)
+    block_starts = np.arange(len(engine.store_ids), dtype=np.int64) * engine.span
+    first = np.searchsorted(keys, block_starts + (low - engine.origin), side='left')
+    last = np.searchsorted(keys, block_starts + (high - engine.origin), side='right')
+    return last > first
+
+
+class RollingReport:
+    """
+    Generates the rolling report: a report regenerated every REPORT_ROLLING_MINUTES by Celery beat,
+    whose windows end at the start of the current period, and which is served as /get_report/latest.
+
+    Each run starts from the previous rolling report. Stores whose polls, business hours or time zone
+    changed since then, as recorded in StoreChange at ingestion, are recomputed by the UptimeEngine.
+    The entries of the other stores are carried forward: their hour window is recomputed from the
+    last hour of polls, and their day and week windows are moved forward by adding the time since the
+    previous report and subtracting the time that left each window, which only needs the polls around
+    the window starts. Stores lacking a poll within POLL_MARGIN of those edges are recomputed as well,
+    so carried-forward entries equal the entries a full computation would give.
+    """
+
+    @staticmethod
+    def record_changes(store_ids=None, first_timestamp=None):
+        """
+        Records a change of the ingested data for the next rolling report, in the current transaction.
+
+        Args:
+            store_ids (list of int): The stores whose business hours or time zone changed.
+            first_timestamp (datetime.datetime): The earliest of newly ingested polls.
+
+        Returns:
+            None
+        """
+        if store_ids is not None:
+            rows = [{'store_id': store_id, 'changed_at': datetime.datetime.utcnow()} for store_id in store_ids]
+        else:
+            # New polls of any store from first_timestamp on, or, without it, a full load
+            rows = [{'store_id': None, 'first_timestamp': first_timestamp, 'changed_at': datetime.datetime.utcnow()}]
+        if rows:
+            db.session.execute(StoreChange.__table__.insert(), rows)
+
+    @staticmethod
+    def period_start(timestamp, minutes):
+        """
+        Returns the start of the REPORT_ROLLING_MINUTES period containing a timestamp.
+        """
+        period = minutes * 60
+        return EPOCH + datetime.timedelta(seconds=to_epoch(timestamp) // period * period)
+
+    @staticmethod
+    def changes(previous):
+        """
+        Collects the stores changed since a rolling report.
+
+        Polls ingested after the report but not newer than it change the stores they belong to. Newer
+        polls are detected while carrying entries forward.
+
+        Args:
+            previous (ReportTask): The previous rolling report, or None.
+
+        Returns:
+            tuple: The ID of the last recorded change, and the set of changed store IDs, or None when
+            every store has to be recomputed.
+        """
+        watermark = db.session.query(func.max(StoreChange.id)).scalar() or 0
+        if previous is None or previous.change_watermark is None:
+            return watermark, None
+
+        changed, first_poll = set(), None
+        rows = db.session.execute(select(StoreChange.store_id, StoreChange.first_timestamp).where(
+            StoreChange.id > previous.change_watermark, StoreChange.id <= watermark))
+        for store_id, first_timestamp in rows:
+            if store_id is not None:
+                changed.add(store_id)
+            elif first_timestamp is None:
+                return watermark, None
+            elif first_poll is None or first_timestamp < first_poll:
+                first_poll = first_timestamp
+
+        until = previous.timestamp + datetime.timedelta(seconds=1)
+        if first_poll is not None and first_poll < until:
+            changed.update(db.session.execute(select(StoreStatus.store_id).distinct().where(
+                StoreStatus.timestamp >= first_poll, StoreStatus.timestamp < until)).scalars())
+        return watermark, changed
+
+    @staticmethod
+    def previous_seconds(report_id, store_ids):
+        """
+        Loads the day and week windows of stores from a report, in seconds.
+
+        Args:
+            report_id (str): The ID of the report.
+            store_ids (list of int): The sorted IDs of the stores.
+
+        Returns:
+            dict: Store ID -> (business seconds, uptime seconds), each holding the day and week windows.
+        """
+        rows = db.session.execute(select(
+            ReportEntry.store_id, ReportEntry.uptime_last_day, ReportEntry.update_last_week,
+            ReportEntry.downtime_last_day, ReportEntry.downtime_last_week).where(
+            ReportEntry.report_id == report_id,
+            ReportEntry.store_id >= store_ids[0], ReportEntry.store_id <= store_ids[-1]))
+        seconds = {}
+        for store_id, uptime_day, uptime_week, downtime_day, downtime_week in rows:
+            uptime = np.rint(np.array([uptime_day, uptime_week]) * 3600).astype(np.int64)
+            downtime = np.rint(np.array([downtime_day, downtime_week]) * 3600).astype(np.int64)
+            seconds[store_id] = (uptime + downtime, uptime)
+        return seconds
+
+    @staticmethod
+    def carry_forward(report_id, current_timestamp, previous_timestamp, store_ids, previous):
+        """
+        Moves the entries of unchanged stores forward from the previous rolling report.
+
+        Args:
+            report_id (str): The ID of the report.
+            current_timestamp (datetime.datetime): The end of the report windows.
+            previous_timestamp (datetime.datetime): The end of the previous report's windows, at most
+                an hour earlier.
+            store_ids (list of int): The sorted IDs of the unchanged stores.
+            previous (dict): The day and week seconds of the stores in the previous report.
+
+        Returns:
+            list of dict: ReportEntry column mappings of the stores that could be carried forward.
+        """
+        t, t0 = to_epoch(current_timestamp), to_epoch(previous_timestamp)
+        business = np.array([previous[store_id][0] for store_id in store_ids], dtype=np.int64).reshape(-1, 2)
+        uptime = np.array([previous[store_id][1] for store_id in store_ids], dtype=np.int64).reshape(-1, 2)
+
+        # The hour window and the time since the previous report come from the last hour of polls.
+        # Stores polled since the previous report have changed and are recomputed.
+        recent = UptimeEngine(current_timestamp, store_ids, lookback=UptimeEngine.REPORT_WINDOWS[0]).load()
+        keep = ~polled_within(recent, t0 + 1, t)
+        hour_business, hour_uptime = recent.compute_windows(np.array([[t - HOUR]]), np.array([[t]]))
+        added_business, added_uptime = recent.compute_windows(np.array([[t0]]), np.array([[t]]))
+        business += added_business
+        uptime += added_uptime
+
+        for w, window in enumerate((DAY, WEEK)):
+            # The time that left the window, with the polls around it
+            start, end = t0 - window, t - window
+            engine = UptimeEngine(EPOCH + datetime.timedelta(seconds=end + MARGIN), store_ids,
+                                  lookback=datetime.timedelta(seconds=t - t0 + MARGIN)).load(recent.schedules)
+            keep &= polled_within(engine, start - MARGIN, start) & polled_within(engine, end - MARGIN, end) \
+                & polled_within(engine, end, end + MARGIN)
+            removed_business, removed_uptime = engine.compute_windows(np.array([[start]]), np.array([[end]]))
+            business[:, w] -= removed_business[:, 0]
+            uptime[:, w] -= removed_uptime[:, 0]
+
+        window_business = np.column_stack((hour_business[:, 0], business)) / 3600
+        window_uptime = np.column_stack((hour_uptime[:, 0], uptime)) / 3600
+        return [UptimeEngine.make_row(report_id, store_ids[i], window_uptime[i], window_business[i] - window_uptime[i])
+                for i in np.flatnonzero(keep)]
+
+    @staticmethod
+    def report_rows(report_id, current_timestamp, store_ids, previous_report_id=None, previous_timestamp=None,
+                    changed=None):
+        """
+        Computes the rolling report entries of a chunk of stores, carrying forward the unchanged ones.
+
+        Args:
+            report_id (str): The ID of the report.
+            current_timestamp (datetime.datetime): The end of the report windows.
+            store_ids (list of int): The IDs of the stores in the chunk.
+            previous_report_id (str): The ID of the previous rolling report, or None.
+            previous_timestamp (datetime.datetime): The end of the previous report's windows.
+            changed (set of int): The stores changed since the previous report, or None when every
+                store has to be recomputed.
+
+        Returns:
+            list of dict: One ReportEntry column mapping per store.
+        """
+        store_ids = sorted(store_ids)
+        rows = []
+        elapsed = to_epoch(current_timestamp) - to_epoch(previous_timestamp) if previous_timestamp else None
+        if previous_report_id is not None and changed is not None and 0 <= elapsed <= HOUR:
+            previous = RollingReport.previous_seconds(previous_report_id, store_ids)
+            unchanged = [store_id for store_id in store_ids if store_id in previous and store_id not in changed]
+            if unchanged:
+                rows = RollingReport.carry_forward(report_id, current_timestamp, previous_timestamp, unchanged,
+                                                   previous)
+
+        carried = {row['store_id'] for row in rows}
+        recomputed = [store_id for store_id in store_ids if store_id not in carried]
+        if recomputed:
+            rows.extend(UptimeEngine(current_timestamp, recomputed).load().report_rows(report_id))
+        log.info("Carried forward %d and recomputed %d stores of rolling report %s", len(carried), len(recomputed),
+                 report_id)
+        return rows
+
+    @staticmethod
+    def prune(keep):
+        """
+        Deletes the finished rolling reports older than the latest completed ones, and the changes they
+        all account for.
+
+        Args:
+            keep (int): The number of completed rolling reports to keep.
+
+        Returns:
+            int: The number of deleted reports.
+        """
+        kept = db.session.query(ReportTask.report_id, ReportTask.change_watermark).filter(
+            ReportTask.rolling.is_(True), ReportTask.status == "Complete").order_by(
+            ReportTask.timestamp.desc(), ReportTask.id.desc()).limit(keep).all()
+        if not kept:
+            return 0
+
+        stale = [report_id for report_id, in db.session.query(ReportTask.report_id).filter(
+            ReportTask.rolling.is_(True), ReportTask.status.in_(("Complete", "Failed")),
+            ReportTask.report_id.notin_([report_id for report_id, _ in kept]))]
+        ReportUtils.delete_reports(stale)
+
+        watermark = min(change_watermark or 0 for _, change_watermark in kept)
+        db.session.execute(StoreChange.__table__.delete().where(StoreChange.id <= watermark))
+        db.session.commit()
+        return len(stale)
+
+    @staticmethod
+    def run(now=None, full=False):
+        """
+        Generates the rolling report of the current period, unless it is up to date.
+
+        Args:
+            now (datetime.datetime): The current time. Defaults to the current UTC time.
+            full (bool): Recompute every store instead of carrying entries forward.
+
+        Returns:
+            str: The ID of the rolling report, or None when it failed.
+        """
+        minutes = app.config['REPORT_ROLLING_MINUTES'] or 1
+        current_timestamp = RollingReport.period_start(now or datetime.datetime.utcnow(), minutes)
+
+        previous = None if full else ReportUtils.latest_report(rolling=True)
+        watermark, changed = RollingReport.changes(previous)
+        if previous is not None and previous.timestamp == current_timestamp and changed == set():
+            log.info("Rolling report %s is up to date", previous.report_id)
+            return previous.report_id
+
+        report_id = ''.join(random.choice('0123456789abcdef') for _ in range(8))
+        store_ids = db.session.execute(select(TimeZone.store_id).distinct()).scalars().all()
+        compute = partial(RollingReport.report_rows,
+                          previous_report_id=previous.report_id if previous is not None else None,
+                          previous_timestamp=previous.timestamp if previous is not None else None,
+                          changed=changed)
+        log.info("Generating rolling report %s at %s, after %s", report_id, current_timestamp,
+                 previous.report_id if previous is not None else "no previous report")
+
+        db.session.add(ReportTask(report_id=report_id, status="Running", rolling=True, change_watermark=watermark,
+                                  stores_total=len(store_ids), timestamp=current_timestamp))
+        db.session.commit()
+
+        try:
+            for chunk in ReportUtils.plan_chunks(report_id, store_ids):
+                ReportUtils.generate_report_chunk(report_id, current_timestamp, chunk, compute=compute)
+        except Exception as e:
+            log.error("Rolling report %s failed: %s", report_id, str(e))
+            return None
+
+        ReportUtils.complete_report(report_id)
+        RollingReport.prune(app.config['REPORT_ROLLING_KEEP'])
+        return report_id
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate the rolling report of the current period.")
+    parser.add_argument('--full', action='store_true', help="recompute every store")
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        report_id = RollingReport.run(full=args.full)
+        log.info("Rolling report: %s", report_id)
+
+
+if __name__ == '__main__':
+    main()
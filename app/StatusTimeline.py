@@ -0,0 +1,322 @@
+import json
+import os
+import threading
+
+import numpy as np
+from sqlalchemy import func, select
+
+from app import app
+from app import db
+from app.log import log
+from app.models import IngestWatermark, StoreStatus, StoreStatusInterval, status_is_active
+
+MAGIC = b"STLINE01"
+# Arrays start on 64-byte boundaries, so the memory-mapped views are aligned
+ALIGNMENT = 64
+# Rows fetched per round trip while building
+BUILD_BATCH_SIZE = 1_000_000
+
+
+def status_version():
+    """
+    Returns the version of the raw status polls: their ingestion watermark, which changes whenever
+    polls are loaded or appended, and the end of the compacted runs, which changes whenever old
+    polls are compacted away.
+    """
+    watermark = db.session.execute(select(IngestWatermark.file_offset, IngestWatermark.checksum,
+                                          IngestWatermark.last_timestamp)
+                                   .where(IngestWatermark.source == 'store_status')).first()
+    if watermark is None:
+        return None
+    compacted_until = db.session.query(func.max(StoreStatusInterval.end)).scalar()
+    return f"{watermark.file_offset}:{watermark.checksum}:{watermark.last_timestamp}:{compacted_until}"
+
+
+class StatusTimeline:
+    """
+    Compact, array-backed timeline of every store's status polls.
+
+    Polls are held in CSR layout: ``store_ids`` lists the stores in ascending order, and the polls of
+    the store at position i are ``timestamps[offsets[i]:offsets[i + 1]]`` (int64 epoch seconds,
+    ascending) with their ``active`` flags (uint8). That is 9 bytes per poll instead of a row or ORM
+    object.
+
+    The timeline is built from the database after a full load, or merged with the appended polls after
+    an incremental one, and saved as a binary snapshot that workers memory-map: loading only maps the
+    file and creates array views over it, so a warm start takes milliseconds and the pages are shared
+    between worker processes. The snapshot records the
+    status ingestion watermark it was built from, and is ignored once newer polls are ingested or old
+    ones compacted. Compacted runs (StoreStatusInterval) are not part of the timeline.
+
+    Attributes:
+        store_ids (numpy.ndarray): Sorted store IDs (int64).
+        offsets (numpy.ndarray): Start of each store's polls, plus the total (int64).
+        timestamps (numpy.ndarray): Poll times in epoch seconds (int64).
+        active (numpy.ndarray): 1 for active polls, 0 for inactive ones (uint8).
+        version (str): The status ingestion watermark the timeline was built from.
+    """
+
+    ARRAYS = ("store_ids", "offsets", "timestamps", "active")
+
+    _cache = None
+    _cache_key = None
+    _cache_lock = threading.Lock()
+
+    def __init__(self, store_ids, offsets, timestamps, active, version=None):
+        self.store_ids = store_ids
+        self.offsets = offsets
+        self.timestamps = timestamps
+        self.active = active
+        self.version = version
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in StatusTimeline.ARRAYS)
+
+    @staticmethod
+    def build():
+        """
+        Builds the timeline from the StoreStatus table.
+
+        Returns:
+            StatusTimeline: The timeline.
+        """
+        version = status_version()
+        query = select(StoreStatus.store_id, StoreStatus.timestamp, status_is_active())
+
+        store_parts, time_parts, active_parts = [], [], []
+        result = db.session.execute(query.execution_options(stream_results=True))
+        for rows in result.partitions(BUILD_BATCH_SIZE):
+            raw_store_ids, timestamps, active = zip(*rows)
+            store_parts.append(np.asarray(raw_store_ids, dtype=np.int64))
+            time_parts.append(np.asarray(timestamps, dtype='datetime64[s]').astype(np.int64))
+            active_parts.append(np.asarray(active, dtype=np.uint8))
+
+        raw_store_ids = np.concatenate(store_parts) if store_parts else np.empty(0, dtype=np.int64)
+        timestamps = np.concatenate(time_parts) if time_parts else np.empty(0, dtype=np.int64)
+        active = np.concatenate(active_parts) if active_parts else np.empty(0, dtype=np.uint8)
+
+        order = np.lexsort((timestamps, raw_store_ids))
+        raw_store_ids, timestamps, active = raw_store_ids[order], timestamps[order], active[order]
+        store_ids, starts = np.unique(raw_store_ids, return_index=True)
+        offsets = np.append(starts, len(timestamps)).astype(np.int64)
+
+        log.info("Built status timeline of %d polls for %d stores", len(timestamps), len(store_ids))
+        return StatusTimeline(store_ids, offsets, timestamps, active, version)
+
+    def save(self, path):
+        """
+        Writes the timeline as a binary snapshot: the magic bytes, the length of a JSON header, the
+        header (version and the dtype, offset and length of each array), then the aligned arrays. The
+        file is written under a temporary name and renamed into place, so readers never map a partial
+        snapshot.
+
+        Args:
+            path (str): The snapshot path.
+        """
+        layout, position = {}, 0
+        for name in StatusTimeline.ARRAYS:
+            array = getattr(self, name)
+            layout[name] = {"dtype": array.dtype.str, "length": len(array), "offset": position}
+            position += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+        header = json.dumps({"version": self.version, "arrays": layout}).encode()
+        data_start = -(-(len(MAGIC) + 8 + len(header)) // ALIGNMENT) * ALIGNMENT
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as snapshot:
+            snapshot.write(MAGIC)
+            snapshot.write(len(header).to_bytes(8, "little"))
+            snapshot.write(header)
+            for name in StatusTimeline.ARRAYS:
+                snapshot.seek(data_start + layout[name]["offset"])
+                snapshot.write(np.ascontiguousarray(getattr(self, name)).tobytes())
+            snapshot.truncate(data_start + position)
+        os.replace(tmp_path, path)
+        log.info("Saved status timeline snapshot %s (%d bytes)", path, data_start + position)
+
+    @staticmethod
+    def load(path):
+        """
+        Memory-maps a snapshot. The arrays are read-only views over the mapped file.
+
+        Args:
+            path (str): The snapshot path.
+
+        Returns:
+            StatusTimeline: The timeline.
+
+        Raises:
+            ValueError: If the file is not a status timeline snapshot.
+        """
+        buffer = np.memmap(path, dtype=np.uint8, mode="r")
+        if bytes(buffer[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"Not a status timeline snapshot: {path}")
+        header_length = int.from_bytes(bytes(buffer[len(MAGIC):len(MAGIC) + 8]), "little")
+        header_start = len(MAGIC) + 8
+        header = json.loads(bytes(buffer[header_start:header_start + header_length]))
+        data_start = -(-(header_start + header_length) // ALIGNMENT) * ALIGNMENT
+
+        arrays = {}
+        for name in StatusTimeline.ARRAYS:
+            spec = header["arrays"][name]
+            dtype = np.dtype(spec["dtype"])
+            start = data_start + spec["offset"]
+            arrays[name] = buffer[start:start + spec["length"] * dtype.itemsize].view(dtype)
+        return StatusTimeline(version=header["version"], **arrays)
+
+    @staticmethod
+    def current():
+        """
+        Returns the snapshot timeline if it matches the ingested polls, else None.
+
+        The mapped snapshot is cached per process and mapped again when the file is replaced.
+
+        Returns:
+            StatusTimeline: The timeline, or None.
+        """
+        if not app.config['STATUS_TIMELINE_ENABLED']:
+            return None
+        path = app.config['STATUS_TIMELINE_PATH']
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+
+        key = (path, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with StatusTimeline._cache_lock:
+            if StatusTimeline._cache_key != key:
+                try:
+                    StatusTimeline._cache = StatusTimeline.load(path)
+                except (OSError, ValueError, KeyError) as e:
+                    log.warning("Ignoring status timeline snapshot %s: %s", path, str(e))
+                    StatusTimeline._cache = None
+                StatusTimeline._cache_key = key
+            timeline = StatusTimeline._cache
+
+        if timeline is None or timeline.version != status_version():
+            return None
+        return timeline
+
+    def merge_appended(self, last_id):
+        """
+        Merges the StoreStatus rows appended after a row ID into a copy of the timeline. Each new poll
+        is inserted after the polls of its store with an earlier or equal timestamp, so only the new
+        rows are read from the database.
+
+        Args:
+            last_id (int): The ID of the last StoreStatus row already held by the timeline.
+
+        Returns:
+            StatusTimeline: The timeline of the ingested polls.
+        """
+        version = status_version()
+        rows = db.session.execute(select(StoreStatus.store_id, StoreStatus.timestamp, status_is_active())
+                                  .where(StoreStatus.id > last_id)).all()
+        if not rows:
+            return StatusTimeline(self.store_ids, self.offsets, self.timestamps, self.active, version)
+
+        raw_store_ids, timestamps, active = zip(*rows)
+        new_store_ids = np.asarray(raw_store_ids, dtype=np.int64)
+        new_times = np.asarray(timestamps, dtype='datetime64[s]').astype(np.int64)
+        new_active = np.asarray(active, dtype=np.uint8)
+        order = np.lexsort((new_times, new_store_ids))
+        new_store_ids, new_times, new_active = new_store_ids[order], new_times[order], new_active[order]
+
+        # Position of each new poll in the current arrays: after the polls of its store up to its time,
+        # or where its store would start for a store not in the timeline yet
+        appended_ids, starts, counts = np.unique(new_store_ids, return_index=True, return_counts=True)
+        positions = np.searchsorted(self.store_ids, appended_ids)
+        insert_at = np.empty(len(new_times), dtype=np.int64)
+        for i, position in enumerate(positions.tolist()):
+            lo = int(self.offsets[position])
+            store_polls = slice(starts[i], starts[i] + counts[i])
+            if position < len(self.store_ids) and self.store_ids[position] == appended_ids[i]:
+                store_times = self.timestamps[lo:int(self.offsets[position + 1])]
+                insert_at[store_polls] = lo + np.searchsorted(store_times, new_times[store_polls], side="right")
+            else:
+                insert_at[store_polls] = lo
+
+        store_ids = np.union1d(self.store_ids, appended_ids)
+        poll_counts = np.zeros(len(store_ids), dtype=np.int64)
+        poll_counts[np.searchsorted(store_ids, self.store_ids)] += np.diff(self.offsets)
+        poll_counts[np.searchsorted(store_ids, appended_ids)] += counts
+        offsets = np.concatenate(([0], np.cumsum(poll_counts))).astype(np.int64)
+
+        log.info("Merged %d appended polls of %d stores into the status timeline", len(new_times), len(appended_ids))
+        return StatusTimeline(store_ids, offsets, np.insert(self.timestamps, insert_at, new_times),
+                              np.insert(self.active, insert_at, new_active), version)
+
+    @staticmethod
+    def refresh(previous=None, last_id=None):
+        """
+        Brings the snapshot up to date with the ingested polls, unless it already is. When the polls
+        were appended to those of an up-to-date timeline, the appended rows are merged into it;
+        otherwise the timeline is rebuilt from the database.
+
+        Args:
+            previous (StatusTimeline): The current timeline before the polls were appended.
+            last_id (int): The ID of the last StoreStatus row before the polls were appended.
+
+        Returns:
+            bool: True when the snapshot was written.
+        """
+        if not app.config['STATUS_TIMELINE_ENABLED'] or StatusTimeline.current() is not None:
+            return False
+        if previous is not None and last_id is not None:
+            timeline = previous.merge_appended(last_id)
+        else:
+            timeline = StatusTimeline.build()
+        timeline.save(app.config['STATUS_TIMELINE_PATH'])
+        return True
+
+    def polls(self, store_ids, start, end, previous=False, following=None):
+        """
+        Returns the polls of some stores within a time range, in the layout of UptimeEngine.load_polls.
+
+        Args:
+            store_ids (numpy.ndarray): Sorted, unique store IDs.
+            start (int): Epoch seconds of the range start (inclusive).
+            end (int): Epoch seconds of the range end (inclusive).
+            previous (bool): Also return the last poll of each store before the range start.
+            following (int): Also return the first poll of each store after the range end, if it is
+                at most this epoch timestamp.
+
+        Returns:
+            tuple: Indexes into store_ids, epoch timestamps and active flags, sorted by store and time.
+        """
+        if not len(self.store_ids):
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, np.empty(0, dtype=np.uint8)
+        positions = np.minimum(np.searchsorted(self.store_ids, store_ids), len(self.store_ids) - 1)
+        store_index = np.flatnonzero(self.store_ids[positions] == store_ids)
+        firsts = np.empty(len(store_index), dtype=np.int64)
+        lasts = np.empty(len(store_index), dtype=np.int64)
+        for i, position in enumerate(positions[store_index].tolist()):
+            lo, hi = int(self.offsets[position]), int(self.offsets[position + 1])
+            store_times = self.timestamps[lo:hi]
+            firsts[i] = lo + np.searchsorted(store_times, start, side="left")
+            lasts[i] = lo + np.searchsorted(store_times, end, side="right")
+            if previous and firsts[i] > lo:
+                firsts[i] -= 1
+            if following is not None and lasts[i] < hi and store_times[lasts[i] - lo] <= following:
+                lasts[i] += 1
+
+        lengths = lasts - firsts
+        total = int(lengths.sum())
+        # Gather the selected ranges: each poll's position is its range start plus its rank within the range
+        range_starts = np.cumsum(lengths) - lengths
+        index = np.repeat(firsts - range_starts, lengths) + np.arange(total, dtype=np.int64)
+        return (np.repeat(store_index.astype(np.int64), lengths), np.asarray(self.timestamps[index]),
+                np.asarray(self.active[index]))
+
+
+def main():
+    with app.app_context():
+        timeline = StatusTimeline.build()
+        timeline.save(app.config['STATUS_TIMELINE_PATH'])
+        log.info("Status timeline holds %d polls in %d bytes", len(timeline.timestamps), timeline.nbytes)
+
+
+if __name__ == '__main__':
+    main()
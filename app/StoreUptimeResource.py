@@ -0,0 +1,159 @@
+import datetime
+
+from flask import request
+from flask_restful import Resource
+
+from app import ReportUtils
+from app.UptimeEngine import UptimeEngine
+from app.log import log
+
+# Longest range a query may cover
+MAX_RANGE = datetime.timedelta(days=31)
+# Most stores a batch query may ask for: beyond the engine's IN clause limit, the polls of every store would be read
+MAX_BATCH_STORES = UptimeEngine.MAX_IN_CLAUSE
+
+
+def parse_time(value, name):
+    """
+    Parses an ISO 8601 query timestamp into a naive UTC datetime. Timestamps without an offset are
+    taken as UTC.
+
+    Raises:
+        ValueError: If the value is missing or not ISO 8601.
+    """
+    if not value:
+        raise ValueError(f"Missing {name}")
+    try:
+        timestamp = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"Invalid {name}: {value}")
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def parse_range(args):
+    """
+    Parses and validates the start and end of a query. The end defaults to now.
+
+    Returns:
+        tuple: The start and end, as naive UTC datetimes.
+
+    Raises:
+        ValueError: If the range is missing, invalid, empty or longer than MAX_RANGE.
+    """
+    start = parse_time(args.get("start"), "start")
+    end = parse_time(args["end"], "end") if args.get("end") else datetime.datetime.utcnow()
+    if end <= start:
+        raise ValueError("end must be after start")
+    if end - start > MAX_RANGE:
+        raise ValueError(f"The range may cover at most {MAX_RANGE.days} days")
+    return start, end
+
+
+class StoreUptimeResource(Resource):
+    """
+    RESTful resource class answering the uptime of one store over an arbitrary time range.
+
+    Attributes:
+        None
+    """
+
+    def get(self, store_id):
+        """
+        Handles the GET request for the uptime of a store.
+
+        Query parameters `start` and `end` (ISO 8601, UTC unless they carry an offset; `end` defaults
+        to now) give the range, of at most 31 days.
+
+        Args:
+            store_id (int): The ID of the store.
+
+        Returns:
+            dict: {"store_id", "start", "end", "business_hours", "uptime_hours", "downtime_hours"}.
+                  If the range is invalid, returns {"error": ...} with a 400 status code.
+                  If the store is unknown, returns {"error": "Store not found"} with a 404 status code.
+                  If an error occurs, returns {"error": "An error occurred"} with a 500 status code.
+        """
+        try:
+            log.info("Received uptime request for store_id: %s", store_id)
+            start, end = parse_range(request.args)
+            if not ReportUtils.ReportUtils.known_stores([store_id]):
+                return {"error": "Store not found"}, 404
+            return ReportUtils.ReportUtils.stores_uptime([store_id], start, end)[0]
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        except Exception as e:
+            log.error("An error occurred while processing uptime request: %s", str(e))
+            return {"error": "An error occurred"}, 500
+
+
+class StoreUptimeBatchResource(Resource):
+    """
+    RESTful resource class answering the uptime of many stores over an arbitrary time range.
+
+    Attributes:
+        None
+    """
+
+    @staticmethod
+    def answer(store_ids, args):
+        """
+        Computes the uptime of the known stores among store_ids and lists the unknown ones.
+        """
+        start, end = parse_range(args)
+        if not store_ids:
+            raise ValueError("Missing store_ids")
+        if len(store_ids) > MAX_BATCH_STORES:
+            raise ValueError(f"At most {MAX_BATCH_STORES} stores may be queried at once")
+        known = ReportUtils.ReportUtils.known_stores(store_ids)
+        found = [store_id for store_id in store_ids if store_id in known]
+        stores = ReportUtils.ReportUtils.stores_uptime(found, start, end) if found else []
+        return {"stores": stores, "not_found": sorted(set(store_ids) - known)}
+
+    def get(self):
+        """
+        Handles the GET request for the uptime of many stores, given as a comma-separated `store_ids`
+        query parameter along with `start` and `end` (see StoreUptimeResource).
+
+        Returns:
+            dict: {"stores": [per-store results], "not_found": [unknown store IDs]}.
+                  If the request is invalid, returns {"error": ...} with a 400 status code.
+                  If an error occurs, returns {"error": "An error occurred"} with a 500 status code.
+        """
+        try:
+            log.info("Received batch uptime request")
+            try:
+                store_ids = [int(value) for value in request.args.get("store_ids", "").split(",") if value.strip()]
+            except ValueError:
+                raise ValueError("store_ids must be comma-separated integers")
+            return StoreUptimeBatchResource.answer(store_ids, request.args)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        except Exception as e:
+            log.error("An error occurred while processing batch uptime request: %s", str(e))
+            return {"error": "An error occurred"}, 500
+
+    def post(self):
+        """
+        Handles the POST request for the uptime of many stores, given as a JSON body
+        {"store_ids": [...], "start": ..., "end": ...}, for store lists too long for a URL.
+
+        Returns:
+            dict: {"stores": [per-store results], "not_found": [unknown store IDs]}.
+                  If the request is invalid, returns {"error": ...} with a 400 status code.
+                  If an error occurs, returns {"error": "An error occurred"} with a 500 status code.
+        """
+        try:
+            log.info("Received batch uptime request")
+            body = request.get_json(silent=True) or {}
+            try:
+                store_ids = [int(store_id) for store_id in body.get("store_ids") or []]
+            except (TypeError, ValueError):
+                raise ValueError("store_ids must be a list of integers")
+            return StoreUptimeBatchResource.answer(store_ids, body)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        except Exception as e:
+            log.error("An error occurred while processing batch uptime request: %s", str(e))
+            return {"error": "An error occurred"}, 500
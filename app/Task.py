@@ -1,38 +1,121 @@
+import datetime
+
+from celery import chord
+
 from app import app
 from app import celery
-from app import db
+from app import retention
 from app.ReportUtils import ReportUtils
+from app.RollingReport import RollingReport
 from app.log import log
-from app.models import TimeZone, ReportTask
 
 
-@celery.task()
+def as_datetime(timestamp):
+    """
+    Returns a timestamp as a datetime. Celery's JSON serializer delivers datetimes as ISO 8601 strings.
+    """
+    if isinstance(timestamp, str):
+        return datetime.datetime.fromisoformat(timestamp)
+    return timestamp
+
+
+@celery.task(acks_late=True, reject_on_worker_lost=True)
 def generate_reports_task(report_id, current_timestamp, stores_info):
     """
-    Celery task for generating and storing reports asynchronously.
+    Celery task fanning report generation out to chunk tasks.
+
+    The stores are split into chunks of REPORT_CHUNK_SIZE stores, each computed and stored by a
+    generate_report_chunk_task. The chunks run as a chord whose callback marks the report complete
+    once every chunk has finished. Chunks already stored by an earlier run of the report are skipped
+    by their tasks, so dispatching a report again resumes it.
+
+    Tasks are acknowledged once they finish, so the broker redelivers them if their worker dies.
 
     Args:
         report_id (str): The ID of the report.
-        current_timestamp (datetime.datetime): The current timestamp.
+        current_timestamp (datetime.datetime or str): The current timestamp.
         stores_info (list of dict): List of store information dictionaries.
 
     Returns:
         None
     """
     log.debug("C-task")
+    store_ids = [int(info["store_id"]) for info in stores_info]
+    with app.app_context():
+        chunks = ReportUtils.plan_chunks(report_id, store_ids)
+    log.info("Dispatching report %s as %d chunks", report_id, len(chunks))
+
+    if not chunks:
+        complete_report_task.delay(report_id)
+        return
+
+    header = [generate_report_chunk_task.s(report_id, current_timestamp, chunk) for chunk in chunks]
+    chord(header)(complete_report_task.si(report_id))
+
+
+@celery.task(bind=True, acks_late=True, reject_on_worker_lost=True, max_retries=3, default_retry_delay=10)
+def generate_report_chunk_task(self, report_id, current_timestamp, store_ids):
+    """
+    Celery task computing and bulk inserting the report entries of a chunk of stores.
+
+    A failed chunk is retried up to max_retries times before the report is marked as failed. The
+    task is acknowledged once it finishes, so a chunk whose worker died is redelivered.
+
+    Args:
+        report_id (str): The ID of the report.
+        current_timestamp (datetime.datetime or str): The current timestamp.
+        store_ids (list of int): The IDs of the stores in the chunk.
+
+    Returns:
+        int: The number of stored report entries.
+    """
+    last_attempt = self.request.retries >= self.max_retries
+    with app.app_context():
+        try:
+            return ReportUtils.generate_report_chunk(report_id, as_datetime(current_timestamp), store_ids,
+                                                     record_failure=last_attempt)
+        except Exception as e:
+            if last_attempt:
+                raise
+            log.warning("Retrying chunk of report %s: %s", report_id, str(e))
+            raise self.retry(exc=e)
+
+
+@celery.task(acks_late=True, reject_on_worker_lost=True)
+def complete_report_task(report_id):
+    """
+    Celery chord callback marking a report as complete.
+
+    Args:
+        report_id (str): The ID of the report.
+
+    Returns:
+        None
+    """
+    with app.app_context():
+        ReportUtils.complete_report(report_id)
+
+
+@celery.task()
+def maintenance_task():
+    """
+    Celery beat task running the retention policy: compacts old polls, evicts old reports and
+    vacuums the database.
+
+    Returns:
+        dict: What was compacted, expired and evicted.
+    """
+    with app.app_context():
+        return retention.run_maintenance()
+
+
+@celery.task()
+def rolling_report_task():
+    """
+    Celery beat task generating the rolling report of the current period, every REPORT_ROLLING_MINUTES.
+
+    Returns:
+        str: The ID of the rolling report, or None when it failed.
+    """
     with app.app_context():
-        # Create TimeZone objects from store information
-        stores = [TimeZone(store_id=int(info["store_id"]), timezone_str=info["timezone_str"]) for info in
-                  stores_info]
-
-        # Generate and store report data for each store
-        for store_info in stores:
-            log.debug("Processing store info: %s", store_info)
-            ReportUtils.generate_and_store_report_data(report_id, store_info, current_timestamp)
-
-        # Update the status of the ReportTask to "Complete"
-        log.debug("Updating report task status to Complete: %s", report_id)
-        report_task = ReportTask.query.filter_by(report_id=report_id).first()
-        if report_task:
-            report_task.status = "Complete"
-            db.session.commit()
+        return RollingReport.run()
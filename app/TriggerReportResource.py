@@ -1,10 +1,13 @@
 import datetime
 import random
 
+from flask import request
 from flask_restful import Resource
+from sqlalchemy.exc import IntegrityError
 
 from app import db
-from app.Task import generate_reports_task
+from app.ReportUtils import ReportUtils
+from app.executors import get_executor
 from app.log import log
 from app.models import TimeZone, ReportTask
 
@@ -14,8 +17,11 @@ class TriggerReportResource(Resource):
         """
         Handle POST request to trigger report generation.
 
+        With `profile=true`, a fresh report is generated with every chunk running under cProfile; the
+        profiles are written to the profiles directory of the reports directory.
+
         Returns:
-            dict: A dictionary containing the generated report ID or an error message.
+            dict: A dictionary containing the generated (or reused) report ID or an error message.
         """
         try:
             log.info("Request received")
@@ -24,6 +30,16 @@ class TriggerReportResource(Resource):
             current_timestamp = datetime.datetime.utcnow()
             log.debug("Current time: %s", current_timestamp)
 
+            profile = request.args.get("profile", "").lower() in ("1", "true", "yes")
+
+            # Reuse a running or completed report over the same data and time bucket, unless profiling
+            fingerprint = None if profile else ReportUtils.report_fingerprint(current_timestamp)
+            if fingerprint is not None:
+                existing = ReportUtils.find_reusable_report(fingerprint)
+                if existing is not None:
+                    log.info("Reusing report %s", existing.report_id)
+                    return {"report_id": existing.report_id}
+
             # Generate a random report ID for
             report_id = ''.join(random.choice('0123456789abcdef') for _ in range(8))
             log.debug("Report ID: %s", report_id)
@@ -34,14 +50,30 @@ class TriggerReportResource(Resource):
             # Extract relevant information from the TimeZone objects
             stores_info = [{"store_id": store.store_id, "timezone_str": store.timezone_str} for store in stores]
 
-            log.info("Generating report....!")
-            # Generate a report for each store asynchronously
-            generate_reports_task.apply_async(args=(report_id, current_timestamp, stores_info))
-
-            # Store the status as "Running" in the database
-            report_task = ReportTask(report_id=report_id, status="Running")
+            # Store the status as "Running" in the database before any chunk can complete the report
+            report_task = ReportTask(report_id=report_id, status="Running", fingerprint=fingerprint, profile=profile,
+                                     stores_total=len(stores_info), timestamp=current_timestamp)
             db.session.add(report_task)
-            db.session.commit()
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # A concurrent trigger registered the same fingerprint first
+                db.session.rollback()
+                existing = ReportUtils.find_reusable_report(fingerprint) if fingerprint is not None else None
+                if existing is None:
+                    raise
+                log.info("Reusing report %s", existing.report_id)
+                return {"report_id": existing.report_id}
+
+            log.info("Generating report....!")
+            # Generate a report for each store asynchronously, on the configured executor
+            try:
+                get_executor().submit(report_id, current_timestamp, stores_info)
+            except Exception as e:
+                # Nothing will complete the report, so fail it and release its fingerprint
+                db.session.rollback()
+                ReportUtils.fail_report(report_id, str(e))
+                raise
 
             return {"report_id": report_id}
         except Exception as e:
@@ -0,0 +1,506 @@
+import datetime
+from collections import defaultdict
+
+import numpy as np
+from sqlalchemy import and_, func, select
+
+from app import app
+from app import db
+from app import ReportMetrics
+from app.BusinessCalendar import BusinessCalendar
+from app.StatusTimeline import StatusTimeline
+from app.log import log
+from app.models import MenuHours, StoreStatus, StoreStatusInterval, TimeZone, status_is_active
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def to_epoch(timestamp):
+    """
+    Converts a naive UTC datetime to integer epoch seconds.
+
+    Args:
+        timestamp (datetime.datetime): The naive UTC timestamp.
+
+    Returns:
+        int: Seconds since the Unix epoch.
+    """
+    return int((timestamp - EPOCH).total_seconds())
+
+
+class UptimeEngine:
+    """
+    Vectorized uptime/downtime engine computing report windows for many stores in one pass.
+
+    Status polls and business hours are loaded once, in bulk, into sorted NumPy arrays. Every
+    store gets its own block on a single composite time axis (``store_index * span + offset``),
+    so the status and business-hour step functions of all stores can be merged, integrated and
+    queried with a handful of array operations instead of per-store ORM loops.
+
+    Polls are interpolated by nearest neighbour: the status observed by a poll holds until halfway
+    to the next poll of the same store, and the last poll's status extends up to the current
+    timestamp. Along with the polls in the loaded range, the last poll of each store before the
+    range is loaded, so a window's status does not depend on how far back the engine loads. Only
+    stores that were never polled before the current timestamp are treated as inactive. Business
+    hours are local to each store's time zone and converted to UTC by the BusinessCalendar.
+
+    Attributes:
+        REPORT_WINDOWS (tuple): The (hour, day, week) windows of a report.
+        POLL_MARGIN (datetime.timedelta): Extra history loaded before the oldest window so its
+            first minutes can be interpolated from earlier polls.
+    """
+
+    REPORT_WINDOWS = (
+        datetime.timedelta(hours=1),
+        datetime.timedelta(days=1),
+        datetime.timedelta(weeks=1),
+    )
+    POLL_MARGIN = datetime.timedelta(hours=2)
+
+    # Above this many stores the bulk loads scan the whole time range and filter in NumPy,
+    # instead of binding every store ID into an IN clause.
+    MAX_IN_CLAUSE = 500
+
+    def __init__(self, current_timestamp, store_ids, lookback=None, lookahead=None):
+        """
+        Args:
+            current_timestamp (datetime.datetime): The end of every computed window (naive UTC).
+            store_ids (list of int): The stores to compute.
+            lookback (datetime.timedelta): The longest window to be computed. Defaults to the
+                longest report window.
+            lookahead (datetime.timedelta): Also load each store's first poll within this long after
+                the current timestamp, so the status up to it is interpolated like an engine ending
+                that much later would. Defaults to none.
+        """
+        lookback = lookback or max(UptimeEngine.REPORT_WINDOWS)
+        self.current_timestamp = current_timestamp
+        self.store_ids = np.unique(np.asarray(store_ids, dtype=np.int64))
+        self.horizon = to_epoch(current_timestamp)
+        self.origin = to_epoch(current_timestamp - lookback - UptimeEngine.POLL_MARGIN)
+        self.span = self.horizon - self.origin + 1
+        self.until = self.horizon + int(lookahead.total_seconds()) if lookahead else self.horizon
+
+        self.polls = None
+        self.schedules = None
+        self._edges = None
+        self._cum_business = None
+        self._cum_uptime = None
+        self._rate_business = None
+        self._rate_uptime = None
+        self._report = None
+
+    def store_filter(self, column):
+        """
+        Returns the SQL filter restricting a bulk load to this engine's stores, or None when the
+        store set is too large for an IN clause and has to be filtered after loading.
+        """
+        if len(self.store_ids) <= UptimeEngine.MAX_IN_CLAUSE:
+            return column.in_(self.store_ids.tolist())
+        return None
+
+    def index_stores(self, raw_store_ids):
+        """
+        Maps raw store IDs to their index in ``self.store_ids``.
+
+        Returns:
+            tuple: The indexes and a mask of the IDs that belong to this engine.
+        """
+        if not len(self.store_ids):
+            return np.zeros(len(raw_store_ids), dtype=np.int64), np.zeros(len(raw_store_ids), dtype=bool)
+        index = np.searchsorted(self.store_ids, raw_store_ids)
+        index = np.minimum(index, len(self.store_ids) - 1)
+        mask = self.store_ids[index] == raw_store_ids
+        return index, mask
+
+    def load_polls(self):
+        """
+        Bulk loads the status polls of the engine's stores within the loaded time range, and the last
+        poll of each store before it, including the runs of polls compacted into StoreStatusInterval.
+
+        Returns:
+            tuple: Store indexes, epoch timestamps and active flags, sorted by store and time.
+        """
+        polls = self.load_raw_polls()
+        compacted = self.load_compacted_polls()
+        if compacted is None:
+            return polls
+
+        store_index, timestamps, active = (np.concatenate(arrays) for arrays in zip(polls, compacted))
+        order = np.lexsort((timestamps, store_index))
+        return store_index[order], timestamps[order], active[order]
+
+    def nearest_query(self, model, column, condition, extreme, columns):
+        """
+        Builds the query of the row of each of the engine's stores with the extreme value of a column,
+        among the rows matching a condition.
+
+        Args:
+            model: The model, StoreStatus or StoreStatusInterval.
+            column: The time column to take the extreme of.
+            condition: The filter on the rows.
+            extreme: func.max or func.min.
+            columns (tuple): The selected columns.
+
+        Returns:
+            sqlalchemy.sql.Select: The query.
+        """
+        nearest = select(model.store_id, extreme(column).label("timestamp")).where(condition)
+        store_filter = self.store_filter(model.store_id)
+        if store_filter is not None:
+            nearest = nearest.where(store_filter)
+        nearest = nearest.group_by(model.store_id).subquery()
+        return select(*columns).join(
+            nearest, and_(model.store_id == nearest.c.store_id, column == nearest.c.timestamp))
+
+    def load_compacted_polls(self):
+        """
+        Loads the compacted runs of polls overlapping the loaded time range. Each run becomes a poll at
+        its first and last timestamp, clipped to the range, which interpolates exactly like the polls
+        it replaced. The last run of each store ending before the range becomes a poll at its end and,
+        with a lookahead, the first run starting after the range a poll at its start.
+
+        Returns:
+            tuple: Store indexes, epoch timestamps and active flags, or None when no poll was
+            compacted.
+        """
+        compacted_until = db.session.query(func.max(StoreStatusInterval.end)).scalar()
+        if compacted_until is None:
+            return None
+
+        origin = EPOCH + datetime.timedelta(seconds=self.origin)
+        # Timestamps are truncated to whole seconds, like the polls of the StatusTimeline snapshot
+        after_horizon = EPOCH + datetime.timedelta(seconds=self.horizon + 1)
+        query = select(StoreStatusInterval.store_id, StoreStatusInterval.start, StoreStatusInterval.end,
+                       StoreStatusInterval.active).where(
+            StoreStatusInterval.end >= origin,
+            StoreStatusInterval.start < after_horizon,
+        )
+        store_filter = self.store_filter(StoreStatusInterval.store_id)
+        if store_filter is not None:
+            query = query.where(store_filter)
+        rows = db.session.execute(query).all()
+
+        nearest_rows = db.session.execute(self.nearest_query(
+            StoreStatusInterval, StoreStatusInterval.end, StoreStatusInterval.end < origin, func.max,
+            (StoreStatusInterval.store_id, StoreStatusInterval.end, StoreStatusInterval.active))).all()
+        if self.until > self.horizon:
+            nearest_rows += db.session.execute(self.nearest_query(
+                StoreStatusInterval, StoreStatusInterval.start,
+                and_(StoreStatusInterval.start >= after_horizon,
+                     StoreStatusInterval.start < EPOCH + datetime.timedelta(seconds=self.until + 1)),
+                func.min, (StoreStatusInterval.store_id, StoreStatusInterval.start, StoreStatusInterval.active))).all()
+        if not rows and not nearest_rows:
+            return None
+
+        store_parts, time_parts, active_parts = [], [], []
+        if rows:
+            raw_store_ids, starts, ends, active = zip(*rows)
+            store_index, mask = self.index_stores(np.asarray(raw_store_ids, dtype=np.int64))
+            starts = np.clip(np.asarray(starts, dtype='datetime64[s]').astype(np.int64), self.origin, self.horizon)
+            ends = np.clip(np.asarray(ends, dtype='datetime64[s]').astype(np.int64), self.origin, self.horizon)
+            active = np.asarray(active, dtype=np.uint8)
+            store_index, starts, ends, active = store_index[mask], starts[mask], ends[mask], active[mask]
+
+            # Runs of a single poll, or clipped to one instant, only need one poll
+            distinct = ends > starts
+            store_parts += [store_index, store_index[distinct]]
+            time_parts += [starts, ends[distinct]]
+            active_parts += [active, active[distinct]]
+        if nearest_rows:
+            raw_store_ids, timestamps, active = zip(*nearest_rows)
+            store_index, mask = self.index_stores(np.asarray(raw_store_ids, dtype=np.int64))
+            store_parts.append(store_index[mask])
+            time_parts.append(np.asarray(timestamps, dtype='datetime64[s]').astype(np.int64)[mask])
+            active_parts.append(np.asarray(active, dtype=np.uint8)[mask])
+        return np.concatenate(store_parts), np.concatenate(time_parts), np.concatenate(active_parts)
+
+    def load_raw_polls(self):
+        """
+        Bulk loads the status polls of the engine's stores within the loaded time range, the last
+        poll of each store before it and, with a lookahead, the first poll after it, from the
+        memory-mapped StatusTimeline snapshot when it is up to date, else from the database.
+
+        Returns:
+            tuple: Store indexes, epoch timestamps and active flags, sorted by store and time.
+        """
+        timeline = StatusTimeline.current()
+        if timeline is not None:
+            return timeline.polls(self.store_ids, self.origin, self.horizon, previous=True,
+                                  following=self.until if self.until > self.horizon else None)
+
+        columns = (StoreStatus.store_id, StoreStatus.timestamp, status_is_active())
+        origin = EPOCH + datetime.timedelta(seconds=self.origin)
+        after_horizon = EPOCH + datetime.timedelta(seconds=self.horizon + 1)
+        query = select(*columns).where(StoreStatus.timestamp >= origin, StoreStatus.timestamp < after_horizon)
+        store_filter = self.store_filter(StoreStatus.store_id)
+        if store_filter is not None:
+            query = query.where(store_filter)
+
+        rows = db.session.execute(query).all()
+        rows += db.session.execute(self.nearest_query(
+            StoreStatus, StoreStatus.timestamp, StoreStatus.timestamp < origin, func.max, columns)).all()
+        if self.until > self.horizon:
+            rows += db.session.execute(self.nearest_query(
+                StoreStatus, StoreStatus.timestamp,
+                and_(StoreStatus.timestamp >= after_horizon,
+                     StoreStatus.timestamp < EPOCH + datetime.timedelta(seconds=self.until + 1)),
+                func.min, columns)).all()
+        log.debug("Loaded %d status polls", len(rows))
+        if not rows:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, np.empty(0, dtype=np.uint8)
+
+        raw_store_ids, timestamps, active = zip(*rows)
+        store_index, mask = self.index_stores(np.asarray(raw_store_ids, dtype=np.int64))
+        timestamps = np.asarray(timestamps, dtype='datetime64[s]').astype(np.int64)
+        active = np.asarray(active, dtype=np.uint8)
+
+        store_index, timestamps, active = store_index[mask], timestamps[mask], active[mask]
+        order = np.lexsort((timestamps, store_index))
+        return store_index[order], timestamps[order], active[order]
+
+    def load_schedules(self):
+        """
+        Bulk loads the weekly business hours and time zones of the engine's stores.
+
+        Returns:
+            dict: Store ID -> (time zone or None, sorted (day, start seconds, end seconds) local shifts).
+        """
+        query = select(MenuHours.store_id, MenuHours.day, MenuHours.start_time_local, MenuHours.end_time_local)
+        store_filter = self.store_filter(MenuHours.store_id)
+        if store_filter is not None:
+            query = query.where(store_filter)
+        schedules = defaultdict(list)
+        for store_id, day, start_time, end_time in db.session.execute(query):
+            schedules[store_id].append((day, start_time.hour * 3600 + start_time.minute * 60 + start_time.second,
+                                        end_time.hour * 3600 + end_time.minute * 60 + end_time.second))
+
+        query = select(TimeZone.store_id, TimeZone.timezone_str)
+        store_filter = self.store_filter(TimeZone.store_id)
+        if store_filter is not None:
+            query = query.where(store_filter)
+        timezones = dict(db.session.execute(query).all())
+
+        return {store_id: (timezones.get(store_id), tuple(sorted(set(schedules.get(store_id, ())))))
+                for store_id in self.store_ids.tolist()}
+
+    def load_business_intervals(self, schedules=None):
+        """
+        Expands the weekly business hours of the engine's stores into absolute UTC intervals covering
+        the loaded time range. Stores sharing a time zone and schedule share their intervals.
+
+        Args:
+            schedules (dict): The schedules of the stores, as returned by load_schedules. Loaded when
+                None; engines over the same stores can share them.
+
+        Returns:
+            tuple: Store indexes, interval starts and interval ends (epoch seconds).
+        """
+        if schedules is None:
+            schedules = self.load_schedules()
+
+        calendar = BusinessCalendar(app.config['DEFAULT_TIMEZONE'])
+        expanded = {}
+        interval_stores, interval_starts, interval_ends = [], [], []
+        for index, store_id in enumerate(self.store_ids.tolist()):
+            key = schedules.get(store_id, (None, ()))
+            if key not in expanded:
+                expanded[key] = calendar.intervals(key[0], key[1], self.origin, self.horizon)
+            starts, ends = expanded[key]
+            interval_stores.append(np.full(len(starts), index, dtype=np.int64))
+            interval_starts.append(starts)
+            interval_ends.append(ends)
+
+        if not interval_stores:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty
+        return np.concatenate(interval_stores), np.concatenate(interval_starts), np.concatenate(interval_ends)
+
+    def _key(self, store_index, timestamps):
+        """
+        Places epoch timestamps on the composite time axis of their store.
+        """
+        return store_index * self.span + (np.clip(timestamps, self.origin, self.horizon) - self.origin)
+
+    def load(self, schedules=None):
+        """
+        Loads polls and business hours and builds the cumulative business-time and uptime
+        functions of every store. The loaded polls and schedules are kept in ``self.polls`` and
+        ``self.schedules``.
+
+        Args:
+            schedules (dict): Already loaded schedules of the stores (see load_schedules).
+
+        Returns:
+            UptimeEngine: The engine itself, for chaining.
+        """
+        log.info("Loading uptime engine for %d stores", len(self.store_ids))
+        with ReportMetrics.stage("load"):
+            self.polls = self.load_polls()
+            self.schedules = schedules if schedules is not None else self.load_schedules()
+            interval_stores, interval_starts, interval_ends = self.load_business_intervals(self.schedules)
+        ReportMetrics.count_rows("polls", len(self.polls[1]))
+        self.build(*self.polls, interval_stores, interval_starts, interval_ends)
+        return self
+
+    def build(self, poll_stores, poll_times, poll_active, interval_stores, interval_starts, interval_ends):
+        """
+        Builds the cumulative step functions from already loaded arrays.
+
+        Args:
+            poll_stores (numpy.ndarray): Store index of each poll, sorted by store and time.
+            poll_times (numpy.ndarray): Epoch seconds of each poll.
+            poll_active (numpy.ndarray): 1 where the poll observed the store as active.
+            interval_stores (numpy.ndarray): Store index of each business interval.
+            interval_starts (numpy.ndarray): Epoch start of each business interval.
+            interval_ends (numpy.ndarray): Epoch end of each business interval.
+        """
+        n_stores = len(self.store_ids)
+        block_starts = np.arange(n_stores, dtype=np.int64) * self.span
+
+        # Status step function: the first poll of a store holds from the start of its block, every
+        # later poll takes over halfway between itself and the previous poll. Switches outside the
+        # loaded range, to or from polls before or after it, are clipped to the block.
+        first_poll = np.ones(len(poll_stores), dtype=bool)
+        first_poll[1:] = poll_stores[1:] != poll_stores[:-1]
+        switch_times = poll_times.copy()
+        switch_times[1:] = (poll_times[1:] + poll_times[:-1]) // 2
+        status_keys = self._key(poll_stores, switch_times)
+        status_keys[first_poll] = block_starts[poll_stores[first_poll]]
+
+        # Stores never polled before the current timestamp are inactive
+        silent_stores = np.setdiff1d(np.arange(n_stores), poll_stores)
+        status_keys = np.concatenate((status_keys, block_starts[silent_stores]))
+        status_values = np.concatenate((poll_active, np.zeros(len(silent_stores), dtype=np.uint8)))
+        order = np.argsort(status_keys, kind='stable')
+        status_keys, status_values = status_keys[order], status_values[order]
+
+        # Business step function: +1 when an interval opens, -1 when it closes
+        business_keys = np.concatenate((self._key(interval_stores, interval_starts),
+                                        self._key(interval_stores, interval_ends)))
+        business_deltas = np.concatenate((np.ones(len(interval_starts), dtype=np.int64),
+                                          -np.ones(len(interval_ends), dtype=np.int64)))
+        order = np.argsort(business_keys, kind='stable')
+        business_keys = business_keys[order]
+        business_levels = np.cumsum(business_deltas[order])
+
+        # Merge both functions into elementary segments on which they are constant
+        edges = np.unique(np.concatenate((block_starts, status_keys, business_keys)))
+        status_at = np.searchsorted(status_keys, edges, side='right') - 1
+        active = status_values[status_at].astype(np.int64)
+        business_at = np.searchsorted(business_keys, edges, side='right') - 1
+        open_ = np.zeros(len(edges), dtype=np.int64)
+        valid = business_at >= 0
+        open_[valid] = business_levels[business_at[valid]] > 0
+
+        lengths = np.diff(edges, append=edges[-1] if len(edges) else 0)
+        self._edges = edges
+        self._rate_business = open_
+        self._rate_uptime = open_ * active
+        self._cum_business = np.concatenate(([0], np.cumsum(open_ * lengths)))[:-1]
+        self._cum_uptime = np.concatenate(([0], np.cumsum(open_ * active * lengths)))[:-1]
+
+    def _integrate(self, keys):
+        """
+        Evaluates the cumulative business-time and uptime functions at composite keys.
+        """
+        at = np.searchsorted(self._edges, keys, side='right') - 1
+        offset = keys - self._edges[at]
+        return (self._cum_business[at] + self._rate_business[at] * offset,
+                self._cum_uptime[at] + self._rate_uptime[at] * offset)
+
+    def compute_windows(self, starts, ends, store_index=None):
+        """
+        Computes business seconds and uptime seconds of many stores over many windows.
+
+        Args:
+            starts (numpy.ndarray): Epoch start of each window.
+            ends (numpy.ndarray): Epoch end of each window.
+            store_index (numpy.ndarray): Store index of each window. Defaults to every store.
+
+        Returns:
+            tuple: Business seconds and uptime seconds, broadcast to the shape of the windows.
+        """
+        if self._edges is None:
+            self.load()
+        if store_index is None:
+            store_index = np.arange(len(self.store_ids))[:, None]
+        business_start, uptime_start = self._integrate(self._key(store_index, np.asarray(starts)))
+        business_end, uptime_end = self._integrate(self._key(store_index, np.asarray(ends)))
+        return business_end - business_start, uptime_end - uptime_start
+
+    def compute(self, windows=None):
+        """
+        Computes uptime and downtime, in hours, of every store over windows ending at the current
+        timestamp.
+
+        Args:
+            windows (tuple of datetime.timedelta): The window lengths. Defaults to the report windows.
+
+        Returns:
+            tuple: Two (stores x windows) arrays holding uptime and downtime hours.
+        """
+        windows = windows or UptimeEngine.REPORT_WINDOWS
+        starts = np.asarray([self.horizon - int(w.total_seconds()) for w in windows], dtype=np.int64)[None, :]
+        ends = np.full(starts.shape, self.horizon, dtype=np.int64)
+        business, uptime = self.compute_windows(starts, ends)
+        return uptime / 3600, (business - uptime) / 3600
+
+    @staticmethod
+    def make_row(report_id, store_id, uptime, downtime):
+        """
+        Builds the ReportEntry column mapping of a store.
+
+        Args:
+            report_id (str): The ID of the report.
+            store_id (int): The ID of the store.
+            uptime (sequence of float): Uptime hours over the hour, day and week windows.
+            downtime (sequence of float): Downtime hours over the hour, day and week windows.
+
+        Returns:
+            dict: The ReportEntry column values.
+        """
+        return dict(
+            report_id=report_id,
+            store_id=int(store_id),
+            uptime_last_hour=float(uptime[0]),
+            uptime_last_day=float(uptime[1]),
+            update_last_week=float(uptime[2]),
+            downtime_last_hour=float(downtime[0]),
+            downtime_last_day=float(downtime[1]),
+            downtime_last_week=float(downtime[2]),
+        )
+
+    def store_row(self, report_id, store_id):
+        """
+        Computes the report windows of a single store as a ReportEntry column mapping.
+
+        Args:
+            report_id (str): The ID of the report.
+            store_id (int): The ID of the store, which must be one of the engine's stores.
+
+        Returns:
+            dict: The ReportEntry column values.
+
+        Raises:
+            KeyError: If the store is not one of the engine's stores.
+        """
+        i = int(np.searchsorted(self.store_ids, store_id))
+        if i == len(self.store_ids) or self.store_ids[i] != store_id:
+            raise KeyError(f"Store {store_id} is not computed by this engine")
+        if self._report is None:
+            self._report = self.compute()
+        uptime, downtime = self._report
+        return UptimeEngine.make_row(report_id, store_id, uptime[i], downtime[i])
+
+    def report_rows(self, report_id):
+        """
+        Computes the report windows of every store as ReportEntry column mappings.
+
+        Args:
+            report_id (str): The ID of the report.
+
+        Returns:
+            list of dict: One mapping per store.
+        """
+        return [self.store_row(report_id, store_id) for store_id in self.store_ids]
@@ -1,4 +1,8 @@
+import datetime
+
 from celery import Celery
+from celery.schedules import crontab
+from celery.signals import worker_process_init
 
 
 def make_celery(app):
@@ -16,10 +20,33 @@ def make_celery(app):
     # Configuring the celery task
     celery.conf.imports = ('app.Task',)
 
+    # Periodic tasks, run by `celery -A app.celery beat`
+    celery.conf.beat_schedule = {
+        'maintenance': {
+            'task': 'app.Task.maintenance_task',
+            'schedule': crontab(hour=app.config['MAINTENANCE_HOUR'], minute=0),
+        },
+    }
+    if app.config['REPORT_ROLLING_MINUTES']:
+        period = datetime.timedelta(minutes=app.config['REPORT_ROLLING_MINUTES'])
+        celery.conf.beat_schedule['rolling_report'] = {
+            'task': 'app.Task.rolling_report_task',
+            'schedule': period,
+            # A run still queued when the next one is due is dropped
+            'options': {'expires': period.total_seconds()},
+        }
+
     class ContextTask(celery.Task):
         def __call__(self, *args, **kwargs):
             with app.app_context():
                 return self.run(*args, **kwargs)
 
     celery.Task = ContextTask
+
+    @worker_process_init.connect(weak=False)
+    def init_worker_process(**kwargs):
+        # Pooled connections inherited from the parent must not be shared by forked worker processes
+        from app.executors import init_worker
+        init_worker()
+
     return celery
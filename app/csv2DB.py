@@ -1,56 +1,453 @@
+import argparse
 import csv
+import hashlib
+import time
+from collections import defaultdict
 from datetime import datetime
+from itertools import islice
 
+from sqlalchemy import bindparam, func, select
+
+from app import app
 from app import db
+from app import migrations
 from app import models
+from app.HourlyRollup import HourlyRollup
+from app.RollingReport import RollingReport
+from app.StatusTimeline import StatusTimeline
+from app.log import log
+
+DATA_DIR = 'data'
+BATCH_SIZE = 10000
+CHUNK_SIZE = 1 << 20
+# Formats of the poll timestamps, once stripped of their ' UTC' suffix
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+TIMESTAMP_FORMAT_FRACTIONAL = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def parse_timestamp(value):
+    """
+    Parses a UTC poll timestamp, with or without fractional seconds.
+
+    Args:
+        value (str): A timestamp such as '2023-01-22 12:09:39.388884 UTC'.
+
+    Returns:
+        datetime: The naive UTC timestamp.
+    """
+    if value.endswith(' UTC'):
+        value = value[:-4]
+    timestamp_format = TIMESTAMP_FORMAT_FRACTIONAL if '.' in value else TIMESTAMP_FORMAT
+    return datetime.strptime(value, timestamp_format)
+
+
+def read_menu_hours(lines, fieldnames=None):
+    """
+    Parses Menu-hours.csv rows into MenuHours column mappings.
+    """
+    for row in csv.DictReader(lines, fieldnames=fieldnames):
+        yield {
+            'store_id': int(row['store_id']),
+            'day': int(row['day']),
+            'start_time_local': datetime.strptime(row['start_time_local'], '%H:%M:%S').time(),
+            'end_time_local': datetime.strptime(row['end_time_local'], '%H:%M:%S').time(),
+        }
+
+
+def read_store_status(lines, fieldnames=None):
+    """
+    Parses store-status.csv rows into StoreStatus column mappings.
+    """
+    for row in csv.DictReader(lines, fieldnames=fieldnames):
+        yield {
+            'store_id': int(row['store_id']),
+            'status': models.StoreStatusEnum(row['status']),
+            'timestamp': parse_timestamp(row['timestamp_utc']),
+        }
+
+
+def read_timezones(lines, fieldnames=None):
+    """
+    Parses timezone.csv rows into TimeZone column mappings.
+    """
+    for row in csv.DictReader(lines, fieldnames=fieldnames):
+        yield {
+            'store_id': int(row['store_id']),
+            'timezone_str': row['timezone_str'],
+        }
+
+
+# Source name -> (CSV file name, model, row parser)
+SOURCES = {
+    'menu_hours': ('Menu-hours.csv', models.MenuHours, read_menu_hours),
+    'store_status': ('store-status.csv', models.StoreStatus, read_store_status),
+    'timezone': ('timezone.csv', models.TimeZone, read_timezones),
+}
+
+
+class CompleteLines:
+    """
+    Iterates over the complete lines of a binary file from its current position, decoded, while
+    tracking the byte offset reached. A trailing line without a newline (a write still in
+    progress) is left for the next run.
+
+    Attributes:
+        offset (int): Byte offset just past the last line yielded.
+    """
+
+    def __init__(self, binary_file):
+        self.binary_file = binary_file
+        self.offset = binary_file.tell()
+
+    def __iter__(self):
+        for line in self.binary_file:
+            if not line.endswith(b'\n'):
+                return
+            self.offset += len(line)
+            yield line.decode('utf-8')
+
+
+def file_checksum(path, length=None):
+    """
+    Computes the SHA-256 of a file, or of its first `length` bytes.
+
+    Args:
+        path (str): The file path.
+        length (int): Number of leading bytes to hash. Defaults to the whole file.
+
+    Returns:
+        str: The hex digest.
+    """
+    digest = hashlib.sha256()
+    remaining = length
+    with open(path, 'rb') as f:
+        while remaining is None or remaining > 0:
+            chunk = f.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+def get_watermark(source):
+    """
+    Returns the ingestion watermark of a source, creating an empty one if needed.
+    """
+    watermark = models.IngestWatermark.query.filter_by(source=source).first()
+    if watermark is None:
+        watermark = models.IngestWatermark(source=source, file_offset=0)
+        db.session.add(watermark)
+    return watermark
+
+
+def bulk_insert(model, rows, batch_size=BATCH_SIZE):
+    """
+    Inserts rows with executemany in bounded batches, within the current transaction.
+
+    Args:
+        model (db.Model): The model whose table receives the rows.
+        rows (iterable of dict): Column mappings, consumed lazily.
+        batch_size (int): Rows per executemany call.
+
+    Returns:
+        int: The number of inserted rows.
+    """
+    insert = model.__table__.insert()
+    rows = iter(rows)
+    count = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return count
+        db.session.execute(insert, batch)
+        count += len(batch)
+
+
+def track_latest(rows, watermark):
+    """
+    Passes poll rows through while moving the watermark's last_timestamp forward.
+    """
+    for row in rows:
+        if watermark.last_timestamp is None or row['timestamp'] > watermark.last_timestamp:
+            watermark.last_timestamp = row['timestamp']
+        yield row
+
+
+def unseen_polls(rows, after):
+    """
+    Passes through the poll rows from a given timestamp on whose (store_id, timestamp) is not stored
+    yet. Polls at the given timestamp itself may have been missing from the previous file, so they
+    are compared with the stored ones rather than dropped.
+    """
+    model = SOURCES['store_status'][1]
+    seen = {tuple(key) for key in db.session.execute(
+        select(model.store_id, model.timestamp).where(model.timestamp >= after))}
+    for row in rows:
+        key = (row['store_id'], row['timestamp'])
+        if row['timestamp'] >= after and key not in seen:
+            seen.add(key)
+            yield row
+
+
+def latest_poll_timestamp():
+    """
+    Returns the latest ingested poll timestamp, or None before any poll has been ingested.
+    """
+    watermark = models.IngestWatermark.query.filter_by(source='store_status').first()
+    return watermark.last_timestamp if watermark else None
+
+
+def log_throughput(source, count, started):
+    elapsed = time.perf_counter() - started
+    log.info("Committed %d rows for %s in %.1fs (%.0f rows/sec)", count, source, elapsed,
+             count / elapsed if elapsed else 0)
+
+
+def load_csv(source, data_dir=DATA_DIR, batch_size=BATCH_SIZE):
+    """
+    Replaces the content of a source's table with the CSV file, in a single transaction, and
+    moves the source's watermark to the end of the file.
+
+    Args:
+        source (str): A key of SOURCES.
+        data_dir (str): The directory holding the CSV files.
+        batch_size (int): Rows per executemany call.
+
+    Returns:
+        int: The number of inserted rows.
+    """
+    file_name, model, reader = SOURCES[source]
+    path = f"{data_dir}/{file_name}"
+    log.info("Adding data for %s", source)
+    started = time.perf_counter()
 
+    watermark = get_watermark(source)
+    watermark.last_timestamp = None
+    db.session.execute(model.__table__.delete())
 
-def add_data_from_csv():
-    with open('data/Menu-hours.csv', 'r') as csv_file:
-        print("Adding data for Menu Hours")
-        csv_reader = csv.DictReader(csv_file)
-        for row in csv_reader:
-            menu_hour = models.MenuHours(
-                store_id=row['store_id'],
-                day=int(row['day']),
-                start_time_local=datetime.strptime(row['start_time_local'], '%H:%M:%S').time(),
-                end_time_local=datetime.strptime(row['end_time_local'], '%H:%M:%S').time()
-            )
-            db.session.add(menu_hour)
+    with open(path, 'rb') as csv_file:
+        lines = CompleteLines(csv_file)
+        rows = reader(lines)
+        if source == 'store_status':
+            rows = track_latest(rows, watermark)
+        count = bulk_insert(model, rows, batch_size)
 
+    watermark.file_offset = lines.offset
+    watermark.checksum = file_checksum(path, lines.offset)
+    db.session.commit()
+
+    log_throughput(source, count, started)
+    return count
+
+
+def append_store_status(data_dir=DATA_DIR, batch_size=BATCH_SIZE):
+    """
+    Appends the polls added to store-status.csv since the last ingestion.
+
+    When the file still starts with the content ingested so far, reading resumes at the stored
+    byte offset. Otherwise the file has been replaced, so it is read in full and only the polls from
+    the stored last timestamp on that are not stored yet are appended.
+
+    Returns:
+        int: The number of appended rows.
+    """
+    file_name, model, reader = SOURCES['store_status']
+    path = f"{data_dir}/{file_name}"
+    started = time.perf_counter()
+    watermark = get_watermark('store_status')
+    previous_timestamp = watermark.last_timestamp
+    last_id = db.session.query(func.max(model.id)).scalar() or 0
+    timeline = StatusTimeline.current()
+
+    with open(path, 'rb') as csv_file:
+        fieldnames = next(csv.reader([csv_file.readline().decode('utf-8')]))
+        resume = watermark.file_offset > csv_file.tell() and \
+            file_checksum(path, watermark.file_offset) == watermark.checksum
+        if resume:
+            csv_file.seek(watermark.file_offset)
+        lines = CompleteLines(csv_file)
+        rows = reader(lines, fieldnames)
+
+        if not resume and watermark.last_timestamp is not None:
+            log.info("store_status file changed, appending polls from %s", watermark.last_timestamp)
+            rows = unseen_polls(rows, watermark.last_timestamp)
+
+        count = bulk_insert(model, track_latest(rows, watermark), batch_size)
+
+    watermark.file_offset = lines.offset
+    watermark.checksum = file_checksum(path, lines.offset)
+    if count:
+        RollingReport.record_changes(
+            first_timestamp=db.session.query(func.min(model.timestamp)).filter(model.id > last_id).scalar())
+    db.session.commit()
+
+    log_throughput('store_status', count, started)
+    if count:
+        StatusTimeline.refresh(timeline, last_id)
+
+    if count and previous_timestamp is not None:
+        HourlyRollup.refresh_appended(last_id, previous_timestamp, watermark.last_timestamp)
+    elif count:
+        HourlyRollup.rebuild(watermark.last_timestamp)
+    return count
+
+
+def upsert_menu_hours(data_dir=DATA_DIR, batch_size=BATCH_SIZE):
+    """
+    Replaces the business hours of the stores whose schedule changed in Menu-hours.csv, and deletes
+    those of the stores no longer listed, which are open 24x7 from then on.
+
+    Returns:
+        int: The number of stores whose schedule was written or deleted.
+    """
+    file_name, model, reader = SOURCES['menu_hours']
+    path = f"{data_dir}/{file_name}"
+    started = time.perf_counter()
+    watermark = get_watermark('menu_hours')
+    checksum = file_checksum(path)
+    if checksum == watermark.checksum:
+        log.info("menu_hours unchanged, skipping")
+        return 0
+
+    schedules = defaultdict(set)
+    with open(path, 'r', newline='') as csv_file:
+        for row in reader(csv_file):
+            schedules[row['store_id']].add((row['day'], row['start_time_local'], row['end_time_local']))
+
+    existing = defaultdict(set)
+    query = select(model.store_id, model.day, model.start_time_local, model.end_time_local)
+    for store_id, day, start_time_local, end_time_local in db.session.execute(query):
+        existing[store_id].add((day, start_time_local, end_time_local))
+
+    changed = [store_id for store_id, schedule in schedules.items() if existing.get(store_id) != schedule]
+    removed = [store_id for store_id in existing if store_id not in schedules]
+    if removed:
+        log.info("Deleting the business hours of %d stores missing from %s", len(removed), file_name)
+    changed += removed
+    for i in range(0, len(changed), 500):
+        db.session.execute(model.__table__.delete().where(model.store_id.in_(changed[i:i + 500])))
+    bulk_insert(model, (
+        {'store_id': store_id, 'day': day, 'start_time_local': start_time_local, 'end_time_local': end_time_local}
+        for store_id in changed
+        for day, start_time_local, end_time_local in sorted(schedules.get(store_id, ()))
+    ), batch_size)
+
+    watermark.file_offset = len(schedules)
+    watermark.checksum = checksum
+    RollingReport.record_changes(changed)
+    db.session.commit()
+
+    log_throughput('menu_hours', len(changed), started)
+
+    if changed and latest_poll_timestamp() is not None:
+        HourlyRollup.rebuild(latest_poll_timestamp(), changed)
+    return len(changed)
+
+
+def upsert_timezones(data_dir=DATA_DIR, batch_size=BATCH_SIZE):
+    """
+    Inserts new stores and updates changed time zones from timezone.csv.
+
+    Returns:
+        int: The number of inserted or updated stores.
+    """
+    file_name, model, reader = SOURCES['timezone']
+    path = f"{data_dir}/{file_name}"
+    started = time.perf_counter()
+    watermark = get_watermark('timezone')
+    checksum = file_checksum(path)
+    if checksum == watermark.checksum:
+        log.info("timezone unchanged, skipping")
+        return 0
+
+    existing = dict(db.session.execute(select(model.store_id, model.timezone_str)).all())
+    with open(path, 'r', newline='') as csv_file:
+        rows = {row['store_id']: row for row in reader(csv_file)}
+
+    inserted = [row for store_id, row in rows.items() if store_id not in existing]
+    updated = [{'b_store_id': store_id, 'b_timezone_str': row['timezone_str']}
+               for store_id, row in rows.items()
+               if store_id in existing and existing[store_id] != row['timezone_str']]
+
+    bulk_insert(model, inserted, batch_size)
+    if updated:
+        update = model.__table__.update() \
+            .where(model.__table__.c.store_id == bindparam('b_store_id')) \
+            .values(timezone_str=bindparam('b_timezone_str'))
+        db.session.execute(update, updated)
+
+    changed = [row['store_id'] for row in inserted] + [row['b_store_id'] for row in updated]
+    watermark.file_offset = len(rows)
+    watermark.checksum = checksum
+    RollingReport.record_changes(changed)
+    db.session.commit()
+
+    log_throughput('timezone', len(inserted) + len(updated), started)
+
+    if changed and latest_poll_timestamp() is not None:
+        HourlyRollup.rebuild(latest_poll_timestamp(), changed)
+    return len(inserted) + len(updated)
+
+
+# Source name -> incremental ingestion function
+INCREMENTAL_LOADERS = {
+    'menu_hours': upsert_menu_hours,
+    'store_status': append_store_status,
+    'timezone': upsert_timezones,
+}
+
+
+def add_data_from_csv(data_dir=DATA_DIR, batch_size=BATCH_SIZE, sources=tuple(SOURCES), incremental=False):
+    """
+    Loads the CSV dumps into the database.
+
+    Args:
+        data_dir (str): The directory holding the CSV files.
+        batch_size (int): Rows per executemany call.
+        sources (iterable of str): The SOURCES to load.
+        incremental (bool): Only append new polls and upsert changed business hours and time
+            zones, instead of replacing the tables.
+
+    Returns:
+        dict: The number of inserted rows (or changed stores) per source.
+    """
+    if incremental:
+        counts = {source: INCREMENTAL_LOADERS[source](data_dir, batch_size) for source in sources}
+    else:
+        counts = {source: load_csv(source, data_dir, batch_size) for source in sources}
+        if 'store_status' in sources:
+            # The reloaded polls replace the runs they were compacted into
+            first_poll = db.session.query(func.min(models.StoreStatus.timestamp)).scalar()
+            if first_poll is not None:
+                table = models.StoreStatusInterval.__table__
+                db.session.execute(table.delete().where(table.c.end >= first_poll))
+                db.session.commit()
+        StatusTimeline.refresh()
+        db.session.execute(models.StoreHourlyUptime.__table__.delete())
+        RollingReport.record_changes()
         db.session.commit()
-        print("Committed ...!")
-
-        with open('data/store-status.csv', 'r') as csv_file:
-            print("Adding data for store-status")
-            csv_reader = csv.DictReader(csv_file)
-            for row in csv_reader:
-                try:
-                    store_status = models.StoreStatus(
-                        store_id=row['store_id'],
-                        status=row['status'],
-                        timestamp=datetime.strptime(row['timestamp_utc'], '%Y-%m-%d %H:%M:%S UTC')
-                    )
-                except:
-                    store_status = models.StoreStatus(
-                        store_id=row['store_id'],
-                        status=row['status'],
-                        timestamp=datetime.strptime(row['timestamp_utc'], '%Y-%m-%d %H:%M:%S.%f UTC')
-                    )
-                db.session.add(store_status)
-            db.session.commit()
-            print("Committed ...!")
-
-        with open('data/timezone.csv', 'r') as csv_file:
-            print("Adding data for timezone")
-            csv_reader = csv.DictReader(csv_file)
-            for row in csv_reader:
-                timezone = models.TimeZone(
-                    store_id=row['store_id'],
-                    timezone_str=row['timezone_str']
-                )
-                db.session.add(timezone)
-            db.session.commit()
-            print("Committed ...!")
-
-        print("Data added...!")
+        if latest_poll_timestamp() is not None:
+            HourlyRollup.rebuild(latest_poll_timestamp())
+    log.info("Data added...!")
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load the store monitoring CSV dumps into the database.")
+    parser.add_argument('--data-dir', default=DATA_DIR, help="directory holding the CSV files")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="rows per bulk insert")
+    parser.add_argument('--source', action='append', choices=sorted(SOURCES), dest='sources',
+                        help="source to load, may be repeated (default: all)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="append new polls and upsert changes instead of replacing the tables")
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        migrations.upgrade()
+        add_data_from_csv(args.data_dir, args.batch_size, args.sources or tuple(SOURCES), args.incremental)
+
+
+if __name__ == '__main__':
+    main()
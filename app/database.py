@@ -0,0 +1,92 @@
+import os
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool
+
+
+def env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def sqlite_pragmas():
+    """
+    Returns the PRAGMAs applied to every new SQLite connection, overridable through the environment.
+
+    WAL lets readers (such as /get_report) run while a report chunk is being written, and
+    synchronous=NORMAL only syncs at WAL checkpoints, which is safe in WAL mode. The page cache
+    (cache_size, in KiB when negative) and memory-mapped I/O (mmap_size, in bytes) are per connection.
+
+    Returns:
+        dict: PRAGMA name -> value.
+    """
+    return {
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'cache_size': -env_int('SQLITE_CACHE_SIZE_KB', 64 * 1024),
+        'mmap_size': env_int('SQLITE_MMAP_SIZE_MB', 256) * 1024 * 1024,
+        'temp_store': 'MEMORY',
+    }
+
+
+def engine_options(database_uri):
+    """
+    Builds the SQLAlchemy engine options of a database URI.
+
+    SQLite file databases get a thread-safe connection pool and a busy timeout, so writers wait for
+    the lock instead of failing. MySQL and PostgreSQL get a pool sized for the API threads plus the
+    worker processes' chunks, with connections validated on checkout and recycled before the server
+    drops them.
+
+    Args:
+        database_uri (str): The SQLAlchemy database URI.
+
+    Returns:
+        dict: The keyword arguments for create_engine (SQLALCHEMY_ENGINE_OPTIONS).
+    """
+    pool_options = {
+        'pool_size': env_int('DB_POOL_SIZE', 10),
+        'max_overflow': env_int('DB_MAX_OVERFLOW', 20),
+        'pool_timeout': env_int('DB_POOL_TIMEOUT', 30),
+    }
+    url = make_url(database_uri)
+    if url.get_backend_name() == 'sqlite':
+        if url.database in (None, '', ':memory:'):
+            return {}
+        return dict(pool_options, poolclass=QueuePool, connect_args={
+            'timeout': env_int('SQLITE_BUSY_TIMEOUT', 30),
+            # Pooled connections are handed to whichever thread checks them out next
+            'check_same_thread': False,
+        })
+    return dict(pool_options, pool_pre_ping=True, pool_recycle=env_int('DB_POOL_RECYCLE', 1800))
+
+
+def sidecar_path(database_uri, file_name, default_dir):
+    """
+    Returns the path of a file kept next to the database: beside the SQLite file, or in default_dir
+    for server databases.
+
+    Args:
+        database_uri (str): The SQLAlchemy database URI.
+        file_name (str): The name of the file.
+        default_dir (str): The directory used when the database is not a SQLite file.
+
+    Returns:
+        str: The path.
+    """
+    url = make_url(database_uri)
+    if url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:'):
+        return os.path.join(os.path.dirname(os.path.abspath(url.database)), file_name)
+    return os.path.join(default_dir, file_name)
+
+
+@event.listens_for(Engine, "connect")
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in sqlite_pragmas().items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
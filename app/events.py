@@ -0,0 +1,146 @@
+import json
+import queue
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from app import app
+from app.log import log
+
+# Report statuses after which no more events are published
+FINAL_STATUSES = ("Complete", "Failed")
+
+
+class MemoryEventBus:
+    """
+    Delivers report progress events to subscribers in the same process.
+
+    Used with the local executor, whose progress is published by the API process itself.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def publish(self, report_id, event):
+        """
+        Sends an event to the current subscribers of a report.
+
+        Args:
+            report_id (str): The ID of the report.
+            event (dict): The progress event.
+        """
+        with self._lock:
+            subscribers = list(self._subscribers.get(report_id, ()))
+        for subscriber in subscribers:
+            subscriber.put(event)
+
+    @contextmanager
+    def subscribe(self, report_id):
+        """
+        Subscribes to the events of a report for the duration of the block.
+
+        Yields:
+            callable: Takes a timeout in seconds and returns the next event, or None on timeout.
+        """
+        subscriber = queue.Queue()
+        with self._lock:
+            self._subscribers[report_id].add(subscriber)
+
+        def next_event(timeout):
+            try:
+                return subscriber.get(timeout=timeout)
+            except queue.Empty:
+                return None
+
+        try:
+            yield next_event
+        finally:
+            with self._lock:
+                self._subscribers[report_id].discard(subscriber)
+                if not self._subscribers[report_id]:
+                    del self._subscribers[report_id]
+
+
+class RedisEventBus:
+    """
+    Delivers report progress events through Redis pub/sub, from Celery workers to every API process.
+
+    Attributes:
+        url (str): The Redis URL.
+    """
+
+    def __init__(self, url):
+        import redis
+
+        self.url = url
+        self.client = redis.Redis.from_url(url)
+
+    @staticmethod
+    def channel(report_id):
+        return f"report-events:{report_id}"
+
+    def publish(self, report_id, event):
+        """
+        Sends an event to the subscribers of a report. Failures are logged, never raised, since a
+        missed event only delays clients until their next status check.
+
+        Args:
+            report_id (str): The ID of the report.
+            event (dict): The progress event.
+        """
+        try:
+            self.client.publish(RedisEventBus.channel(report_id), json.dumps(event))
+        except Exception as e:
+            log.warning("Could not publish event of report %s: %s", report_id, str(e))
+
+    @contextmanager
+    def subscribe(self, report_id):
+        """
+        Subscribes to the events of a report for the duration of the block.
+
+        Yields:
+            callable: Takes a timeout in seconds and returns the next event, or None on timeout.
+        """
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(RedisEventBus.channel(report_id))
+
+        def next_event(timeout):
+            deadline = time.monotonic() + timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                message = pubsub.get_message(timeout=remaining)
+                if message is not None and message['type'] == 'message':
+                    return json.loads(message['data'])
+
+        try:
+            yield next_event
+        finally:
+            pubsub.close()
+
+
+_event_bus = None
+_event_bus_lock = threading.Lock()
+
+
+def get_event_bus():
+    """
+    Returns the event bus selected by the REPORT_EVENTS config value.
+
+    Returns:
+        MemoryEventBus or RedisEventBus: The shared event bus.
+    """
+    global _event_bus
+    with _event_bus_lock:
+        if _event_bus is None:
+            name = app.config['REPORT_EVENTS']
+            if name == 'memory':
+                _event_bus = MemoryEventBus()
+            elif name == 'redis':
+                _event_bus = RedisEventBus(app.config['REPORT_EVENTS_URL'])
+            else:
+                raise ValueError(f"Unknown REPORT_EVENTS: {name}")
+        return _event_bus
@@ -0,0 +1,227 @@
+import argparse
+import datetime
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+
+from sqlalchemy import func
+
+from app import app
+from app import db
+from app.ReportUtils import ReportUtils
+from app.StatusTimeline import StatusTimeline
+from app.log import log
+from app.models import ReportTask, TimeZone
+
+
+class CeleryExecutor:
+    """
+    Runs reports on Celery workers through the Redis broker.
+    """
+
+    def submit(self, report_id, current_timestamp, stores_info):
+        """
+        Dispatches a report to the Celery workers.
+
+        Args:
+            report_id (str): The ID of the report.
+            current_timestamp (datetime.datetime): The current timestamp.
+            stores_info (list of dict): List of store information dictionaries.
+
+        Returns:
+            None
+        """
+        from app.Task import generate_reports_task
+
+        generate_reports_task.apply_async(args=(report_id, current_timestamp, stores_info))
+
+
+def init_worker():
+    """
+    Initializes a report worker process. Connections inherited from the parent process must not be
+    shared, so the forked engine's pool is discarded. The status timeline snapshot is mapped up
+    front, so the first chunk does not pay for it.
+    """
+    with app.app_context():
+        db.engine.dispose()
+        StatusTimeline.current()
+
+
+def run_report_chunk(report_id, current_timestamp, store_ids):
+    """
+    Computes and stores a chunk of a report in a worker process.
+    """
+    with app.app_context():
+        return ReportUtils.generate_report_chunk(report_id, current_timestamp, store_ids)
+
+
+class LocalProcessExecutor:
+    """
+    Runs reports on an in-process pool of worker processes, without a broker.
+
+    The chunks of a report are shared across the pool's processes, and a coordinating thread marks
+    the report complete once every chunk has been stored.
+
+    Attributes:
+        max_workers (int): The number of worker processes.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or os.cpu_count()
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers, initializer=init_worker)
+            return self._pool
+
+    def submit(self, report_id, current_timestamp, stores_info):
+        """
+        Dispatches the chunks of a report to the process pool.
+
+        Args:
+            report_id (str): The ID of the report.
+            current_timestamp (datetime.datetime): The current timestamp.
+            stores_info (list of dict): List of store information dictionaries.
+
+        Returns:
+            threading.Thread: The thread waiting for the report to complete.
+        """
+        store_ids = [int(info["store_id"]) for info in stores_info]
+        chunks = ReportUtils.plan_chunks(report_id, store_ids)
+        log.info("Dispatching report %s as %d chunks to %d local workers", report_id, len(chunks), self.max_workers)
+
+        futures = [self.pool.submit(run_report_chunk, report_id, current_timestamp, chunk) for chunk in chunks]
+        for future in futures:
+            # Chunks publish from the worker processes, which do not share this process's event bus
+            future.add_done_callback(lambda _: LocalProcessExecutor._publish_progress(report_id))
+        waiter = threading.Thread(target=self._complete, args=(report_id, futures), daemon=True)
+        waiter.start()
+        return waiter
+
+    @staticmethod
+    def _publish_progress(report_id):
+        with app.app_context():
+            ReportUtils.publish_progress(report_id)
+
+    @staticmethod
+    def _complete(report_id, futures):
+        """
+        Waits for the chunks of a report and marks it complete if all of them succeeded, or failed
+        otherwise (chunks record their own errors, but a crashed worker process cannot).
+        """
+        wait(futures)
+        errors = [future.exception() for future in futures if future.exception() is not None]
+        with app.app_context():
+            if errors:
+                log.error("Report %s failed in %d chunks: %s", report_id, len(errors), str(errors[0]))
+                ReportUtils.fail_report(report_id, str(errors[0]))
+                return
+            ReportUtils.complete_report(report_id)
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+_executor = None
+
+
+def get_executor():
+    """
+    Returns the report executor selected by the REPORT_EXECUTOR config value.
+
+    Returns:
+        CeleryExecutor or LocalProcessExecutor: The shared executor.
+    """
+    global _executor
+    if _executor is None:
+        name = app.config['REPORT_EXECUTOR']
+        if name == 'celery':
+            _executor = CeleryExecutor()
+        elif name == 'local':
+            _executor = LocalProcessExecutor(app.config['REPORT_WORKERS'])
+        else:
+            raise ValueError(f"Unknown REPORT_EXECUTOR: {name}")
+    return _executor
+
+
+def resume_report(report_id):
+    """
+    Dispatches a running or failed report again. Chunks stored before are skipped, so only the
+    missing ones are computed, over the same chunks and trigger time as the original run.
+
+    Args:
+        report_id (str): The ID of the report.
+
+    Returns:
+        threading.Thread: The waiter thread with the local executor, else None.
+
+    Raises:
+        ValueError: If the report does not exist or is already complete.
+    """
+    report_task = ReportTask.query.filter_by(report_id=report_id).first()
+    if report_task is None:
+        raise ValueError(f"Report not found: {report_id}")
+    if report_task.status == "Complete":
+        raise ValueError(f"Report {report_id} is already complete")
+
+    stores_info = [{"store_id": store.store_id, "timezone_str": store.timezone_str} for store in TimeZone.query.all()]
+    if report_task.stores_total is not None and report_task.stores_total != len(stores_info):
+        log.warning("Report %s covered %d stores, resuming over the %d current stores", report_id,
+                    report_task.stores_total, len(stores_info))
+
+    log.info("Resuming report %s from %d of %s chunks", report_id, report_task.chunks_done, report_task.chunks_total)
+    report_task.status = "Running"
+    report_task.error = None
+    report_task.updated_at = datetime.datetime.utcnow()
+    current_timestamp = report_task.timestamp
+    db.session.commit()
+    return get_executor().submit(report_id, current_timestamp, stores_info)
+
+
+def stale_reports(idle):
+    """
+    Returns the IDs of the running reports that have not progressed for a while, such as reports
+    whose worker died.
+
+    Args:
+        idle (datetime.timedelta): How long a report may go without progress.
+
+    Returns:
+        list of str: The report IDs.
+    """
+    cutoff = datetime.datetime.utcnow() - idle
+    last_progress = func.coalesce(ReportTask.updated_at, ReportTask.timestamp)
+    return [report_id for report_id, in db.session.query(ReportTask.report_id).filter(
+        ReportTask.status == "Running", last_progress < cutoff)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resume interrupted or failed reports.")
+    parser.add_argument('report_ids', nargs='*', help="IDs of the reports to resume")
+    parser.add_argument('--stale-minutes', type=int,
+                        help="Also resume the running reports without progress for this many minutes")
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        report_ids = list(args.report_ids)
+        if args.stale_minutes is not None:
+            report_ids += stale_reports(datetime.timedelta(minutes=args.stale_minutes))
+        waiters = [resume_report(report_id) for report_id in dict.fromkeys(report_ids)]
+
+    # Local reports run in this process, wait for them before exiting
+    for waiter in waiters:
+        if waiter is not None:
+            waiter.join()
+    if isinstance(_executor, LocalProcessExecutor):
+        _executor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import argparse
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
+
+from app import app
+from app import db
+from app import models  # noqa: F401 (registers the tables on db.metadata)
+from app.log import log
+
+
+def add_missing_columns():
+    """
+    Adds the model columns missing from existing tables.
+
+    New columns must be nullable or declare a server default, since existing rows get no value.
+
+    Returns:
+        list of str: The added columns, as 'table.column'.
+    """
+    inspector = inspect(db.engine)
+    added = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            preparer = db.engine.dialect.identifier_preparer
+            column_ddl = CreateColumn(column).compile(dialect=db.engine.dialect)
+            ddl = f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN {column_ddl}'
+            log.info("Adding column %s.%s", table.name, column.name)
+            db.session.execute(text(ddl))
+            added.append(f"{table.name}.{column.name}")
+    db.session.commit()
+    return added
+
+
+def create_missing_indexes():
+    """
+    Creates the model indexes missing from existing tables.
+
+    Returns:
+        list of str: The names of the created indexes.
+    """
+    inspector = inspect(db.engine)
+    created = []
+    for table in db.metadata.sorted_tables:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            log.info("Creating index %s", index.name)
+            index.create(db.engine)
+            created.append(index.name)
+    return created
+
+
+def analyze():
+    """
+    Refreshes the query planner statistics of every table.
+    """
+    with db.engine.begin() as connection:
+        if connection.dialect.name == 'mysql':
+            preparer = connection.dialect.identifier_preparer
+            tables = ", ".join(preparer.format_table(table) for table in db.metadata.sorted_tables)
+            connection.execute(text(f"ANALYZE TABLE {tables}"))
+        else:
+            connection.execute(text("ANALYZE"))
+
+
+def upgrade():
+    """
+    Brings an existing database, such as an older db/db.db, up to the current models: creates
+    missing tables, columns and indexes, then refreshes the query planner statistics.
+
+    Returns:
+        dict: The added columns and created indexes.
+    """
+    db.create_all()
+    columns = add_missing_columns()
+    indexes = create_missing_indexes()
+    if columns or indexes:
+        analyze()
+    log.info("Schema up to date (%d columns added, %d indexes created)", len(columns), len(indexes))
+    return {'columns': columns, 'indexes': indexes}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Upgrade the database schema to the current models.")
+    parser.parse_args(argv)
+    with app.app_context():
+        upgrade()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,7 @@
 from datetime import datetime
 from enum import Enum
 
-from sqlalchemy import Time
+from sqlalchemy import String, Time, cast, func
 
 from app import db
 
@@ -30,8 +30,11 @@ class MenuHours(db.Model):
         end_time_local (Time): End time of menu hours in local time.
     """
     __tablename__ = 'MenuHours'
+    __table_args__ = (
+        db.Index('ix_MenuHours_store_id_day', 'store_id', 'day'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    store_id = db.Column(db.Integer, nullable=False)
+    store_id = db.Column(db.BigInteger, nullable=False)
     day = db.Column(db.Integer, nullable=False)
     start_time_local = db.Column(Time, nullable=False)
     end_time_local = db.Column(Time, nullable=False)
@@ -48,12 +51,26 @@ class StoreStatus(db.Model):
         timestamp (datetime): Timestamp of the status change.
     """
     __tablename__ = 'StoreStatus'
+    __table_args__ = (
+        db.Index('ix_StoreStatus_store_id_timestamp', 'store_id', 'timestamp'),
+        # Lets report windows range-scan only the recent polls of all stores
+        db.Index('ix_StoreStatus_timestamp', 'timestamp'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    store_id = db.Column(db.Integer, nullable=False)
+    store_id = db.Column(db.BigInteger, nullable=False)
     status = db.Column(db.Enum(StoreStatusEnum), nullable=False)
     timestamp = db.Column(db.DateTime, nullable=False)
 
 
+def status_is_active():
+    """
+    Returns the SQL expression telling whether a StoreStatus row is an active poll. Legacy rows may
+    hold the raw CSV value ('active') rather than the enum name, so the comparison is done
+    case-insensitively on the stored string.
+    """
+    return func.lower(cast(StoreStatus.status, String)) == StoreStatusEnum.ACTIVE.value
+
+
 class TimeZone(db.Model):
     """
     Model class to represent store time zones.
@@ -64,9 +81,12 @@ class TimeZone(db.Model):
         timezone_str (str): Time zone string (e.g., 'Asia/Kolkata').
     """
     __tablename__ = 'TimeZone'
+    __table_args__ = (
+        db.Index('ix_TimeZone_store_id', 'store_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    store_id = db.Column(db.Integer, nullable=False)
-    timezone_str = db.Column(db.String, nullable=False)
+    store_id = db.Column(db.BigInteger, nullable=False)
+    timezone_str = db.Column(db.String(64), nullable=False)
 
 
 class ReportEntry(db.Model):
@@ -85,9 +105,12 @@ class ReportEntry(db.Model):
         downtime_last_week (float): Downtime in hours for the last week.
     """
     __tablename__ = 'ReportEntry'
+    __table_args__ = (
+        db.Index('ix_ReportEntry_report_id_store_id', 'report_id', 'store_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    report_id = db.Column(db.String, nullable=False)
-    store_id = db.Column(db.Integer, nullable=False)
+    report_id = db.Column(db.String(32), nullable=False)
+    store_id = db.Column(db.BigInteger, nullable=False)
     uptime_last_hour = db.Column(db.Float, nullable=False)
     uptime_last_day = db.Column(db.Float, nullable=False)
     update_last_week = db.Column(db.Float, nullable=False)
@@ -103,11 +126,190 @@ class ReportTask(db.Model):
     Attributes:
         id (int): The unique identifier for the report task.
         report_id (str): The unique identifier for the associated report.
-        status (str): The current status of the report task (e.g., "Running", "Complete").
-        timestamp (datetime): The timestamp indicating when the report task was created.
+        status (str): The current status of the report task ("Running", "Complete" or "Failed").
+        timestamp (datetime): When the report was triggered; its uptime windows end at this time.
+        fingerprint (str): The data version and trigger time bucket the report was computed for; concurrent
+            or repeated triggers with the same fingerprint reuse the report.
+        profile (bool): Whether the chunks of the report are profiled with cProfile.
+        completed_at (datetime): When the report completed.
+        metrics (str): JSON summary of the report's stage timings, query and row counts, set on completion.
+        error (str): Why the report failed, when its status is "Failed".
+        stores_total (int): Number of stores the report covers.
+        stores_done (int): Number of stores whose entries have been stored.
+        chunk_size (int): Stores per chunk, fixed when the report is first dispatched so that a resumed
+            report splits its stores into the same chunks.
+        chunks_total (int): Number of chunks of the report.
+        chunks_done (int): Number of chunks stored.
+        updated_at (datetime): When the report last made progress.
+        rolling (bool): Whether the report is a rolling report, generated on a schedule by RollingReport.
+        change_watermark (int): ID of the last StoreChange a rolling report accounts for.
 
     """
+    __table_args__ = (
+        db.Index('ix_report_task_fingerprint', 'fingerprint', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    report_id = db.Column(db.String, unique=True, nullable=False)
-    status = db.Column(db.String, nullable=False)
+    report_id = db.Column(db.String(32), unique=True, nullable=False)
+    status = db.Column(db.String(16), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    fingerprint = db.Column(db.String(64))
+    profile = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    completed_at = db.Column(db.DateTime)
+    metrics = db.Column(db.Text)
+    error = db.Column(db.Text)
+    stores_total = db.Column(db.Integer)
+    stores_done = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    chunk_size = db.Column(db.Integer)
+    chunks_total = db.Column(db.Integer)
+    chunks_done = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime)
+    rolling = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    change_watermark = db.Column(db.Integer)
+
+
+class StoreStatusInterval(db.Model):
+    """
+    Model class to represent a run of consecutive status polls of a store with the same status, into
+    which polls older than the retention period are compacted.
+
+    Nearest-neighbour interpolation only depends on the first and last poll of each run, so a run
+    stands in for all of its polls without changing any computed uptime.
+
+    Attributes:
+        id (int): Primary key identifier.
+        store_id (int): ID of the store.
+        start (datetime): Timestamp of the first poll of the run.
+        end (datetime): Timestamp of the last poll of the run.
+        active (bool): Whether the store was active during the run.
+        polls (int): Number of polls compacted into the run.
+    """
+    __tablename__ = 'StoreStatusInterval'
+    __table_args__ = (
+        db.Index('ix_StoreStatusInterval_store_id_start', 'store_id', 'start'),
+        db.Index('ix_StoreStatusInterval_end', 'end'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    store_id = db.Column(db.BigInteger, nullable=False)
+    start = db.Column(db.DateTime, nullable=False)
+    end = db.Column(db.DateTime, nullable=False)
+    active = db.Column(db.Boolean, nullable=False)
+    polls = db.Column(db.Integer, nullable=False)
+
+
+class StoreChange(db.Model):
+    """
+    Model class to represent a change of the ingested data, recorded at ingestion time so that the next
+    rolling report recomputes the stores it affects.
+
+    Attributes:
+        id (int): Primary key identifier, increasing with every recorded change.
+        store_id (int): ID of the store whose business hours or time zone changed, or None for a change
+            of the polls of any store.
+        first_timestamp (datetime): For polls, the earliest new poll; None when every store changed
+            (a full load).
+        changed_at (datetime): When the change was ingested.
+    """
+    __tablename__ = 'StoreChange'
+    id = db.Column(db.Integer, primary_key=True)
+    store_id = db.Column(db.BigInteger)
+    first_timestamp = db.Column(db.DateTime)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class IngestWatermark(db.Model):
+    """
+    Tracks how far a CSV source has been ingested, so incremental runs only load new data.
+
+    Attributes:
+        id (int): Primary key identifier.
+        source (str): Name of the CSV source (e.g., 'store_status').
+        file_offset (int): Byte offset up to which the file has been ingested.
+        checksum (str): SHA-256 of the file content up to file_offset.
+        last_timestamp (datetime): Latest poll timestamp ingested from the source, if any.
+        updated_at (datetime): When the watermark was last moved.
+    """
+    __tablename__ = 'IngestWatermark'
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(32), unique=True, nullable=False)
+    file_offset = db.Column(db.BigInteger, nullable=False, default=0)
+    checksum = db.Column(db.String(64))
+    last_timestamp = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class StoreHourlyUptime(db.Model):
+    """
+    Model class to represent the hourly uptime rollup of a store, maintained at ingestion time.
+
+    Attributes:
+        id (int): Primary key identifier.
+        store_id (int): ID of the store.
+        hour (datetime): Start of the UTC hour.
+        business_seconds (int): Seconds of the hour within the store's business hours.
+        up_seconds (int): Business seconds during which the store was active.
+    """
+    __tablename__ = 'StoreHourlyUptime'
+    __table_args__ = (
+        db.Index('ix_StoreHourlyUptime_store_id_hour', 'store_id', 'hour', unique=True),
+        db.Index('ix_StoreHourlyUptime_hour', 'hour'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    store_id = db.Column(db.BigInteger, nullable=False)
+    hour = db.Column(db.DateTime, nullable=False)
+    business_seconds = db.Column(db.Integer, nullable=False)
+    up_seconds = db.Column(db.Integer, nullable=False)
+
+
+class ReportChunkMetrics(db.Model):
+    """
+    Model class to represent the instrumentation of one chunk of a report.
+
+    Attributes:
+        id (int): Primary key identifier.
+        report_id (str): ID of the report.
+        stores (int): Number of stores in the chunk.
+        seconds (float): Wall time of the chunk.
+        load_seconds (float): Time spent loading polls, business hours and rollup rows.
+        compute_seconds (float): Time spent computing uptime and downtime.
+        persist_seconds (float): Time spent storing the report entries.
+        queries (int): Number of SQL statements executed.
+        polls (int): Number of status polls loaded.
+        entries (int): Number of report entries stored.
+    """
+    __tablename__ = 'ReportChunkMetrics'
+    __table_args__ = (
+        db.Index('ix_ReportChunkMetrics_report_id', 'report_id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    report_id = db.Column(db.String(32), nullable=False)
+    stores = db.Column(db.Integer, nullable=False)
+    seconds = db.Column(db.Float, nullable=False)
+    load_seconds = db.Column(db.Float, nullable=False)
+    compute_seconds = db.Column(db.Float, nullable=False)
+    persist_seconds = db.Column(db.Float, nullable=False)
+    queries = db.Column(db.Integer, nullable=False)
+    polls = db.Column(db.Integer, nullable=False)
+    entries = db.Column(db.Integer, nullable=False)
+
+
+class ReportChunk(db.Model):
+    """
+    Model class to represent a stored chunk of a report. It is written in the same transaction as the
+    chunk's entries, so it is the checkpoint a retried or resumed report skips the chunk by.
+
+    Attributes:
+        id (int): Primary key identifier.
+        report_id (str): ID of the report.
+        first_store_id (int): The smallest store ID of the chunk, which identifies it within the report.
+        stores (int): Number of stores in the chunk.
+        completed_at (datetime): When the chunk was stored.
+    """
+    __tablename__ = 'ReportChunk'
+    __table_args__ = (
+        db.Index('ix_ReportChunk_report_id_first_store_id', 'report_id', 'first_store_id', unique=True),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    report_id = db.Column(db.String(32), nullable=False)
+    first_store_id = db.Column(db.BigInteger, nullable=False)
+    stores = db.Column(db.Integer, nullable=False)
+    completed_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,239 @@
+import argparse
+import datetime
+import os
+import re
+import time
+
+import numpy as np
+from sqlalchemy import func, select, text
+
+from app import app
+from app import db
+from app.HourlyRollup import HourlyRollup, floor_hour
+from app.ReportUtils import ReportUtils
+from app.StatusTimeline import StatusTimeline
+from app.UptimeEngine import UptimeEngine
+from app.log import log
+from app.models import ReportTask, StoreChange, StoreHourlyUptime, StoreStatus, StoreStatusInterval, \
+    status_is_active
+
+# Raw polls must cover the longest report window, the interpolation margin and the rollup's last hour
+MIN_POLL_RETENTION = max(UptimeEngine.REPORT_WINDOWS) + UptimeEngine.POLL_MARGIN + datetime.timedelta(hours=1)
+# Rows per executemany call
+BATCH_SIZE = 10000
+REPORT_FILE = re.compile(r"report_(?P<report_id>[^.]+)\.")
+
+
+def compact_polls(cutoff):
+    """
+    Compacts the status polls older than a cutoff into StoreStatusInterval runs: each run of
+    consecutive polls of a store with the same status is replaced by its first and last timestamp.
+
+    Args:
+        cutoff (datetime.datetime): Polls before this timestamp are compacted.
+
+    Returns:
+        tuple: The number of compacted polls and of runs written.
+    """
+    query = select(StoreStatus.store_id, StoreStatus.timestamp, status_is_active()).where(
+        StoreStatus.timestamp < cutoff)
+
+    store_parts, time_parts, active_parts = [], [], []
+    result = db.session.execute(query.execution_options(stream_results=True))
+    for rows in result.partitions(BATCH_SIZE * 10):
+        raw_store_ids, timestamps, active = zip(*rows)
+        store_parts.append(np.asarray(raw_store_ids, dtype=np.int64))
+        time_parts.append(np.asarray(timestamps, dtype='datetime64[us]'))
+        active_parts.append(np.asarray(active, dtype=bool))
+    if not store_parts:
+        return 0, 0
+
+    store_ids, timestamps, active = np.concatenate(store_parts), np.concatenate(time_parts), np.concatenate(active_parts)
+    order = np.lexsort((timestamps, store_ids))
+    store_ids, timestamps, active = store_ids[order], timestamps[order], active[order]
+
+    # A run starts at a store's first poll and wherever its status changes
+    run_starts = np.flatnonzero(np.r_[True, (store_ids[1:] != store_ids[:-1]) | (active[1:] != active[:-1])])
+    run_ends = np.r_[run_starts[1:] - 1, len(store_ids) - 1]
+    runs = [
+        {'store_id': store_id, 'start': start, 'end': end, 'active': is_run_active, 'polls': polls}
+        for store_id, start, end, is_run_active, polls in zip(
+            store_ids[run_starts].tolist(), timestamps[run_starts].tolist(), timestamps[run_ends].tolist(),
+            active[run_starts].tolist(), (run_ends - run_starts + 1).tolist())
+    ]
+
+    table = StoreStatusInterval.__table__
+    for i in range(0, len(runs), BATCH_SIZE):
+        db.session.execute(table.insert(), runs[i:i + BATCH_SIZE])
+    db.session.execute(StoreStatus.__table__.delete().where(StoreStatus.timestamp < cutoff))
+    db.session.commit()
+
+    log.info("Compacted %d polls before %s into %d runs", len(store_ids), cutoff, len(runs))
+    return len(store_ids), len(runs)
+
+
+def expire_rollup(latest_timestamp):
+    """
+    Deletes the hourly rollup rows older than any report window can reach.
+
+    Args:
+        latest_timestamp (datetime.datetime): The latest ingested poll timestamp.
+
+    Returns:
+        int: The number of deleted rows.
+    """
+    table = StoreHourlyUptime.__table__
+    result = db.session.execute(table.delete().where(
+        table.c.hour < floor_hour(latest_timestamp - HourlyRollup.RETENTION)))
+    db.session.commit()
+    return result.rowcount
+
+
+def expire_changes(max_age):
+    """
+    Deletes the StoreChange records older than a maximum age. Rolling reports prune the changes they
+    account for, so only changes recorded while no rolling report ran accumulate.
+
+    Args:
+        max_age (datetime.timedelta): The age after which changes are deleted.
+
+    Returns:
+        int: The number of deleted records.
+    """
+    table = StoreChange.__table__
+    result = db.session.execute(table.delete().where(table.c.changed_at < datetime.datetime.utcnow() - max_age))
+    db.session.commit()
+    return result.rowcount
+
+
+def expire_report_files(max_age):
+    """
+    Deletes (or archives, see ReportUtils.remove_report_files) report files whose report no longer
+    exists, such as files written before reports were evicted, plus leftover temporary files and
+    profiles, once they are older than max_age.
+
+    Args:
+        max_age (datetime.timedelta): The age after which orphaned files are removed.
+
+    Returns:
+        int: The number of removed reports' files and other files.
+    """
+    reports_dir = app.config['REPORTS_DIR']
+    cutoff = time.time() - max_age.total_seconds()
+    removed = 0
+
+    orphans = set()
+    for directory in (reports_dir, os.path.join(reports_dir, 'profiles')):
+        if not os.path.isdir(directory):
+            continue
+        for entry in os.scandir(directory):
+            if not entry.is_file() or entry.stat().st_mtime >= cutoff:
+                continue
+            if directory == reports_dir and not entry.name.endswith('.tmp'):
+                match = REPORT_FILE.match(entry.name)
+                if match:
+                    orphans.add(match.group('report_id'))
+                continue
+            # Temporary files and profiles
+            os.remove(entry.path)
+            removed += 1
+
+    existing = set()
+    orphans = sorted(orphans)
+    for i in range(0, len(orphans), UptimeEngine.MAX_IN_CLAUSE):
+        chunk = orphans[i:i + UptimeEngine.MAX_IN_CLAUSE]
+        existing.update(db.session.execute(
+            select(ReportTask.report_id).where(ReportTask.report_id.in_(chunk))).scalars())
+    for report_id in orphans:
+        if report_id not in existing:
+            ReportUtils.remove_report_files(report_id, app.config['REPORT_ARCHIVE_DIR'])
+            removed += 1
+    return removed
+
+
+def vacuum():
+    """
+    Reclaims the space freed by compaction and expiry and refreshes the query planner statistics:
+    VACUUM and ANALYZE on SQLite (then truncates the WAL), VACUUM ANALYZE on PostgreSQL and OPTIMIZE
+    TABLE on MySQL.
+    """
+    db.session.close()
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        dialect = connection.dialect.name
+        if dialect == 'sqlite':
+            connection.execute(text("VACUUM"))
+            connection.execute(text("ANALYZE"))
+            connection.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+        elif dialect == 'postgresql':
+            connection.execute(text("VACUUM ANALYZE"))
+        elif dialect == 'mysql':
+            preparer = connection.dialect.identifier_preparer
+            tables = ", ".join(preparer.format_table(table) for table in db.metadata.sorted_tables)
+            connection.execute(text(f"OPTIMIZE TABLE {tables}"))
+        else:
+            connection.execute(text("ANALYZE"))
+    log.info("Vacuumed and analyzed the database")
+
+
+def run_maintenance(poll_retention=None, report_max_age=None, vacuum_database=True):
+    """
+    Runs the retention policy: compacts old polls, expires old rollup rows and change records, evicts
+    old reports and orphaned report files, then vacuums the database.
+
+    Args:
+        poll_retention (datetime.timedelta): How far before the latest poll raw polls are kept.
+            Defaults to POLL_RETENTION_DAYS.
+        report_max_age (datetime.timedelta): The age after which reports are evicted. Defaults to
+            REPORT_MAX_AGE_HOURS; reports are kept when both are None.
+        vacuum_database (bool): Whether to VACUUM/ANALYZE afterwards.
+
+    Returns:
+        dict: What was compacted, expired and evicted.
+
+    Raises:
+        ValueError: If poll_retention is shorter than the longest report window plus its margins.
+    """
+    poll_retention = poll_retention or datetime.timedelta(days=app.config['POLL_RETENTION_DAYS'])
+    if poll_retention < MIN_POLL_RETENTION:
+        raise ValueError(f"Poll retention must be at least {MIN_POLL_RETENTION}")
+    if report_max_age is None and app.config['REPORT_MAX_AGE_HOURS']:
+        report_max_age = datetime.timedelta(hours=app.config['REPORT_MAX_AGE_HOURS'])
+
+    summary = {'compacted_polls': 0, 'runs': 0, 'expired_rollup_rows': 0, 'expired_changes': 0,
+               'evicted_reports': 0, 'removed_files': 0}
+    latest = db.session.query(func.max(StoreStatus.timestamp)).scalar()
+    if latest is not None:
+        summary['compacted_polls'], summary['runs'] = compact_polls(latest - poll_retention)
+        summary['expired_rollup_rows'] = expire_rollup(latest)
+        if summary['compacted_polls']:
+            StatusTimeline.build().save(app.config['STATUS_TIMELINE_PATH'])
+    # A rolling report more than an hour old is recomputed in full, so older changes are not needed
+    summary['expired_changes'] = expire_changes(poll_retention)
+    if report_max_age is not None:
+        summary['evicted_reports'] = ReportUtils.evict_reports(report_max_age)
+        summary['removed_files'] = expire_report_files(report_max_age)
+    if vacuum_database:
+        vacuum()
+
+    log.info("Maintenance done: %s", summary)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compact old polls, expire old reports and vacuum the database.")
+    parser.add_argument('--poll-retention-days', type=float,
+                        help="days of raw polls to keep before the latest one (default: POLL_RETENTION_DAYS)")
+    parser.add_argument('--report-max-age-hours', type=float,
+                        help="age after which reports are evicted (default: REPORT_MAX_AGE_HOURS)")
+    parser.add_argument('--no-vacuum', action='store_true', help="skip VACUUM/ANALYZE")
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        run_maintenance(
+            datetime.timedelta(days=args.poll_retention_days) if args.poll_retention_days else None,
+            datetime.timedelta(hours=args.report_max_age_hours) if args.report_max_age_hours else None,
+            not args.no_vacuum)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,435 @@
+import argparse
+import datetime
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from benchmarks import synthetic_data
+from benchmarks.run_benchmarks import git_commit, timed
+
+# Relative weights of the endpoints in the default traffic mix
+DEFAULT_MIX = {
+    'trigger_report': 1,
+    'get_report': 6,
+    'download_report': 2,
+    'report_progress': 2,
+    'store_uptime': 3,
+}
+
+# Triggers within the same day reuse the seeded report, so only the writer process generates reports
+REPORT_FRESHNESS_SECONDS = 86400
+# Longest wait for the API server to become ready, in seconds
+STARTUP_TIMEOUT = 120
+
+
+def parse_mix(value):
+    """
+    Parses a traffic mix like "get_report=6,store_uptime=3" into endpoint weights.
+    """
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        if name.strip() not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown endpoint: {name.strip()}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def percentiles(latencies):
+    if not latencies:
+        return {}
+    latencies = np.array(latencies) * 1000
+    return {
+        'mean_ms': round(float(latencies.mean()), 3),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 3),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 3),
+        'max_ms': round(float(latencies.max()), 3),
+    }
+
+
+def seed(data_dir, stores, days, poll_minutes, end, seed_value):
+    """
+    Generates synthetic data ending at `end` and loads it into the database configured through DATABASE_URL.
+
+    Returns:
+        tuple: The rows generated per file and the store IDs.
+    """
+    counts = synthetic_data.generate(data_dir, stores, days, poll_minutes, end, seed_value)
+
+    # The app reads DATABASE_URL and REPORTS_DIR when it is first imported
+    from app import app, db
+    from app import csv2DB, migrations
+    from app.models import TimeZone
+
+    with app.app_context():
+        migrations.upgrade()
+        csv2DB.add_data_from_csv(data_dir)
+        store_ids = [store_id for store_id, in db.session.query(TimeZone.store_id)]
+    return counts, store_ids
+
+
+def serve(args):
+    """
+    Serves the API on a threaded development server, with Celery on a local stand-in broker.
+
+    With the memory broker, the chord of each report is delivered through Celery's in-memory transport
+    to a worker running in threads of this process. With the eager broker, reports run inside the
+    trigger request.
+    """
+    import werkzeug.serving
+
+    import main
+    from app import app, celery
+    from app.log import log
+
+    app.config['REPORT_MAX_AGE_HOURS'] = None
+    # The readiness check only pings Redis brokers
+    app.config['CELERY_BROKER_URL'] = 'memory://'
+    if args.broker == 'eager':
+        celery.conf.task_always_eager = True
+    else:
+        from celery.contrib.testing.worker import start_worker
+
+        celery.conf.update(broker_url='memory://', result_backend='cache+memory://',
+                           broker_transport_options={'polling_interval': 0.01}, worker_hijack_root_logger=False)
+        worker = start_worker(celery, pool='threads', concurrency=args.worker_threads,
+                              perform_ping_check=False, loglevel='WARNING')
+        worker.__enter__()
+
+    # The development server logs every request
+    log.getLogger('werkzeug').setLevel(args.log_level)
+    server = werkzeug.serving.make_server('127.0.0.1', args.port, main.app, threaded=True)
+    server.serve_forever()
+
+
+def write_reports(args):
+    """
+    Generates fresh reports one after the other until standard input is closed, the way a Celery worker
+    process would, and prints the ID of each report as it starts.
+    """
+    from app import app, celery, db
+    from app.Task import generate_reports_task
+    from app.models import ReportTask, TimeZone
+
+    celery.conf.task_always_eager = True
+    app.config['REPORT_MAX_AGE_HOURS'] = None
+    stop = threading.Event()
+    threading.Thread(target=lambda: (sys.stdin.read(), stop.set()), daemon=True).start()
+    durations = []
+
+    print('ready', flush=True)
+    while not stop.is_set():
+        report_id = 'load%05d' % len(durations)
+        current_timestamp = datetime.datetime.utcnow()
+        with app.app_context():
+            stores_info = [{"store_id": store_id, "timezone_str": None}
+                           for store_id, in db.session.query(TimeZone.store_id)]
+            db.session.add(ReportTask(report_id=report_id, status="Running", stores_total=len(stores_info),
+                                      timestamp=current_timestamp))
+            db.session.commit()
+        print(report_id, flush=True)
+        _, seconds = timed(generate_reports_task, report_id, current_timestamp, stores_info)
+        durations.append(seconds)
+    print(json.dumps({'reports': len(durations), 'mean_seconds': round(float(np.mean(durations)), 3)
+                      if durations else None}), flush=True)
+
+
+class LoadClient(threading.Thread):
+    """
+    A client thread sending requests from the traffic mix back to back over one keep-alive connection.
+    """
+
+    def __init__(self, port, mix, state, deadline, rng):
+        super().__init__(daemon=True)
+        self.port = port
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.state = state
+        self.deadline = deadline
+        self.rng = rng
+        self.connection = None
+        self.samples = []
+
+    def build_request(self, name):
+        state = self.state
+        if name == 'trigger_report':
+            return 'POST', '/trigger_report'
+        if name == 'get_report':
+            return 'GET', f"/get_report/{self.rng.choice(state['report_ids'])}"
+        if name == 'download_report':
+            return 'GET', f"/get_report/{state['complete_report_id']}/csv"
+        if name == 'report_progress':
+            return 'GET', f"/report_progress/{self.rng.choice(state['report_ids'])}?wait=0"
+        hours = self.rng.choice((1, 6, 24, 24 * 7))
+        end = state['data_end'] - datetime.timedelta(minutes=self.rng.randrange(0, 24 * 60, 15))
+        start = end - datetime.timedelta(hours=hours)
+        return 'GET', (f"/stores/{self.rng.choice(state['store_ids'])}/uptime"
+                       f"?start={start.isoformat()}&end={end.isoformat()}")
+
+    def send(self, method, path):
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        try:
+            self.connection.request(method, path, headers={'Accept-Encoding': 'gzip'})
+            response = self.connection.getresponse()
+            body = response.read()
+            return response.status, body
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = None
+            return None, b''
+
+    def run(self):
+        while time.monotonic() < self.deadline:
+            name = self.rng.choices(self.names, self.weights)[0]
+            method, path = self.build_request(name)
+            started = time.perf_counter()
+            status, body = self.send(method, path)
+            self.samples.append((name, time.perf_counter() - started, status is not None and status < 500))
+            if name == 'trigger_report' and status == 200:
+                report_id = json.loads(body).get('report_id')
+                if report_id and report_id not in self.state['report_ids']:
+                    self.state['report_ids'].append(report_id)
+        if self.connection is not None:
+            self.connection.close()
+
+
+def run_phase(args, mix, state, rng):
+    """
+    Drives the traffic mix from `concurrency` client threads for `duration` seconds.
+
+    Returns:
+        dict: The request count, errors, throughput and latency percentiles per endpoint, and overall.
+    """
+    deadline = time.monotonic() + args.duration
+    clients = [LoadClient(args.port, mix, state, deadline, random.Random(rng.random()))
+               for _ in range(args.concurrency)]
+    started = time.perf_counter()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    seconds = time.perf_counter() - started
+
+    samples = [sample for client in clients for sample in client.samples]
+    results = {}
+    for name in sorted(mix) + ['all']:
+        latencies = [latency for endpoint, latency, _ in samples if name in ('all', endpoint)]
+        errors = sum(1 for endpoint, _, ok in samples if name in ('all', endpoint) and not ok)
+        results[name] = dict({'requests': len(latencies), 'errors': errors,
+                              'requests_per_sec': round(len(latencies) / seconds, 1)}, **percentiles(latencies))
+    return results
+
+
+def role_command(role, args):
+    return [sys.executable, '-m', 'benchmarks.load_test', '--role', role, '--port', str(args.port),
+            '--broker', args.broker, '--worker-threads', str(args.worker_threads), '--log-level', args.log_level]
+
+
+def start_writer(args, env):
+    """
+    Starts the writer process and waits until it prints that it is ready.
+    """
+    process = subprocess.Popen(role_command('writer', args), env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               text=True)
+    line = process.stdout.readline()
+    if line.strip() != 'ready':
+        process.kill()
+        raise RuntimeError("The writer process failed to start")
+    return process
+
+
+def start_server(args, env):
+    """
+    Starts the API server and waits until its readiness endpoint answers.
+
+    The gunicorn server runs the production configuration of gunicorn.conf.py with `workers` preforked
+    workers. As the in-memory broker cannot reach across its worker processes, reports run on the local
+    executor there.
+
+    Returns:
+        tuple: The server process and the seconds it took to become ready.
+    """
+    if args.server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:application']
+        env = dict(env, WEB_BIND=f'127.0.0.1:{args.port}', WEB_CONCURRENCY=str(args.workers), WEB_MIGRATE='0',
+                   WEB_LOG_LEVEL=args.log_level.lower(), LOG_LEVEL=args.log_level, REPORT_EXECUTOR='local')
+    else:
+        command = role_command('server', args)
+    started = time.perf_counter()
+    process = subprocess.Popen(command, env=env)
+
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("The server process failed to start")
+        try:
+            status, _ = request_json(args.port, 'GET', '/ready')
+            if status == 200:
+                return process, time.perf_counter() - started
+        except OSError:
+            pass
+        time.sleep(0.05)
+    process.kill()
+    raise RuntimeError(f"The server was not ready within {STARTUP_TIMEOUT}s")
+
+
+def read_writer_output(writer, state):
+    """
+    Collects the IDs of the reports the writer process starts, then its summary.
+    """
+    for line in iter(writer.stdout.readline, ''):
+        if line.startswith('{'):
+            state['writer'] = json.loads(line)
+        elif line.strip():
+            state['report_ids'].append(line.strip())
+
+
+def request_json(port, method, path):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        connection.request(method, path)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read() or b'null')
+    finally:
+        connection.close()
+
+
+def wait_for_report(port, report_id, timeout=600):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status, body = request_json(port, 'GET', f'/get_report/{report_id}')
+        # A completed report answers with a capitalised Status
+        if body.get('Status') == 'Complete':
+            return
+        if status >= 500 or body.get('status') == 'Failed':
+            raise RuntimeError(f"Report {report_id} failed: {body}")
+        time.sleep(0.1)
+    raise RuntimeError(f"Report {report_id} did not complete within {timeout}s")
+
+
+def run(args):
+    """
+    Seeds a database, starts the API and measures each phase of traffic: first with no report being
+    generated, then while a writer process generates reports back to back.
+
+    Returns:
+        dict: The parameters and the results per phase.
+    """
+    workdir = args.workdir or tempfile.mkdtemp(prefix='storemonitoring-load-')
+    data_dir = os.path.join(workdir, 'data')
+    # A file database, as concurrent requests cannot share the single connection of an in-memory one
+    database = os.path.join(workdir, 'load.db')
+    for path in (database, database + '-wal', database + '-shm'):
+        if os.path.exists(path):
+            os.remove(path)
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{database}', REPORTS_DIR=os.path.join(workdir, 'reports'),
+               REPORT_EXECUTOR='celery', REPORT_EVENTS='memory',
+               REPORT_FRESHNESS_SECONDS=str(REPORT_FRESHNESS_SECONDS))
+    os.environ.update(env)
+
+    # The data ends now, so the reports and the uptime queries cover polls
+    data_end = datetime.datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    (counts, store_ids), seconds = timed(seed, data_dir, args.stores, args.days, args.poll_minutes, data_end,
+                                         args.seed)
+    print(f"Seeded {counts} in {seconds:.1f}s under {workdir}", file=sys.stderr)
+
+    rng = random.Random(args.seed)
+    server, startup_seconds = start_server(args, env)
+    print(f"Server ready in {startup_seconds:.2f}s", file=sys.stderr)
+    try:
+        _, body = request_json(args.port, 'POST', '/trigger_report')
+        report_id = body['report_id']
+        _, seconds = timed(wait_for_report, args.port, report_id)
+        print(f"Seed report {report_id} completed in {seconds:.1f}s", file=sys.stderr)
+        state = {'report_ids': [report_id], 'complete_report_id': report_id, 'store_ids': store_ids,
+                 'data_end': data_end}
+
+        phases = {'idle': run_phase(args, args.mix, state, rng)}
+        print("Measured the idle phase", file=sys.stderr)
+
+        writer = start_writer(args, env)
+        # Running reports are queried alongside the completed ones
+        reader = threading.Thread(target=read_writer_output, args=(writer, state), daemon=True)
+        reader.start()
+        phases['writing'] = run_phase(args, args.mix, state, rng)
+        writer.stdin.close()
+        writer.wait()
+        reader.join()
+        phases['writing']['reports_written'] = state.get('writer')
+        print("Measured the writing phase", file=sys.stderr)
+    finally:
+        server.terminate()
+        server.wait()
+
+    return {
+        'params': {'stores': args.stores, 'days': args.days, 'poll_minutes': args.poll_minutes,
+                   'polls': counts['store-status.csv'], 'seed': args.seed, 'server': args.server,
+                   'workers': args.workers if args.server == 'gunicorn' else None,
+                   'broker': args.broker if args.server == 'werkzeug' else None,
+                   'concurrency': args.concurrency, 'duration': args.duration, 'mix': args.mix},
+        'startup_seconds': round(startup_seconds, 3),
+        'results': phases,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the API with a mixed traffic of concurrent clients.")
+    parser.add_argument('--stores', type=int, default=1000, help="number of synthetic stores")
+    parser.add_argument('--days', type=int, default=8, help="days of synthetic polls")
+    parser.add_argument('--poll-minutes', type=int, default=60, help="average minutes between polls of a store")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', help="directory for the data, database and reports (default: a temporary one)")
+    parser.add_argument('--duration', type=float, default=20, help="seconds of traffic per phase")
+    parser.add_argument('--concurrency', type=int, default=8, help="number of concurrent clients")
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help="endpoint weights, like get_report=6,store_uptime=3 (default: %(default)s)")
+    parser.add_argument('--server', choices=('werkzeug', 'gunicorn'), default='werkzeug',
+                        help="the threaded development server, or gunicorn with the production configuration")
+    parser.add_argument('--workers', type=int, default=4, help="gunicorn worker processes")
+    parser.add_argument('--broker', choices=('memory', 'eager'), default='memory',
+                        help="Celery's stand-in broker: an in-memory transport with a worker in the server "
+                             "process, or eager tasks run inside the trigger request")
+    parser.add_argument('--worker-threads', type=int, default=4, help="threads of the in-memory Celery worker")
+    parser.add_argument('--port', type=int, default=5099, help="port of the API server")
+    parser.add_argument('--log-level', default='WARNING', help="log level of the server and writer processes")
+    parser.add_argument('--role', choices=('harness', 'server', 'writer'), default='harness',
+                        help=argparse.SUPPRESS)
+    parser.add_argument('--output', help="JSON results file (default: standard output)")
+    args = parser.parse_args(argv)
+
+    if args.role != 'harness':
+        from app.log import log
+        log.getLogger().setLevel(args.log_level)
+    if args.role == 'server':
+        return serve(args)
+    if args.role == 'writer':
+        return write_reports(args)
+
+    document = dict({
+        'benchmark': 'store-monitoring-load',
+        'created_at': datetime.datetime.utcnow().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+    }, **run(args))
+
+    output = json.dumps(document, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
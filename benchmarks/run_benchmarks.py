@@ -0,0 +1,135 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks import synthetic_data
+
+DATA_END = datetime.datetime(2023, 1, 25, 18)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def throughput(rows, seconds):
+    return {'seconds': round(seconds, 4), 'rows': rows, 'rows_per_sec': round(rows / seconds, 1) if seconds else None}
+
+
+def run(args, data_dir):
+    """
+    Runs every benchmark stage against the database configured through DATABASE_URL.
+
+    Returns:
+        dict: The results per stage.
+    """
+    # The app reads DATABASE_URL and REPORTS_DIR when it is first imported
+    from app import app, celery, db
+    from app import csv2DB, migrations
+    from app.HourlyRollup import HourlyRollup
+    from app.ReportUtils import ReportUtils
+    from app.Task import generate_reports_task
+    from app.models import ReportTask, TimeZone
+
+    celery.conf.task_always_eager = True
+    app.config['REPORT_MAX_AGE_HOURS'] = None
+    results = {}
+
+    with app.app_context():
+        migrations.upgrade()
+
+        for source in csv2DB.SOURCES:
+            rows, seconds = timed(csv2DB.load_csv, source, data_dir)
+            results[f'ingest_{source}'] = throughput(rows, seconds)
+        rows, seconds = timed(HourlyRollup.rebuild, csv2DB.latest_poll_timestamp())
+        results['ingest_rollup'] = throughput(rows, seconds)
+
+        store_ids = [store_id for store_id, in db.session.query(TimeZone.store_id)]
+        sample = random.Random(args.seed).sample(store_ids, min(args.sample_stores, len(store_ids)))
+        durations = []
+        for store_id in sample:
+            _, seconds = timed(ReportUtils.calculate_uptime_downtime, store_id,
+                               DATA_END - datetime.timedelta(weeks=1), DATA_END)
+            durations.append(seconds * 1000)
+        results['per_store_uptime'] = {
+            'stores': len(durations),
+            'mean_ms': round(float(np.mean(durations)), 3),
+            'p50_ms': round(float(np.percentile(durations, 50)), 3),
+            'p95_ms': round(float(np.percentile(durations, 95)), 3),
+        }
+
+        stores_info = [{"store_id": store_id, "timezone_str": None} for store_id in store_ids]
+        for name, use_rollup in (('report_raw', False), ('report_rollup', True)):
+            app.config['REPORT_USE_ROLLUP'] = use_rollup
+            report_id = f"bench{int(use_rollup)}"
+            db.session.add(ReportTask(report_id=report_id, status="Running"))
+            db.session.commit()
+            _, seconds = timed(generate_reports_task, report_id, DATA_END, stores_info)
+            results[name] = throughput(len(store_ids), seconds)
+
+        csv_data, seconds = timed(ReportUtils.generate_report_csv_data, 'bench1')
+        results['export_csv'] = dict(throughput(len(store_ids), seconds), bytes=len(csv_data))
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, computation, reports and export on synthetic data.")
+    parser.add_argument('--stores', type=int, default=1000, help="number of synthetic stores")
+    parser.add_argument('--days', type=int, default=8, help="days of synthetic polls")
+    parser.add_argument('--poll-minutes', type=int, default=60, help="average minutes between polls of a store")
+    parser.add_argument('--sample-stores', type=int, default=50, help="stores timed one by one for per-store computation")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', help="directory for the data, database and reports (default: a temporary one)")
+    parser.add_argument('--output', help="JSON results file (default: standard output)")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='storemonitoring-bench-')
+    data_dir = os.path.join(workdir, 'data')
+    database = os.path.join(workdir, 'bench.db')
+    if os.path.exists(database):
+        os.remove(database)
+    os.environ['DATABASE_URL'] = f'sqlite:///{database}'
+    os.environ['REPORTS_DIR'] = os.path.join(workdir, 'reports')
+
+    counts, seconds = timed(synthetic_data.generate, data_dir, args.stores, args.days, args.poll_minutes,
+                            DATA_END, args.seed)
+    print(f"Generated {counts} in {seconds:.1f}s under {workdir}", file=sys.stderr)
+
+    document = {
+        'benchmark': 'store-monitoring',
+        'created_at': datetime.datetime.utcnow().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'params': {'stores': args.stores, 'days': args.days, 'poll_minutes': args.poll_minutes,
+                   'polls': counts['store-status.csv'], 'seed': args.seed},
+        'results': run(args, data_dir),
+    }
+
+    output = json.dumps(document, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
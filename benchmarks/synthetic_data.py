@@ -0,0 +1,86 @@
+import argparse
+import csv
+import datetime
+import os
+import random
+
+TIMEZONES = ('America/Chicago', 'America/New_York', 'America/Denver', 'America/Los_Angeles', 'America/Boise')
+
+
+def generate(data_dir, stores=1000, days=8, poll_minutes=60, end=None, seed=0):
+    """
+    Writes synthetic Menu-hours.csv, store-status.csv and timezone.csv files in the format of the real dumps.
+
+    Polls are spread around one every poll_minutes per store, about 90% of them active. A third of the
+    stores have no business hours (open 24x7), one store in twenty has no time zone, and the others get
+    one shift per day, some of them running past midnight.
+
+    Args:
+        data_dir (str): The directory receiving the CSV files.
+        stores (int): The number of stores.
+        days (int): The number of days of polls, ending at `end`.
+        poll_minutes (int): The average interval between two polls of a store.
+        end (datetime.datetime): The time of the latest polls. Defaults to 2023-01-25 18:00 UTC.
+        seed (int): The random seed.
+
+    Returns:
+        dict: The number of rows written per file.
+    """
+    rng = random.Random(seed)
+    end = end or datetime.datetime(2023, 1, 25, 18)
+    start = end - datetime.timedelta(days=days)
+    store_ids = rng.sample(range(10 ** 17, 9 * 10 ** 18), stores)
+    os.makedirs(data_dir, exist_ok=True)
+    counts = {'Menu-hours.csv': 0, 'store-status.csv': 0, 'timezone.csv': 0}
+
+    with open(os.path.join(data_dir, 'timezone.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(('store_id', 'timezone_str'))
+        for store_id in store_ids:
+            if rng.random() >= 0.05:
+                writer.writerow((store_id, rng.choice(TIMEZONES)))
+                counts['timezone.csv'] += 1
+
+    with open(os.path.join(data_dir, 'Menu-hours.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(('store_id', 'day', 'start_time_local', 'end_time_local'))
+        for store_id in store_ids:
+            if rng.random() < 1 / 3:
+                continue
+            for day in range(7):
+                opening = datetime.time(rng.randint(5, 12), rng.choice((0, 30)))
+                closing = datetime.time(rng.choice((0, 1, 2, 17, 20, 22, 23)), 59, 59)
+                writer.writerow((store_id, day, opening.strftime('%H:%M:%S'), closing.strftime('%H:%M:%S')))
+                counts['Menu-hours.csv'] += 1
+
+    with open(os.path.join(data_dir, 'store-status.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(('store_id', 'status', 'timestamp_utc'))
+        spread = poll_minutes * 60
+        for store_id in store_ids:
+            t = start + datetime.timedelta(seconds=rng.uniform(0, spread))
+            while t < end:
+                status = 'active' if rng.random() < 0.9 else 'inactive'
+                # The real dumps mix timestamps with and without fractional seconds
+                timestamp_format = '%Y-%m-%d %H:%M:%S.%f UTC' if rng.random() < 0.5 else '%Y-%m-%d %H:%M:%S UTC'
+                timestamp = t.strftime(timestamp_format)
+                writer.writerow((store_id, status, timestamp))
+                counts['store-status.csv'] += 1
+                t += datetime.timedelta(seconds=rng.uniform(0.5 * spread, 1.5 * spread))
+
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic store monitoring CSV dumps.")
+    parser.add_argument('data_dir', help="directory receiving the CSV files")
+    parser.add_argument('--stores', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=8)
+    parser.add_argument('--poll-minutes', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    print(generate(args.data_dir, args.stores, args.days, args.poll_minutes, seed=args.seed))
+
+
+if __name__ == '__main__':
+    main()
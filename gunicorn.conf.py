@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+import time
+
+# When the master started booting, for the startup time logged once it is ready
+started = time.monotonic()
+
+from app.database import env_int  # noqa: E402
+
+# Production server configuration of the API: gunicorn -c gunicorn.conf.py wsgi:application
+# Every setting can be overridden through the environment, and gunicorn's own command line flags win over both.
+
+bind = os.environ.get('WEB_BIND', '0.0.0.0:8000')
+# Preforked worker processes
+workers = env_int('WEB_CONCURRENCY', min(2 * (os.cpu_count() or 1) + 1, 8))
+# Threaded workers, as a /report_progress long poll holds its thread for up to a minute
+worker_class = 'gthread'
+threads = env_int('WEB_THREADS', 8)
+# Import the app once in the master and fork the workers from it, rather than importing it in every worker
+preload_app = os.environ.get('WEB_PRELOAD', '1') != '0'
+# Longer than the longest /report_progress long poll
+timeout = env_int('WEB_TIMEOUT', 90)
+graceful_timeout = env_int('WEB_GRACEFUL_TIMEOUT', 30)
+keepalive = env_int('WEB_KEEPALIVE', 5)
+# Workers are replaced after this many requests (0 never replaces them), jittered so they do not restart together
+max_requests = env_int('WEB_MAX_REQUESTS', 0)
+max_requests_jitter = max_requests // 10
+# Access log destination, '-' for standard output (unset disables it)
+accesslog = os.environ.get('WEB_ACCESS_LOG')
+loglevel = os.environ.get('WEB_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    # Upgrade the schema once, before any worker serves a request. It runs in a child process so the
+    # master does not open database connections that the forked workers would inherit.
+    if os.environ.get('WEB_MIGRATE', '1') != '0':
+        subprocess.run([sys.executable, '-m', 'app.migrations'], check=True)
+
+
+def when_ready(server):
+    server.log.info("Master ready in %.3fs (%d workers, %d threads each, preload %s)",
+                    time.monotonic() - started, server.num_workers, threads, preload_app)
+
+
+def post_fork(server, worker):
+    worker.boot_started = time.monotonic()
+    # Connections pooled by the master must not be shared by the forked workers. The worker drops them
+    # from its pool without closing them, as they still belong to the master.
+    if preload_app:
+        from app import app, db
+
+        with app.app_context():
+            db.engine.dispose(close=False)
+
+
+def post_worker_init(worker):
+    worker.log.info("Worker %s booted in %.3fs", worker.pid, time.monotonic() - worker.boot_started)
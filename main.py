@@ -1,11 +1,26 @@
+import os
+
+from app import HealthResource
+from app import ReportMetricsResource
+from app import ReportProgressResource
 from app import ReportResource
+from app import StoreUptimeResource
 from app import TriggerReportResource
-from app import app, api, db
+from app import app, api
+from app import migrations
 
 api.add_resource(ReportResource.ReportResource, '/get_report/<string:report_id>')
+api.add_resource(ReportResource.ReportDownloadResource, '/get_report/<string:report_id>/csv')
 api.add_resource(TriggerReportResource.TriggerReportResource, '/trigger_report')
+api.add_resource(ReportMetricsResource.ReportMetricsResource, '/report_metrics/<string:report_id>')
+api.add_resource(ReportProgressResource.ReportProgressResource, '/report_progress/<string:report_id>')
+api.add_resource(StoreUptimeResource.StoreUptimeResource, '/stores/<int:store_id>/uptime')
+api.add_resource(StoreUptimeResource.StoreUptimeBatchResource, '/stores/uptime')
+api.add_resource(HealthResource.HealthResource, '/health')
+api.add_resource(HealthResource.ReadinessResource, '/ready')
 
 if __name__ == "__main__":
     with app.app_context():
-        db.create_all()
-    app.run(debug=True)
+        migrations.upgrade()
+    # Development server; in production the API is served by gunicorn (see gunicorn.conf.py)
+    app.run(debug=os.environ.get('FLASK_DEBUG', '1') != '0')
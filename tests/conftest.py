@@ -0,0 +1,52 @@
+import os
+import tempfile
+
+import pytest
+
+WORKDIR = tempfile.mkdtemp(prefix='storemonitoring-tests-')
+# The app reads DATABASE_URL and REPORTS_DIR when it is first imported
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ['REPORTS_DIR'] = os.path.join(WORKDIR, 'reports')
+os.environ['REPORT_EXECUTOR'] = 'local'
+os.environ['REPORT_EVENTS'] = 'memory'
+
+from app import app, db, migrations  # noqa: E402
+from app import csv2DB  # noqa: E402
+from tests.helpers import write_data  # noqa: E402
+
+
+@pytest.fixture
+def database():
+    """
+    Yields the app's database with an empty schema, inside an app context.
+    """
+    with app.app_context():
+        migrations.upgrade()
+        yield db
+        db.session.remove()
+        db.drop_all()
+    if os.path.exists(app.config['STATUS_TIMELINE_PATH']):
+        os.remove(app.config['STATUS_TIMELINE_PATH'])
+
+
+@pytest.fixture(params=[True, False], ids=['timeline', 'sql'])
+def timeline_enabled(request):
+    """
+    Runs a test with polls read from the status timeline snapshot, then from the database.
+    """
+    enabled = app.config['STATUS_TIMELINE_ENABLED']
+    app.config['STATUS_TIMELINE_ENABLED'] = request.param
+    yield request.param
+    app.config['STATUS_TIMELINE_ENABLED'] = enabled
+
+
+@pytest.fixture
+def load_data(database, tmp_path):
+    """
+    Returns a function writing the CSV dumps (see write_data) and loading them into the database.
+    """
+    def load(polls, timezones=(), menu_hours=()):
+        write_data(str(tmp_path), polls, timezones, menu_hours)
+        return csv2DB.add_data_from_csv(str(tmp_path))
+
+    return load
@@ -0,0 +1,26 @@
+import csv
+import os
+
+
+def write_csv(path, header, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def write_data(data_dir, polls, timezones=(), menu_hours=()):
+    """
+    Writes the three CSV dumps.
+
+    Args:
+        data_dir (str): The directory receiving the files.
+        polls (list of tuple): (store_id, status, naive UTC datetime) rows.
+        timezones (list of tuple): (store_id, timezone_str) rows.
+        menu_hours (list of tuple): (store_id, day, start 'HH:MM:SS', end 'HH:MM:SS') rows.
+    """
+    write_csv(os.path.join(data_dir, 'store-status.csv'), ('store_id', 'status', 'timestamp_utc'),
+              [(store_id, status, f"{timestamp:%Y-%m-%d %H:%M:%S} UTC") for store_id, status, timestamp in polls])
+    write_csv(os.path.join(data_dir, 'timezone.csv'), ('store_id', 'timezone_str'), timezones)
+    write_csv(os.path.join(data_dir, 'Menu-hours.csv'), ('store_id', 'day', 'start_time_local', 'end_time_local'),
+              menu_hours)
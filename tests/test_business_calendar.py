@@ -0,0 +1,43 @@
+import datetime
+
+import pytest
+
+from app.BusinessCalendar import BusinessCalendar
+from app.UptimeEngine import to_epoch
+
+D = datetime.datetime
+SATURDAY = 5
+# Saturday 22:00 to Sunday 03:00, local time
+LATE_SHIFT = ((SATURDAY, 22 * 3600, 3 * 3600),)
+
+
+def intervals(timezone_str, schedule, start, end):
+    starts, ends = BusinessCalendar('America/Chicago').intervals(timezone_str, schedule, to_epoch(start),
+                                                                 to_epoch(end))
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+@pytest.mark.parametrize('saturday, start, end', [
+    # EST all night: 03:00 to 08:00 UTC
+    (datetime.date(2023, 1, 21), D(2023, 1, 22, 3), D(2023, 1, 22, 8)),
+    # Clocks go forward at 02:00, so the shift ends at 03:00 EDT after four hours
+    (datetime.date(2023, 3, 11), D(2023, 3, 12, 3), D(2023, 3, 12, 7)),
+    # Clocks go back at 02:00, so the shift ends at 03:00 EST after six hours
+    (datetime.date(2023, 11, 4), D(2023, 11, 5, 2), D(2023, 11, 5, 8)),
+])
+def test_shift_past_midnight_across_dst(saturday, start, end):
+    first = D(saturday.year, saturday.month, saturday.day)
+    assert intervals('America/New_York', LATE_SHIFT, first, first + datetime.timedelta(days=2)) == \
+        [(to_epoch(start), to_epoch(end))]
+
+
+def test_shift_starting_in_the_next_utc_week():
+    # Sunday 22:00 EST is Monday 03:00 UTC, in the UTC week after the local one
+    schedule = ((6, 22 * 3600, 2 * 3600),)
+    assert intervals('America/New_York', schedule, D(2023, 1, 22), D(2023, 1, 24)) == \
+        [(to_epoch(D(2023, 1, 23, 3)), to_epoch(D(2023, 1, 23, 7)))]
+
+
+def test_stores_without_hours_are_open_around_the_clock():
+    assert intervals(None, (), D(2023, 1, 22, 5), D(2023, 1, 24)) == \
+        [(to_epoch(D(2023, 1, 22, 5)), to_epoch(D(2023, 1, 23))), (to_epoch(D(2023, 1, 23)), to_epoch(D(2023, 1, 24)))]
@@ -0,0 +1,103 @@
+import datetime
+import os
+
+import numpy as np
+import pytest
+
+from app import csv2DB
+from app.StatusTimeline import StatusTimeline
+from app.models import IngestWatermark, MenuHours, StoreChange, StoreStatus, StoreStatusEnum
+from tests.helpers import write_data
+
+D = datetime.datetime
+ACTIVE, INACTIVE = StoreStatusEnum.ACTIVE, StoreStatusEnum.INACTIVE
+POLLS = [(1, 'active', D(2023, 1, 25, 10)), (1, 'inactive', D(2023, 1, 25, 11)), (2, 'active', D(2023, 1, 25, 10, 30))]
+
+
+def ingested(database):
+    query = database.session.query(StoreStatus.store_id, StoreStatus.status, StoreStatus.timestamp)
+    return [tuple(row) for row in query.order_by(StoreStatus.store_id, StoreStatus.timestamp)]
+
+
+def append(data_dir):
+    return csv2DB.add_data_from_csv(data_dir, sources=('store_status',), incremental=True)['store_status']
+
+
+def assert_timeline_current():
+    timeline, built = StatusTimeline.current(), StatusTimeline.build()
+    assert timeline is not None
+    for name in StatusTimeline.ARRAYS:
+        assert np.array_equal(getattr(timeline, name), getattr(built, name))
+
+
+def test_parse_timestamp():
+    assert csv2DB.parse_timestamp('2023-01-22 12:09:39.388884 UTC') == D(2023, 1, 22, 12, 9, 39, 388884)
+    # Fractions of fewer than six digits, which datetime.fromisoformat only reads from Python 3.11 on
+    assert csv2DB.parse_timestamp('2023-01-22 12:09:39.38888 UTC') == D(2023, 1, 22, 12, 9, 39, 388880)
+    assert csv2DB.parse_timestamp('2023-01-22 12:09:39.5 UTC') == D(2023, 1, 22, 12, 9, 39, 500000)
+    assert csv2DB.parse_timestamp('2023-01-22 12:09:39 UTC') == D(2023, 1, 22, 12, 9, 39)
+    assert csv2DB.parse_timestamp('2023-01-22 12:09:39') == D(2023, 1, 22, 12, 9, 39)
+    with pytest.raises(ValueError):
+        csv2DB.parse_timestamp('2023-01-22T12:09:39Z')
+
+
+def test_append_after_the_file_was_replaced(load_data, database, tmp_path):
+    load_data(POLLS, timezones=[(1, 'UTC'), (2, 'UTC')])
+
+    # The new dump lists the polls in another order, with an old poll that was not in the previous one, a new
+    # poll at the time of the latest one ingested, and a duplicate line
+    write_data(str(tmp_path), [POLLS[2], (2, 'inactive', D(2023, 1, 25, 9)), POLLS[1], POLLS[0],
+                               (2, 'inactive', D(2023, 1, 25, 11)), (1, 'active', D(2023, 1, 25, 12)),
+                               (3, 'inactive', D(2023, 1, 25, 12, 30)), (1, 'active', D(2023, 1, 25, 12))],
+               timezones=[(1, 'UTC'), (2, 'UTC')])
+    # Only the polls from the latest one ingested on that are not stored yet are appended
+    assert append(str(tmp_path)) == 3
+    assert ingested(database) == [
+        (1, ACTIVE, D(2023, 1, 25, 10)), (1, INACTIVE, D(2023, 1, 25, 11)), (1, ACTIVE, D(2023, 1, 25, 12)),
+        (2, ACTIVE, D(2023, 1, 25, 10, 30)), (2, INACTIVE, D(2023, 1, 25, 11)), (3, INACTIVE, D(2023, 1, 25, 12, 30)),
+    ]
+
+    watermark = IngestWatermark.query.filter_by(source='store_status').one()
+    assert watermark.last_timestamp == D(2023, 1, 25, 12, 30)
+    assert watermark.file_offset == os.path.getsize(tmp_path / 'store-status.csv')
+    assert_timeline_current()
+
+    # Nothing new
+    assert append(str(tmp_path)) == 0
+
+
+def test_append_resumes_at_the_ingested_offset(load_data, database, tmp_path):
+    load_data(POLLS, timezones=[(1, 'UTC'), (2, 'UTC')])
+
+    # Lines added to the same file are appended whatever their timestamp, and a partial last line waits
+    with open(tmp_path / 'store-status.csv', 'a') as f:
+        f.write("2,inactive,2023-01-25 09:00:00 UTC\n1,active,2023-01-25 12:00:00 UTC\n3,act")
+    assert append(str(tmp_path)) == 2
+    assert ingested(database) == [
+        (1, ACTIVE, D(2023, 1, 25, 10)), (1, INACTIVE, D(2023, 1, 25, 11)), (1, ACTIVE, D(2023, 1, 25, 12)),
+        (2, INACTIVE, D(2023, 1, 25, 9)), (2, ACTIVE, D(2023, 1, 25, 10, 30)),
+    ]
+    assert_timeline_current()
+
+    with open(tmp_path / 'store-status.csv', 'a') as f:
+        f.write("ive,2023-01-25 12:30:00 UTC\n")
+    assert append(str(tmp_path)) == 1
+    assert ingested(database)[-1] == (3, ACTIVE, D(2023, 1, 25, 12, 30))
+    assert_timeline_current()
+
+
+def test_stores_missing_from_the_menu_hours_lose_them(load_data, database, tmp_path):
+    timezones = [(1, 'UTC'), (2, 'UTC'), (3, 'UTC')]
+    load_data(POLLS, timezones=timezones,
+              menu_hours=[(1, 2, '09:00:00', '17:00:00'), (2, 2, '10:00:00', '12:00:00'), (3, 2, '08:00:00', '09:00:00')])
+    database.session.query(StoreChange).delete()
+    database.session.commit()
+
+    # Store 3 changes its hours and store 2 is no longer listed
+    write_data(str(tmp_path), POLLS, timezones=timezones,
+               menu_hours=[(1, 2, '09:00:00', '17:00:00'), (3, 2, '08:00:00', '10:00:00')])
+    assert csv2DB.add_data_from_csv(str(tmp_path), sources=('menu_hours',), incremental=True) == {'menu_hours': 2}
+
+    hours = database.session.query(MenuHours.store_id, MenuHours.end_time_local).order_by(MenuHours.store_id)
+    assert [(store_id, f"{end:%H:%M}") for store_id, end in hours] == [(1, '17:00'), (3, '10:00')]
+    assert sorted(store_id for store_id, in database.session.query(StoreChange.store_id)) == [2, 3]
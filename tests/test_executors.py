@@ -0,0 +1,89 @@
+import datetime
+import os
+import subprocess
+import sys
+
+import pytest
+
+from app import app, db
+from app.ReportUtils import ReportUtils
+from app.models import ReportChunk, ReportChunkMetrics, ReportEntry, ReportTask
+
+D = datetime.datetime
+# Completed reports older than REPORT_MAX_AGE_HOURS are evicted, so the report is triggered at the current hour
+NOW = D.utcnow().replace(minute=0, second=0, microsecond=0)
+STORES = [1, 2, 3, 4, 5]
+
+
+@pytest.fixture
+def report(load_data, database, monkeypatch):
+    """
+    Loads five stores and adds a running report over them, in chunks of two stores.
+    """
+    monkeypatch.setitem(app.config, 'REPORT_CHUNK_SIZE', 2)
+    load_data([(store_id, 'active' if store_id % 2 else 'inactive', NOW - datetime.timedelta(hours=1))
+               for store_id in STORES],
+              timezones=[(store_id, 'UTC') for store_id in STORES])
+    database.session.add(ReportTask(report_id='report', status="Running", timestamp=NOW))
+    database.session.commit()
+    return ReportUtils.plan_chunks('report', STORES)
+
+
+def entries(database):
+    return sorted(store_id for store_id, in database.session.query(ReportEntry.store_id).filter_by(report_id='report'))
+
+
+def progress(database):
+    report_task = database.session.query(ReportTask).filter_by(report_id='report').one()
+    return report_task.stores_done, report_task.chunks_done
+
+
+def test_stored_chunks_are_skipped(report, database):
+    assert report == [[1, 2], [3, 4], [5]]
+    assert ReportUtils.generate_report_chunk('report', NOW, report[0]) == 2
+
+    def fail(report_id, current_timestamp, store_ids):
+        raise AssertionError("A stored chunk was computed again")
+
+    # Re-running the chunk neither computes nor stores its entries again
+    assert ReportUtils.generate_report_chunk('report', NOW, report[0], compute=fail) == 2
+    assert entries(database) == [1, 2]
+    assert progress(database) == (2, 1)
+    assert database.session.query(ReportChunkMetrics).count() == 1
+
+
+def test_concurrently_stored_chunk(report, database):
+    def compute_while_another_run_stores(report_id, current_timestamp, store_ids):
+        rows = ReportUtils.compute_report_rows(report_id, current_timestamp, store_ids)
+        # Another worker stores the same chunk, with its checkpoint, while this one computes it
+        with db.engine.begin() as connection:
+            connection.execute(ReportEntry.__table__.insert(), rows)
+            connection.execute(ReportChunk.__table__.insert(), {
+                'report_id': report_id, 'first_store_id': min(store_ids), 'stores': len(store_ids)})
+        return rows
+
+    # The checkpoint's unique index rolls this run back, entries and progress included
+    assert ReportUtils.generate_report_chunk('report', NOW, report[1], compute=compute_while_another_run_stores) == 2
+    assert entries(database) == [3, 4]
+    assert progress(database) == (0, 0)
+    assert database.session.query(ReportChunk).count() == 1
+    assert ReportUtils.get_report_status('report') == "Running"
+
+
+def test_resume_from_the_last_stored_chunk(report, database):
+    ReportUtils.generate_report_chunk('report', NOW, report[0])
+    stored_at = database.session.query(ReportChunk.completed_at).scalar()
+    database.session.remove()
+
+    # As if the worker died after the first chunk; the resumed report keeps its chunks of two stores
+    subprocess.run([sys.executable, '-m', 'app.executors', 'report'], check=True, timeout=120,
+                   cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                   env=dict(os.environ, REPORT_WORKERS='2'))
+
+    report_task = database.session.query(ReportTask).filter_by(report_id='report').one()
+    assert report_task.status == "Complete"
+    assert (report_task.stores_done, report_task.chunks_done, report_task.chunks_total) == (5, 3, 3)
+    assert entries(database) == STORES
+    # Only the two missing chunks were computed
+    assert database.session.query(ReportChunkMetrics).count() == 3
+    assert database.session.query(ReportChunk.completed_at).filter_by(first_store_id=1).scalar() == stored_at
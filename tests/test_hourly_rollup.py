@@ -0,0 +1,66 @@
+import csv
+import datetime
+import os
+
+import pytest
+
+from app import csv2DB
+from app.HourlyRollup import HourlyRollup
+from app.UptimeEngine import UptimeEngine
+from app.models import TimeZone
+from benchmarks import synthetic_data
+
+END = datetime.datetime(2023, 1, 25, 18)
+OFFSETS = [datetime.timedelta(minutes=minutes) for minutes in (0, 10, 30, 50, 75)]
+
+
+@pytest.fixture
+def polls(database, tmp_path):
+    """
+    Generates polls up to END + 3h, loads those up to END and returns the others as CSV rows.
+    """
+    synthetic_data.generate(str(tmp_path), stores=40, days=9, poll_minutes=100, end=END + datetime.timedelta(hours=3),
+                            seed=4)
+    path = os.path.join(str(tmp_path), 'store-status.csv')
+    with open(path, newline='') as f:
+        header, *rows = list(csv.reader(f))
+    loaded = [row for row in rows if csv2DB.parse_timestamp(row[2]) <= END]
+    later = [row for row in rows if csv2DB.parse_timestamp(row[2]) > END]
+    with open(path, 'w', newline='') as f:
+        csv.writer(f).writerows([header] + loaded)
+    csv2DB.add_data_from_csv(str(tmp_path))
+    return path, later
+
+
+def store_ids(database):
+    return sorted(store_id for store_id, in database.session.query(TimeZone.store_id))
+
+
+def assert_matches_engine(ids, current_timestamp):
+    expected = UptimeEngine(current_timestamp, ids).load().report_rows('rollup')
+    assert HourlyRollup.report_rows('rollup', current_timestamp, ids) == \
+        [pytest.approx(row, abs=1e-9) for row in expected]
+
+
+def test_rollup_matches_the_engine(polls, database):
+    path, later = polls
+    ids = store_ids(database)
+    latest = csv2DB.latest_poll_timestamp()
+    for offset in OFFSETS:
+        assert HourlyRollup.is_available(latest + offset)
+        assert_matches_engine(ids, latest + offset)
+
+    # The appended polls refresh the rolled-up hours from halfway to each store's previous poll
+    with open(path, 'a', newline='') as f:
+        csv.writer(f).writerows(later)
+    csv2DB.add_data_from_csv(os.path.dirname(path), sources=('store_status',), incremental=True)
+    appended = csv2DB.latest_poll_timestamp()
+    assert appended > latest + OFFSETS[-1]
+    for offset in OFFSETS:
+        assert HourlyRollup.is_available(appended + offset)
+        assert_matches_engine(ids, appended + offset)
+
+    # A report ending before the latest poll cannot use rolled-up hours that account for later polls
+    for offset in OFFSETS:
+        assert not HourlyRollup.is_available(latest + offset + datetime.timedelta(minutes=1))
+        assert_matches_engine(ids, latest + offset + datetime.timedelta(minutes=1))
@@ -0,0 +1,59 @@
+import datetime
+
+import pytest
+
+from app import app
+from app.ReportEntrySink import ReportEntrySink
+from app.ReportUtils import ReportUtils
+from app.models import ReportChunk, ReportEntry, ReportTask
+
+D = datetime.datetime
+NOW = D(2023, 1, 25, 12)
+STORES = [1, 2, 3, 4, 5]
+
+
+@pytest.fixture
+def report(load_data, database, monkeypatch):
+    """
+    Loads five stores and adds a running report over them, inserting its entries two at a time.
+    """
+    monkeypatch.setitem(app.config, 'REPORT_INSERT_BATCH_SIZE', 2)
+    load_data([(store_id, 'active', D(2023, 1, 25, 11)) for store_id in STORES],
+              timezones=[(store_id, 'UTC') for store_id in STORES])
+    database.session.add(ReportTask(report_id='report', status="Running", timestamp=NOW))
+    database.session.commit()
+    return 'report'
+
+
+def test_sink_writes_batches_in_one_transaction(report, database):
+    rows = ReportUtils.compute_report_rows(report, NOW, STORES)
+    with ReportEntrySink() as sink:
+        sink.extend(rows)
+        assert sink.written == 4
+    assert sink.written == 5
+    assert database.session.query(ReportEntry).count() == 5
+
+    with pytest.raises(RuntimeError):
+        with ReportEntrySink() as sink:
+            sink.extend(rows)
+            raise RuntimeError("interrupted")
+    # The flushed batches were rolled back
+    assert database.session.query(ReportEntry).count() == 5
+
+
+def test_failure_mid_chunk_stores_nothing(report, database):
+    def compute_until_the_fourth_store(report_id, current_timestamp, store_ids):
+        for row in ReportUtils.compute_report_rows(report_id, current_timestamp, store_ids):
+            if row['store_id'] == 4:
+                raise RuntimeError("computation failed")
+            yield row
+
+    # The first two entries are flushed before the chunk fails
+    with pytest.raises(RuntimeError, match="computation failed"):
+        ReportUtils.generate_report_chunk(report, NOW, STORES, compute=compute_until_the_fourth_store)
+
+    assert database.session.query(ReportEntry).count() == 0
+    assert database.session.query(ReportChunk).count() == 0
+    report_task = database.session.query(ReportTask).filter_by(report_id=report).one()
+    assert (report_task.status, report_task.stores_done, report_task.chunks_done) == ("Failed", 0, 0)
+    assert report_task.error == "Chunk of 5 stores starting at 1 failed: computation failed"
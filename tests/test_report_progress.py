@@ -0,0 +1,125 @@
+import datetime
+import json
+import threading
+import time
+
+import pytest
+
+import main  # noqa: F401 (registers the API resources)
+from app import app
+from app.ReportUtils import ReportUtils
+from app.models import ReportTask
+
+D = datetime.datetime
+# Completed reports older than REPORT_MAX_AGE_HOURS are evicted, so the report is triggered at the current hour
+NOW = D.utcnow().replace(minute=0, second=0, microsecond=0)
+STORES = [1, 2, 3]
+
+
+@pytest.fixture
+def report(load_data, database, monkeypatch):
+    """
+    Loads three stores and adds a running report over them, one store per chunk.
+    """
+    monkeypatch.setitem(app.config, 'REPORT_CHUNK_SIZE', 1)
+    load_data([(store_id, 'active', NOW - datetime.timedelta(minutes=10)) for store_id in STORES],
+              timezones=[(store_id, 'UTC') for store_id in STORES])
+    database.session.add(ReportTask(report_id='report', status="Running", timestamp=NOW))
+    database.session.commit()
+    return ReportUtils.plan_chunks('report', STORES)
+
+
+def progress(status, stores, **extra):
+    return dict({"report_id": "report", "status": status, "stores_processed": stores, "stores_total": 3,
+                 "chunks_processed": stores, "chunks_total": 3}, **extra)
+
+
+def in_background(*steps):
+    """
+    Runs the steps in another thread, as a worker would, a moment apart.
+    """
+    def run():
+        with app.app_context():
+            for step in steps:
+                time.sleep(0.1)
+                step()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def store_chunk(chunk):
+    return lambda: ReportUtils.generate_report_chunk('report', NOW, chunk)
+
+
+def fail(error):
+    return lambda: ReportUtils.fail_report('report', error)
+
+
+def long_poll(**params):
+    started = time.monotonic()
+    response = app.test_client().get("/report_progress/report", query_string=params)
+    assert response.status_code == 200
+    return response.get_json(), time.monotonic() - started
+
+
+def test_long_poll(report):
+    # A client that does not know the progress yet gets it at once
+    assert long_poll(since=2, wait=30)[0] == progress("Running", 0)
+
+    # Without a change, the response is held for `wait` seconds
+    result, elapsed = long_poll(since=0, wait=0.3)
+    assert result == progress("Running", 0)
+    assert 0.3 <= elapsed < 5
+
+    # A stored chunk answers the held request
+    thread = in_background(store_chunk(report[0]))
+    result, elapsed = long_poll(since=0, wait=30)
+    thread.join()
+    assert result == progress("Running", 1)
+    assert elapsed < 5
+
+    # Final statuses answer at once, whatever `since`
+    fail("Worker lost")()
+    result, elapsed = long_poll(since=0, wait=30)
+    assert result == progress("Failed", 1, error="Worker lost")
+    assert elapsed < 5
+
+
+def test_long_poll_of_an_unknown_report(database):
+    response = app.test_client().get("/report_progress/missing")
+    assert (response.status_code, response.get_json()) == (404, {"error": "Report not found"})
+
+
+def events(report_id="report"):
+    """
+    Reads an event stream to its end, returning the progress events.
+    """
+    response = app.test_client().get(f"/report_progress/{report_id}", headers={"Accept": "text/event-stream"},
+                                     buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    stream = b"".join(response.response).decode()
+    response.close()
+    messages = [message for message in stream.split("\n\n") if message]
+    assert all(message.startswith("event: progress\ndata: ") for message in messages)
+    return [json.loads(message.split("data: ", 1)[1]) for message in messages]
+
+
+def test_event_stream_ends_when_the_report_completes(report):
+    thread = in_background(*[store_chunk(chunk) for chunk in report], lambda: ReportUtils.complete_report('report'))
+    received = events()
+    thread.join()
+    assert received == [progress("Running", stores) for stores in range(4)] + [progress("Complete", 3)]
+
+    # A completed report's stream ends after its progress
+    assert events() == [progress("Complete", 3)]
+
+
+def test_event_stream_ends_when_the_report_fails(report):
+    thread = in_background(store_chunk(report[0]), fail("Chunk of 1 stores starting at 2 failed: timeout"))
+    received = events()
+    thread.join()
+    assert received == [progress("Running", 0), progress("Running", 1),
+                        progress("Failed", 1, error="Chunk of 1 stores starting at 2 failed: timeout")]
@@ -0,0 +1,127 @@
+import datetime
+import gzip
+import os
+
+import pytest
+
+import main  # noqa: F401 (registers the API resources)
+from app import app
+from app.ReportUtils import ReportUtils
+from app.models import ReportTask
+
+D = datetime.datetime
+# Completed reports older than REPORT_MAX_AGE_HOURS are evicted, so the report is triggered at the current hour
+NOW = D.utcnow().replace(minute=0, second=0, microsecond=0)
+STORES = [1, 2, 3]
+
+
+def add_report(database, report_id, complete=True):
+    database.session.add(ReportTask(report_id=report_id, status="Running", timestamp=NOW))
+    database.session.commit()
+    if complete:
+        for chunk in ReportUtils.plan_chunks(report_id, STORES):
+            ReportUtils.generate_report_chunk(report_id, NOW, chunk)
+        ReportUtils.complete_report(report_id)
+    return report_id
+
+
+@pytest.fixture
+def report(load_data, database):
+    """
+    Loads three stores and returns the ID of a completed report over them.
+    """
+    load_data([(store_id, 'active', NOW - datetime.timedelta(minutes=20 * store_id)) for store_id in STORES],
+              timezones=[(store_id, 'UTC') for store_id in STORES])
+    return add_report(database, 'complete')
+
+
+def get(path, **kwargs):
+    return app.test_client().get(path, **kwargs)
+
+
+def test_report_status(report, database):
+    csv_path = os.path.join(app.config['REPORTS_DIR'], f"report_{report}.csv")
+    response = get(f"/get_report/{report}")
+    assert response.status_code == 200
+    assert response.get_json() == {"Status": "Complete", "File Path": csv_path, "Download": f"/get_report/{report}/csv"}
+
+    add_report(database, 'running', complete=False)
+    assert get("/get_report/running").get_json() == {"status": "Running"}
+    assert get("/get_report/running/csv").status_code == 202
+    for path in ("/get_report/missing", "/get_report/missing/csv"):
+        response = get(path)
+        assert (response.status_code, response.get_json()) == (404, {"error": "Report not found"})
+
+
+def test_download_report(report):
+    with open(ReportUtils.report_file_path(report), 'rb') as f:
+        content = f.read()
+    assert content == ReportUtils.generate_report_csv_data(report).encode()
+
+    response = get(f"/get_report/{report}/csv")
+    assert response.status_code == 200
+    assert response.data == content
+    assert response.mimetype == "text/csv"
+    assert "Content-Encoding" not in response.headers
+    etag = response.headers["ETag"]
+
+    # A repeated request for the unchanged file gets no body
+    response = get(f"/get_report/{report}/csv", headers={"If-None-Match": etag})
+    assert (response.status_code, response.data) == (304, b"")
+
+    response = get(f"/get_report/{report}/csv", headers={"Range": "bytes=10-29"})
+    assert response.status_code == 206
+    assert response.data == content[10:30]
+    assert response.headers["Content-Range"] == f"bytes 10-29/{len(content)}"
+
+
+def test_download_gzip_encoded_report(report):
+    with open(ReportUtils.report_file_path(report), 'rb') as f:
+        content = f.read()
+
+    response = get(f"/get_report/{report}/csv", headers={"Accept-Encoding": "gzip, deflate"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert gzip.decompress(response.data) == content
+
+    # Ranges address the CSV file itself
+    response = get(f"/get_report/{report}/csv", headers={"Accept-Encoding": "gzip", "Range": "bytes=0-9"})
+    assert response.status_code == 206
+    assert "Content-Encoding" not in response.headers
+    assert response.data == content[:10]
+
+
+def test_report_formats(report):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    expected = ReportUtils.read_report_table(report)
+    assert expected.column("store_id").to_pylist() == STORES
+
+    response = get(f"/get_report/{report}", query_string={"format": "parquet"})
+    assert (response.status_code, response.mimetype) == (200, "application/vnd.apache.parquet")
+    assert pq.read_table(pa.BufferReader(response.data)).equals(expected)
+
+    response = get(f"/get_report/{report}", query_string={"format": "arrow"})
+    assert (response.status_code, response.mimetype) == (200, "application/vnd.apache.arrow.file")
+    assert pa.ipc.open_file(pa.BufferReader(response.data)).read_all().equals(expected)
+
+    response = get(f"/get_report/{report}", query_string={"format": "csv"})
+    assert response.data == get(f"/get_report/{report}/csv").data
+
+    response = get(f"/get_report/{report}", query_string={"format": "xlsx"})
+    assert (response.status_code, response.get_json()) == (400, {"error": "Unknown format: xlsx"})
+
+
+def test_columnar_formats_without_pyarrow(load_data, database, monkeypatch):
+    monkeypatch.setattr("app.ReportUtils.pa", None)
+    load_data([(1, 'active', NOW)], timezones=[(1, 'UTC')])
+    report_id = add_report(database, 'csv_only')
+    assert not os.path.exists(ReportUtils.report_file_path(report_id, "parquet"))
+
+    for report_format in ("parquet", "arrow"):
+        response = get(f"/get_report/{report_id}", query_string={"format": report_format})
+        assert response.status_code == 400
+        assert response.get_json() == {"error": f"The {report_format} format requires pyarrow"}
+    assert get(f"/get_report/{report_id}", query_string={"format": "csv"}).status_code == 200
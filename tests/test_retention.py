@@ -0,0 +1,101 @@
+import datetime
+import os
+
+import pytest
+
+from app import app, csv2DB, retention
+from app.HourlyRollup import HourlyRollup
+from app.ReportUtils import REPORT_FORMATS, ReportUtils
+from app.UptimeEngine import UptimeEngine
+from app.models import ReportEntry, ReportTask, StoreStatus, StoreStatusInterval, TimeZone
+from benchmarks import synthetic_data
+
+END = datetime.datetime(2023, 1, 25, 18)
+RETENTION = datetime.timedelta(days=7, hours=4)
+
+
+@pytest.fixture
+def stores(database, tmp_path):
+    synthetic_data.generate(str(tmp_path), stores=40, days=10, poll_minutes=100, end=END, seed=5)
+    csv2DB.add_data_from_csv(str(tmp_path))
+    return sorted(store_id for store_id, in database.session.query(TimeZone.store_id))
+
+
+def uptime(store_ids, latest):
+    """
+    Computes everything compaction must leave unchanged: report rows from the raw engine and the rollup,
+    and arbitrary ranges before, across and after the compaction cutoff.
+    """
+    cutoff = latest - RETENTION
+    current = [latest, latest + datetime.timedelta(minutes=40)]
+    ranges = [(cutoff - datetime.timedelta(hours=9), cutoff - datetime.timedelta(hours=1)),
+              (cutoff - datetime.timedelta(hours=5), cutoff + datetime.timedelta(hours=5)),
+              (cutoff + datetime.timedelta(minutes=30), cutoff + datetime.timedelta(hours=3))]
+    return ([UptimeEngine(timestamp, store_ids).load().report_rows('uptime') for timestamp in current],
+            [HourlyRollup.report_rows('uptime', timestamp, store_ids) for timestamp in current],
+            [ReportUtils.stores_uptime(store_ids, start, end) for start, end in ranges])
+
+
+def test_compaction_keeps_uptime(stores, database, timeline_enabled):
+    latest = csv2DB.latest_poll_timestamp()
+    polls = database.session.query(StoreStatus).count()
+    before = uptime(stores, latest)
+
+    summary = retention.run_maintenance(poll_retention=RETENTION)
+    assert summary['compacted_polls'] > 0
+    assert database.session.query(StoreStatus).count() == polls - summary['compacted_polls']
+    assert database.session.query(StoreStatusInterval).count() == summary['runs']
+
+    assert uptime(stores, latest) == before
+    # Compacting again finds nothing left to compact
+    assert retention.run_maintenance(poll_retention=RETENTION)['compacted_polls'] == 0
+    assert uptime(stores, latest) == before
+
+
+def test_poll_retention_covers_the_report_windows(stores):
+    with pytest.raises(ValueError):
+        retention.run_maintenance(poll_retention=datetime.timedelta(days=7))
+
+
+def add_report(database, store_ids, age):
+    report_id = f"report{int(age.total_seconds())}"
+    database.session.add(ReportTask(report_id=report_id, status="Running", timestamp=datetime.datetime.utcnow() - age))
+    database.session.commit()
+    for chunk in ReportUtils.plan_chunks(report_id, store_ids):
+        ReportUtils.generate_report_chunk(report_id, END, chunk)
+    ReportUtils.complete_report(report_id)
+    return report_id
+
+
+def report_files(report_id):
+    paths = [ReportUtils.report_file_path(report_id, report_format) for report_format in REPORT_FORMATS]
+    return sorted(os.path.basename(path) for path in paths + [paths[0] + ".gz"] if os.path.exists(path))
+
+
+@pytest.mark.parametrize('archive', [False, True])
+def test_evicted_reports_lose_their_files(stores, database, tmp_path, monkeypatch, archive):
+    archive_dir = str(tmp_path / 'archive') if archive else None
+    monkeypatch.setitem(app.config, 'REPORT_ARCHIVE_DIR', archive_dir)
+    old = add_report(database, stores, datetime.timedelta(hours=3))
+    recent = add_report(database, stores, datetime.timedelta(0))
+    files = ["arrow", "csv", "csv.gz", "parquet"]
+    assert report_files(old) == [f"report_{old}.{extension}" for extension in files]
+
+    # A file left behind by a report deleted earlier, old enough to be removed
+    orphan = ReportUtils.report_file_path("orphan")
+    with open(orphan, "w") as f:
+        f.write("store_id\n")
+    two_hours_ago = (datetime.datetime.now() - datetime.timedelta(hours=2)).timestamp()
+    os.utime(orphan, (two_hours_ago, two_hours_ago))
+
+    summary = retention.run_maintenance(poll_retention=RETENTION, report_max_age=datetime.timedelta(hours=1))
+    assert summary['evicted_reports'] == 1
+    assert summary['removed_files'] == 1
+    assert not os.path.exists(orphan)
+    assert [report_id for report_id, in database.session.query(ReportTask.report_id)] == [recent]
+    assert database.session.query(ReportEntry).filter_by(report_id=old).count() == 0
+    assert report_files(old) == []
+    assert report_files(recent) == [f"report_{recent}.{extension}" for extension in files]
+    assert database.session.query(ReportEntry).filter_by(report_id=recent).count() == len(stores)
+    if archive:
+        assert os.listdir(archive_dir) == [f"report_{old}.csv.gz"]
@@ -0,0 +1,48 @@
+import datetime
+
+import pytest
+
+from app import csv2DB
+from app.RollingReport import RollingReport
+from app.UptimeEngine import UptimeEngine
+from app.models import ReportEntry, TimeZone
+from benchmarks import synthetic_data
+
+D = datetime.datetime
+# Reports are evicted once they are older than REPORT_MAX_AGE_HOURS, so the polls end at the current hour
+END = D.utcnow().replace(minute=0, second=0, microsecond=0)
+
+
+@pytest.fixture
+def stores(database, tmp_path):
+    synthetic_data.generate(str(tmp_path), stores=60, days=9, poll_minutes=60, end=END, seed=1)
+    csv2DB.add_data_from_csv(str(tmp_path))
+    return sorted(store_id for store_id, in database.session.query(TimeZone.store_id))
+
+
+def entries(report_id):
+    return {row.store_id: row for row in ReportEntry.query.filter_by(report_id=report_id)}
+
+
+def assert_same_rows(rows, expected):
+    assert sorted(row['store_id'] for row in rows) == sorted(row['store_id'] for row in expected)
+    by_store = {row['store_id']: row for row in rows}
+    for row in expected:
+        assert by_store[row['store_id']] == pytest.approx(row, abs=1e-9)
+
+
+def test_carry_forward_equals_a_full_recompute(stores):
+    previous_timestamp, current_timestamp = END + datetime.timedelta(minutes=15), END + datetime.timedelta(minutes=30)
+    previous_id = RollingReport.run(now=previous_timestamp)
+
+    previous = RollingReport.previous_seconds(previous_id, stores)
+    carried = RollingReport.carry_forward('carried', current_timestamp, previous_timestamp, stores, previous)
+    full = UptimeEngine(current_timestamp, stores).load().report_rows('carried')
+    # No store was polled since the previous report, so every one is carried forward
+    assert_same_rows(carried, full)
+
+    report_id = RollingReport.run(now=current_timestamp)
+    columns = [column for column in full[0] if column not in ('report_id', 'store_id')]
+    rows = [dict({column: getattr(entry, column) for column in columns}, report_id='carried', store_id=store_id)
+            for store_id, entry in entries(report_id).items()]
+    assert_same_rows(rows, full)
@@ -0,0 +1,105 @@
+import datetime
+
+import pytest
+
+import main  # noqa: F401 (registers the API resources)
+from app import app, csv2DB
+from app.UptimeEngine import UptimeEngine
+from app.models import TimeZone
+from benchmarks import synthetic_data
+
+D = datetime.datetime
+END = D(2023, 1, 25, 18)
+
+
+@pytest.fixture
+def stores(database, tmp_path):
+    synthetic_data.generate(str(tmp_path), stores=40, days=9, poll_minutes=90, end=END, seed=2)
+    csv2DB.add_data_from_csv(str(tmp_path))
+    return sorted(store_id for store_id, in database.session.query(TimeZone.store_id))
+
+
+@pytest.mark.parametrize('current_timestamp', [END, END - datetime.timedelta(hours=5, minutes=37, seconds=30)])
+def test_store_uptime_matches_the_report(stores, timeline_enabled, current_timestamp):
+    rows = UptimeEngine(current_timestamp, stores).load().report_rows('expected')
+    client = app.test_client()
+    columns = (('uptime_last_hour', 'downtime_last_hour'), ('uptime_last_day', 'downtime_last_day'),
+               ('update_last_week', 'downtime_last_week'))
+    for window, (uptime, downtime) in zip(UptimeEngine.REPORT_WINDOWS, columns):
+        start = current_timestamp - window
+        for row in rows:
+            response = client.get(f"/stores/{row['store_id']}/uptime",
+                                  query_string={'start': start.isoformat(), 'end': current_timestamp.isoformat()})
+            assert response.status_code == 200
+            result = response.get_json()
+            assert result['uptime_hours'] == round(row[uptime], 4)
+            assert result['downtime_hours'] == round(row[downtime], 4)
+
+
+def test_unknown_store(stores):
+    response = app.test_client().get("/stores/1/uptime",
+                                     query_string={'start': '2023-01-25T00:00:00', 'end': '2023-01-25T12:00:00'})
+    assert response.status_code == 404
+
+
+@pytest.fixture
+def polled(load_data):
+    # Store 1 is open 24x7: active until 10:20, inactive until 11:20, then active. Store 2 is open 10:30 to 11:30.
+    polls = [(store_id, status, timestamp) for store_id in (1, 2) for status, timestamp in
+             (('active', D(2023, 1, 25, 10)), ('inactive', D(2023, 1, 25, 10, 40)), ('active', D(2023, 1, 25, 12)))]
+    load_data(polls, timezones=[(1, 'UTC'), (2, 'UTC')], menu_hours=[(2, 2, '10:30:00', '11:30:00')])
+
+
+def uptime(path, **params):
+    return app.test_client().get(path, query_string=params)
+
+
+def test_store_uptime(polled):
+    response = uptime("/stores/1/uptime", start='2023-01-25T10:00:00', end='2023-01-25T12:00:00')
+    assert response.status_code == 200
+    assert response.get_json() == {"store_id": 1, "start": "2023-01-25T10:00:00", "end": "2023-01-25T12:00:00",
+                                   "business_hours": 2.0, "uptime_hours": 1.0, "downtime_hours": 1.0}
+
+    # Offsets are converted to UTC
+    response = uptime("/stores/2/uptime", start='2023-01-25T11:00:00+01:00', end='2023-01-25T12:00:00Z')
+    assert response.get_json() == {"store_id": 2, "start": "2023-01-25T10:00:00", "end": "2023-01-25T12:00:00",
+                                   "business_hours": 1.0, "uptime_hours": 0.1667, "downtime_hours": 0.8333}
+
+
+def test_batch_uptime(polled):
+    expected = [
+        {"store_id": 2, "start": "2023-01-25T11:00:00", "end": "2023-01-25T12:00:00",
+         "business_hours": 0.5, "uptime_hours": 0.1667, "downtime_hours": 0.3333},
+        {"store_id": 1, "start": "2023-01-25T11:00:00", "end": "2023-01-25T12:00:00",
+         "business_hours": 1.0, "uptime_hours": 0.6667, "downtime_hours": 0.3333},
+    ]
+    response = uptime("/stores/uptime", store_ids='2,99,1,2', start='2023-01-25T11:00:00', end='2023-01-25T12:00:00')
+    assert response.status_code == 200
+    assert response.get_json() == {"stores": expected, "not_found": [99]}
+
+    response = app.test_client().post("/stores/uptime", json={
+        "store_ids": [2, 1, 7], "start": "2023-01-25T11:00:00", "end": "2023-01-25T12:00:00"})
+    assert response.get_json() == {"stores": expected, "not_found": [7]}
+
+
+@pytest.mark.parametrize('params, error', [
+    ({'end': '2023-01-25T12:00:00'}, "Missing start"),
+    ({'start': 'yesterday', 'end': '2023-01-25T12:00:00'}, "Invalid start: yesterday"),
+    ({'start': '2023-01-25T12:00:00', 'end': '2023-01-25T12:00:00'}, "end must be after start"),
+    ({'start': '2022-12-25T11:59:59', 'end': '2023-01-25T12:00:00'}, "The range may cover at most 31 days"),
+])
+def test_invalid_range(polled, params, error):
+    for response in (uptime("/stores/1/uptime", **params), uptime("/stores/uptime", store_ids='1', **params)):
+        assert response.status_code == 400
+        assert response.get_json() == {"error": error}
+
+
+@pytest.mark.parametrize('store_ids, error', [
+    ('', "Missing store_ids"),
+    ('1,x', "store_ids must be comma-separated integers"),
+    (','.join(str(store_id) for store_id in range(1, 502)), "At most 500 stores may be queried at once"),
+])
+def test_invalid_batch(polled, store_ids, error):
+    response = uptime("/stores/uptime", store_ids=store_ids, start='2023-01-25T11:00:00', end='2023-01-25T12:00:00')
+    assert response.status_code == 400
+    assert response.get_json() == {"error": error}
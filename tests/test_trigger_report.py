@@ -0,0 +1,98 @@
+import datetime
+import types
+
+import pytest
+
+import main  # noqa: F401 (registers the API resources)
+from app import TriggerReportResource, app, csv2DB
+from app.ReportUtils import ReportUtils
+from app.models import ReportTask
+
+D = datetime.datetime
+NOW = D(2023, 1, 25, 12, 1)
+
+
+class Executor:
+    """
+    Records the submitted reports instead of running them, or raises the given error.
+    """
+
+    def __init__(self, error=None):
+        self.error = error
+        self.submitted = []
+
+    def submit(self, report_id, current_timestamp, stores_info):
+        if self.error is not None:
+            raise self.error
+        self.submitted.append(report_id)
+
+
+@pytest.fixture
+def trigger(load_data, monkeypatch):
+    """
+    Loads two stores and returns a function triggering a report at a given time, on a recording executor.
+    """
+    monkeypatch.setitem(app.config, 'REPORT_FRESHNESS_SECONDS', 300)
+    load_data([(1, 'active', D(2023, 1, 25, 11)), (2, 'inactive', D(2023, 1, 25, 11))],
+              timezones=[(1, 'UTC'), (2, 'UTC')])
+    executor = Executor()
+    monkeypatch.setattr(TriggerReportResource, 'get_executor', lambda: executor)
+
+    def post(now=NOW, **params):
+        frozen = type('FrozenDatetime', (D,), {'utcnow': classmethod(lambda cls: now)})
+        monkeypatch.setattr(TriggerReportResource, 'datetime', types.SimpleNamespace(datetime=frozen))
+        response = app.test_client().post("/trigger_report", query_string=params)
+        return response.status_code, response.get_json()
+
+    post.executor = executor
+    return post
+
+
+def test_triggers_in_the_same_bucket_share_a_report(trigger):
+    status, result = trigger()
+    assert status == 200
+    assert trigger(NOW + datetime.timedelta(minutes=3, seconds=59)) == (200, result)
+    assert trigger.executor.submitted == [result['report_id']]
+
+    # The next freshness bucket starts a new report
+    status, later = trigger(NOW + datetime.timedelta(minutes=4))
+    assert later != result
+    assert trigger.executor.submitted == [result['report_id'], later['report_id']]
+
+
+def test_new_data_starts_a_new_report(trigger, database, tmp_path):
+    _, result = trigger()
+    with open(tmp_path / 'store-status.csv', 'a') as f:
+        f.write("1,inactive,2023-01-25 11:30:00 UTC\n")
+    csv2DB.add_data_from_csv(str(tmp_path), sources=('store_status',), incremental=True)
+
+    _, fresh = trigger()
+    assert fresh != result
+    assert trigger() == (200, fresh)
+
+
+def test_profiled_reports_are_never_reused(trigger, database):
+    _, result = trigger()
+    _, profiled = trigger(profile='true')
+    _, profiled_again = trigger(profile='true')
+    assert len({result['report_id'], profiled['report_id'], profiled_again['report_id']}) == 3
+
+    report_task = database.session.query(ReportTask).filter_by(report_id=profiled['report_id']).one()
+    assert report_task.profile and report_task.fingerprint is None
+    # Profiled reports are not reused by plain triggers either
+    assert trigger() == (200, result)
+
+
+def test_failed_submit_fails_the_report(trigger, database):
+    trigger.executor.error = ConnectionError("broker unavailable")
+    assert trigger() == (500, {"error": "An error occurred"})
+
+    report_task = database.session.query(ReportTask).one()
+    assert (report_task.status, report_task.error, report_task.fingerprint) == ("Failed", "broker unavailable", None)
+    assert ReportUtils.get_report_status(report_task.report_id) == "Failed"
+
+    # The failed report is not reused
+    trigger.executor.error = None
+    status, result = trigger()
+    assert status == 200 and result['report_id'] != report_task.report_id
+    assert trigger.executor.submitted == [result['report_id']]
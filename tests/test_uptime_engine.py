@@ -0,0 +1,75 @@
+import datetime
+
+import pytest
+
+from app.ReportUtils import ReportUtils
+from app.UptimeEngine import UptimeEngine
+from app.models import StoreStatusEnum
+
+D = datetime.datetime
+# A Wednesday
+DAY = datetime.date(2023, 1, 25)
+
+
+def at(hour, minute=0, day=DAY):
+    return D(day.year, day.month, day.day, hour, minute)
+
+
+def hours(minutes):
+    return pytest.approx(minutes / 60, abs=1e-9)
+
+
+def test_status_switches_halfway_between_polls(load_data, timeline_enabled):
+    # Store 1 is open 24x7, store 2 only from 10:30 to 11:30
+    load_data([(1, 'active', at(10)), (1, 'inactive', at(10, 40)), (1, 'active', at(12)),
+               (2, 'active', at(10)), (2, 'inactive', at(10, 40)), (2, 'active', at(12))],
+              timezones=[(1, 'UTC'), (2, 'UTC')], menu_hours=[(2, DAY.weekday(), '10:30:00', '11:30:00')])
+
+    # Active until 10:20, inactive until 11:20, then active again
+    assert ReportUtils.calculate_uptime_downtime(1, at(10), at(12)) == (hours(60), hours(60))
+    assert ReportUtils.calculate_uptime_downtime(1, at(10), at(11)) == (hours(20), hours(40))
+    assert ReportUtils.calculate_uptime_downtime(1, at(11, 20), at(12)) == (hours(40), hours(0))
+    assert ReportUtils.calculate_uptime_downtime(2, at(10), at(12)) == (hours(10), hours(50))
+
+
+def test_polls_before_the_loaded_range(load_data, timeline_enabled):
+    # A six-hour window loads the polls from two hours before it on, here from 02:00
+    load_data([(1, 'inactive', at(0)), (1, 'active', at(10)),
+               (2, 'active', at(23, day=DAY - datetime.timedelta(days=1))),
+               (3, 'active', at(12))],
+              timezones=[(1, 'UTC'), (2, 'UTC'), (3, 'UTC'), (4, 'UTC')])
+
+    results = {row['store_id']: row for row in ReportUtils.stores_uptime([1, 2, 3, 4], at(4), at(10))}
+    # The 00:00 poll holds until halfway to the 10:00 poll
+    assert (results[1]['uptime_hours'], results[1]['downtime_hours']) == (5, 1)
+    # The only poll, the day before, holds through the window
+    assert (results[2]['uptime_hours'], results[2]['downtime_hours']) == (6, 0)
+    # Stores not polled before the end of the window are inactive
+    assert (results[3]['uptime_hours'], results[3]['downtime_hours']) == (0, 6)
+    assert (results[4]['uptime_hours'], results[4]['downtime_hours']) == (0, 6)
+
+
+def test_store_row_of_a_store_outside_the_engine(load_data):
+    load_data([(1, 'active', at(10)), (3, 'inactive', at(10))], timezones=[(1, 'UTC'), (3, 'UTC')])
+    engine = UptimeEngine(at(12), [1, 3]).load()
+
+    assert engine.store_row('report', 3)['downtime_last_hour'] == hours(60)
+    for store_id in (0, 2, 4):
+        with pytest.raises(KeyError):
+            engine.store_row('report', store_id)
+
+
+def test_store_status(load_data, monkeypatch):
+    load_data([(1, 'active', at(10)), (1, 'inactive', at(10, 40)), (1, 'active', at(12))], timezones=[(1, 'UTC')])
+    assert ReportUtils.get_store_status(1, at(10), at(12)) == StoreStatusEnum.ACTIVE
+    assert ReportUtils.get_store_status(1, at(10), at(11)) == StoreStatusEnum.INACTIVE
+
+    def fail(self, schedules=None):
+        raise RuntimeError("database unavailable")
+
+    # Errors reach the caller instead of a None result
+    monkeypatch.setattr(UptimeEngine, 'load', fail)
+    with pytest.raises(RuntimeError, match="database unavailable"):
+        ReportUtils.calculate_uptime_downtime(1, at(10), at(12))
+    with pytest.raises(RuntimeError, match="database unavailable"):
+        ReportUtils.get_store_status(1, at(10), at(12))
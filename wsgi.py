@@ -0,0 +1,3 @@
+# WSGI entry point of the API for production servers: gunicorn -c gunicorn.conf.py wsgi:application
+# Importing it only registers the routes; the schema is upgraded by the gunicorn master (see gunicorn.conf.py).
+from main import app as application